@@ -1,24 +1,101 @@
 import sounddevice as sd
 import soundfile as sf
 import numpy as np
-import winsound
+import os
+import sys
 import time
 import tempfile
-import threading
 import logging
 import queue
 import webrtcvad
+from concurrent.futures import ThreadPoolExecutor
+from metrics import span, observe
+from resampler import Resampler
 
 logger = logging.getLogger("vibeflow")
 
 
+class SpectrumAnalyzer:
+    """Per-chunk band levels for the overlay's waveform bars.
+
+    One windowed real FFT per audio chunk, folded into `bands` log-spaced bands
+    between `low_hz` and `high_hz` and mapped from [floor_db, ceil_db] dBFS to
+    0.0–1.0. Window and band edges are cached per chunk length, so a chunk costs
+    one rfft plus a few vectorized reductions.
+    """
+
+    def __init__(self, sample_rate: int, bands: int = 15, low_hz: float = 100.0, high_hz: float = 7000.0,
+                 floor_db: float = -70.0, ceil_db: float = -20.0):
+        self.sample_rate = sample_rate
+        self.bands = bands
+        self.low_hz = low_hz
+        self.high_hz = min(high_hz, sample_rate / 2)
+        self.floor_db = floor_db
+        self.ceil_db = ceil_db
+        self._plans: dict[int, tuple[np.ndarray, np.ndarray, np.ndarray, float]] = {}
+
+    def _plan(self, n: int):
+        plan = self._plans.get(n)
+        if plan is None:
+            window = np.hanning(n).astype(np.float32)
+            bins = n // 2 + 1
+            freqs = np.geomspace(self.low_hz, self.high_hz, self.bands + 1)
+            edges = np.round(freqs * n / self.sample_rate).astype(int)
+            # Short chunks have coarse bins: give every band at least one bin
+            offsets = np.arange(self.bands + 1)
+            edges = np.minimum(np.maximum.accumulate(edges - offsets) + offsets, bins - 1)
+            widths = np.maximum(np.diff(edges), 1)
+            # Magnitude of a full-scale sine after the window: 0 dBFS
+            full_scale = 32768.0 * window.sum() / 2
+            plan = self._plans[n] = (window, edges, widths, full_scale)
+        return plan
+
+    def levels(self, samples: np.ndarray) -> np.ndarray:
+        """Band levels (float32, 0.0–1.0) of one chunk of int16 samples."""
+        if len(samples) < 2 * self.bands:
+            return np.zeros(self.bands, dtype=np.float32)
+        window, edges, widths, full_scale = self._plan(len(samples))
+        spectrum = np.abs(np.fft.rfft(samples * window)) / full_scale
+        power = np.add.reduceat(spectrum ** 2, edges[:-1])[:self.bands] / widths
+        db = 10.0 * np.log10(power + 1e-12)
+        return np.clip((db - self.floor_db) / (self.ceil_db - self.floor_db), 0.0, 1.0).astype(np.float32)
+
+
+def find_input_device(name: str) -> int | None:
+    """Index of the input device called `name` (case-insensitive; an exact name
+    first, then any name containing it), or None. Digits are taken as an index.
+
+    The same microphone is listed once per host API on Windows (MME, WASAPI...);
+    devices of the default host API are preferred.
+    """
+    if name.isdigit():
+        return int(name)
+    wanted = name.casefold()
+    default_api = sd.default.hostapi
+    inputs = sorted((device["hostapi"] != default_api, index, device["name"].casefold())
+                    for index, device in enumerate(sd.query_devices()) if device["max_input_channels"] > 0)
+    exact = [index for _, index, device in inputs if device == wanted]
+    partial = [index for _, index, device in inputs if wanted in device]
+    return (exact or partial or [None])[0]
+
+
+def list_input_devices() -> list[str]:
+    return [device["name"] for device in sd.query_devices() if device["max_input_channels"] > 0]
+
+
 class AudioManager:
-    def __init__(self):
+    def __init__(self, device: str | None = None, capture_rate: int | None = None):
         # Optimal settings for Whisper
-        self.sample_rate = 16000  # Whisper's native sample rate
+        self.sample_rate = 16000  # Whisper's native sample rate (VAD, WAV and STT)
         self.channels = 1  # Mono for better STT
         self.dtype = 'int16'  # 16-bit PCM
 
+        # Input device (name or index, None = system default) and its capture rate
+        # (None = the device's native rate, resampled here to sample_rate)
+        self.device = device if device is not None else os.getenv("VIBEFLOW_INPUT_DEVICE", "").strip() or None
+        self.capture_rate = capture_rate or int(os.getenv("VIBEFLOW_CAPTURE_RATE", "0")) or None
+        self._opened: tuple | None = None  # (device, rate) of the last stream, to log changes only
+
         # Voice Activity Detection parameters
         self.vad = webrtcvad.Vad(3)  # Aggressiveness from 0 to 3
         
@@ -31,13 +108,31 @@ class AudioManager:
         self.min_duration = 0.3  # Minimum speech duration to be valid
         
         self.audio_queue = queue.Queue()
+        # Band levels for the overlay bars, computed here once per chunk
+        self.spectrum = SpectrumAnalyzer(self.sample_rate)
 
         # External control
         self.stop_callback = None  # Callback to check if user requested stop
 
+        # Beeps play one at a time on a single thread; see play_sound
+        self._sound_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sound")
+        self._sound_pending = None
+
     def play_sound(self, sound_type: str):
-        """Plays a system beep to indicate status."""
+        """Plays a system beep to indicate status, without blocking.
+
+        A beep requested while another one is still waiting to play is dropped,
+        so a burst of events never piles up sounds (or threads). Silent off Windows.
+        """
+        if sys.platform != "win32":
+            return
+        pending = self._sound_pending
+        if pending is not None and not (pending.running() or pending.done()):
+            logger.debug(f"Sound '{sound_type}' dropped: another one is queued")
+            return
+
         def _play():
+            import winsound  # Windows only: keeps this module importable elsewhere
             if sound_type == "start":
                 # High beep for start
                 winsound.Beep(1000, 200)
@@ -52,21 +147,30 @@ class AudioManager:
                 time.sleep(0.05)
                 winsound.Beep(900, 200)
 
-        threading.Thread(target=_play, daemon=True).start()
+        self._sound_pending = self._sound_executor.submit(_play)
 
-    def record_audio(self, stop_callback=None, audio_level_callback=None) -> str | None:
+    def record_audio(self, stop_callback=None, audio_level_callback=None, cancel_token=None,
+                     spectrum_callback=None, silence_duration: float | None = None) -> str | None:
         """Records from the microphone with VAD until silence or manual stop.
 
         Args:
             stop_callback: Optional function that returns True when user wants to stop recording.
             audio_level_callback: Optional function called with the current RMS level (float)
                 for each audio chunk, used to drive the waveform visualiser.
+            spectrum_callback: Optional function called with the band levels of each
+                audio chunk (numpy array, see SpectrumAnalyzer). Must not block.
+            cancel_token: Optional CancellationToken. When cancelled the recording is
+                discarded (checked every chunk, i.e. at least every 100 ms).
+            silence_duration: Seconds of silence after speech that end the recording
+                (default: self.silence_duration).
 
         Returns:
-            Path to a temporary WAV file, or None if no valid speech was captured.
+            Path to a temporary WAV file, or None if no valid speech was captured
+            or the recording was cancelled.
             The caller (STTService) is responsible for deleting the file after use.
         """
         self.stop_callback = stop_callback
+        silence_duration = silence_duration or self.silence_duration
 
         self.play_sound("start")
         logger.info("Listening... waiting for speech")
@@ -93,16 +197,16 @@ class AudioManager:
         tmp_fd, temp_file = tempfile.mkstemp(suffix=".wav", prefix="vibeflow_")
 
         try:
-            stream = sd.InputStream(samplerate=self.sample_rate,
-                                   channels=self.channels,
-                                   dtype=self.dtype,
-                                   callback=audio_callback)
-            
+            stream, resampler = self._open_stream(audio_callback)
+
             with stream:
                 total_duration = 0.0
                 start_time = time.time()
                 
                 while total_duration < self.max_duration:
+                    if cancel_token and cancel_token.cancelled:
+                        break
+
                     # Check if user clicked stop button
                     if self.stop_callback and self.stop_callback():
                         logger.info("Manual stop requested by user")
@@ -114,16 +218,17 @@ class AudioManager:
                     except queue.Empty:
                         continue
                         
-                    recording.append(chunk)
-                    
-                    # Flatten the chunk to 1D and append to buffer
-                    flat_chunk = chunk.flatten()
+                    # Convert to 16 kHz mono and append to buffer
+                    flat_chunk = resampler.process(chunk)
+                    recording.append(flat_chunk)
                     sample_buffer = np.append(sample_buffer, flat_chunk)
 
                     # Update UI waveform if a callback is provided (calculate rough RMS)
                     if audio_level_callback:
                         rms = np.sqrt(np.mean(flat_chunk.astype(float)**2)) if len(flat_chunk) > 0 else 0
                         audio_level_callback(rms)
+                    if spectrum_callback:
+                        spectrum_callback(self.spectrum.levels(flat_chunk))
 
                     # Process buffer in chunks of `frame_size` for WebRTC VAD
                     while len(sample_buffer) >= self.frame_size:
@@ -149,8 +254,10 @@ class AudioManager:
                             # We had speech, now silence
                             silence_duration_counter += (self.frame_duration_ms / 1000.0)
 
-                    if speech_detected and silence_duration_counter >= self.silence_duration:
-                        logger.info(f"Silence detected for {self.silence_duration}s, stopping...")
+                    if speech_detected and silence_duration_counter >= silence_duration:
+                        logger.info(f"Silence detected for {silence_duration}s, stopping...")
+                        # Time spent waiting for the endpoint after the user stopped talking
+                        observe("stage_seconds", silence_duration_counter, stage="endpoint_wait")
                         break
                         
                     total_duration = time.time() - start_time
@@ -158,25 +265,36 @@ class AudioManager:
             # Reset level indicator to zero when recording ends
             if audio_level_callback:
                 audio_level_callback(0.0)
+            if spectrum_callback:
+                spectrum_callback(np.zeros(self.spectrum.bands, dtype=np.float32))
+
+            if cancel_token and cancel_token.cancelled:
+                logger.info("Recording cancelled.")
+                self._discard_temp_file(tmp_fd, temp_file)
+                return None
 
             # Check if we got valid speech
             if not speech_detected:
                 logger.warning("No speech detected.")
+                self._discard_temp_file(tmp_fd, temp_file)
                 return None
 
             if total_duration < self.min_duration:
                 logger.warning("Recording too short.")
+                self._discard_temp_file(tmp_fd, temp_file)
                 return None
 
-            # Combine all chunks
-            audio_data = np.concatenate(recording, axis=0)
+            # Combine all chunks, plus the tail still inside the resampling filter
+            recording.append(resampler.flush())
+            audio_data = np.concatenate(recording)
 
             self.play_sound("processing")
 
             # Write to the temp file (fd is already open – close it first so sf can write)
             import os
             os.close(tmp_fd)
-            sf.write(temp_file, audio_data, self.sample_rate)
+            with span("wav_write"):
+                sf.write(temp_file, audio_data, self.sample_rate)
             logger.info(f"Recorded {total_duration:.1f}s of audio → {temp_file}")
 
             return temp_file
@@ -184,14 +302,47 @@ class AudioManager:
         except Exception as e:
             logger.error(f"Error recording audio: {e}")
             # Clean up temp file on failure
-            try:
-                import os
-                os.close(tmp_fd)
-            except Exception:
-                pass
-            try:
-                import os
-                os.unlink(temp_file)
-            except Exception:
-                pass
+            self._discard_temp_file(tmp_fd, temp_file)
             return None
+
+    def _open_stream(self, callback) -> tuple:
+        """Input stream at the device's native rate, with the Resampler that brings
+        its chunks to sample_rate. Falls back to asking the host API for
+        sample_rate directly when the native rate cannot be opened."""
+        device = self.device
+        if device is not None:
+            index = find_input_device(device)
+            if index is None:
+                logger.warning(f"Input device '{device}' not found, using the default one. "
+                               f"Available: {', '.join(list_input_devices())}")
+            device = index
+        rate = self.capture_rate or int(sd.query_devices(device, "input")["default_samplerate"])
+        try:
+            stream = sd.InputStream(samplerate=rate, device=device, channels=self.channels,
+                                    dtype=self.dtype, callback=callback)
+        except sd.PortAudioError as e:
+            if rate == self.sample_rate:
+                raise
+            logger.warning(f"Could not capture at {rate} Hz ({e}), asking for {self.sample_rate} Hz")
+            rate = self.sample_rate
+            stream = sd.InputStream(samplerate=rate, device=device, channels=self.channels,
+                                    dtype=self.dtype, callback=callback)
+        if self._opened != (device, rate):
+            self._opened = (device, rate)
+            name = sd.query_devices(device, "input")["name"]
+            resampling = f", resampled to {self.sample_rate} Hz" if rate != self.sample_rate else ""
+            logger.info(f"Capturing from '{name}' at {rate} Hz{resampling}")
+        return stream, Resampler(rate, self.sample_rate)
+
+    @staticmethod
+    def _discard_temp_file(tmp_fd: int, temp_file: str) -> None:
+        """Close and delete a temp WAV that will not be handed to STT."""
+        import os
+        try:
+            os.close(tmp_fd)
+        except Exception:
+            pass
+        try:
+            os.unlink(temp_file)
+        except Exception:
+            pass
@@ -0,0 +1,280 @@
+"""End-to-end benchmark: WAV corpus → STTService (CPU) → LLMService (stub) → paste.
+
+Runs headless on a CPU-only box: every clip goes through the real dictation
+pipeline (pipeline.py) with the microphone replaced by the WAV file, the real
+Whisper model on CPU, LLMService talking to the stub OpenAI server, and
+ClipboardManager on the in-memory output backend. Nothing is pasted anywhere.
+
+Corpus layout: a directory of `*.wav` clips (16 kHz mono, Italian), each with
+an optional `<name>.txt` next to it holding the reference transcript for WER.
+
+    python -m benchmarks.e2e --corpus benchmarks/corpus --model small \\
+        --latency 0.3 --token-delay 0.02
+
+Results are written to benchmarks/results/<commit>.json. Pass `--baseline` with
+the JSON of another commit to fail (exit code 1) on regressions beyond the
+thresholds.
+"""
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import soundfile as sf
+from benchmarks.stub_openai_server import StubOpenAIServer
+from metrics import metrics
+from clipboard_manager import ClipboardManager
+from output_backends import MemoryBackend
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+# Summary keys compared against the baseline: key -> "relative" or "absolute" threshold
+COMPARED = {
+    "time_to_paste_p50": "relative",
+    "time_to_paste_p95": "relative",
+    "stt_rtf_p50": "relative",
+    "llm_p50": "relative",
+    "peak_rss_mb": "relative",
+    "wer": "absolute",
+}
+
+
+def normalize(text: str) -> list[str]:
+    """Lowercase words without punctuation, for WER."""
+    return re.sub(r"[^\w\s']", " ", text.lower()).split()
+
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+    """(substitutions + deletions + insertions) / reference words."""
+    ref, hyp = normalize(reference), normalize(hypothesis)
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hyp, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1,
+                               previous[j - 1] + (ref_word != hyp_word)))
+        previous = current
+    return previous[-1] / len(ref)
+
+
+def load_corpus(path: str) -> list[dict]:
+    clips = []
+    for name in sorted(os.listdir(path)):
+        if not name.lower().endswith(".wav"):
+            continue
+        wav = os.path.join(path, name)
+        ref_path = os.path.splitext(wav)[0] + ".txt"
+        reference = None
+        if os.path.exists(ref_path):
+            with open(ref_path, "r", encoding="utf-8") as f:
+                reference = f.read().strip()
+        clips.append({"name": name, "path": wav, "reference": reference,
+                      "duration": sf.info(wav).duration})
+    return clips
+
+
+def peak_rss_mb() -> float | None:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / (1024 if sys.platform == "darwin" else 1)  # bytes on macOS, KiB elsewhere
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+class _ReplayAudio:
+    """Stands in for AudioManager: "records" the next clip by copying it to a temp file
+    (STTService deletes the file it transcribes)."""
+
+    def __init__(self):
+        self.next_clip: str | None = None
+
+    def record_audio(self, stop_callback=None, audio_level_callback=None, cancel_token=None,
+                     spectrum_callback=None, silence_duration=None):
+        tmp_fd, temp_file = tempfile.mkstemp(suffix=".wav", prefix="vibeflow_bench_")
+        os.close(tmp_fd)
+        shutil.copyfile(self.next_clip, temp_file)
+        return temp_file
+
+    def play_sound(self, sound_type: str):
+        pass
+
+
+class _NullIndicator:
+    stop_recording = False
+
+    def show(self):
+        pass
+
+    def hide(self):
+        pass
+
+    def update_status(self, status_text):
+        pass
+
+    def set_audio_level(self, rms):
+        pass
+
+    def set_spectrum(self, levels):
+        pass
+
+
+def _percentile(values: list[float], pct: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100.0 * len(ordered)))]
+
+
+def _series(snapshot: dict, name: str, **labels) -> dict:
+    for entry in snapshot["metrics"].get(name, []):
+        if all(entry["labels"].get(k) == v for k, v in labels.items()):
+            return entry
+    return {}
+
+
+def run(args) -> dict:
+    clips = load_corpus(args.corpus)
+    if not clips:
+        raise SystemExit(f"No .wav clips found in {args.corpus}")
+
+    stub = StubOpenAIServer(latency=args.latency, token_delay=args.token_delay).start()
+    # LLMService reads its configuration from the environment
+    os.environ.pop("LLM_PROVIDERS", None)
+    os.environ.update({"LLM_PROVIDER": "lmstudio", "LLM_BACKEND": args.backend,
+                       "LMSTUDIO_BASE_URL": stub.base_url, "LMSTUDIO_MODEL_ID": "stub-model",
+                       "LLM_KEEPALIVE_INTERVAL": "0"})
+    try:
+        # Imported late so the environment above is in place
+        from stt_service import STTService
+        from llm_service import LLMService
+        from pipeline import DictationPipeline
+
+        stt_service = STTService(model_size=args.model, device="cpu", compute_type=args.compute_type)
+        llm_service = LLMService()
+        llm_service.warm_up()
+
+        audio, output = _ReplayAudio(), MemoryBackend()
+        clipboard = ClipboardManager(output)
+        pipeline = DictationPipeline(audio, stt_service, llm_service, clipboard, _NullIndicator())
+
+        per_clip = []
+        for _ in range(args.repeat):
+            for clip in clips:
+                audio.next_clip = clip["path"]
+                output.pasted_at = None
+                job = pipeline.submit(args.vibe)
+                while pipeline.busy:
+                    time.sleep(0.005)
+                result = {"name": clip["name"], "duration": clip["duration"],
+                          "time_to_paste": (output.pasted_at - job.captured_at)
+                          if output.pasted_at and job.captured_at else None,
+                          "error": job.error}
+                if clip["reference"] is not None:
+                    result["wer"] = word_error_rate(clip["reference"], job.transcript)
+                per_clip.append(result)
+                print(f"{clip['name']:<30} ttp={result['time_to_paste'] or float('nan'):.2f}s "
+                      f"wer={result.get('wer', float('nan')):.3f}", flush=True)
+        pipeline.stop()
+    finally:
+        stub.stop()
+
+    snapshot = metrics.snapshot()
+    ttp = [r["time_to_paste"] for r in per_clip if r["time_to_paste"] is not None]
+    wers = [r["wer"] for r in per_clip if "wer" in r]
+    summary = {
+        "time_to_paste_p50": _percentile(ttp, 50),
+        "time_to_paste_p95": _percentile(ttp, 95),
+        "stt_rtf_p50": _series(snapshot, "stt_real_time_factor").get("p50"),
+        "stt_p50": _series(snapshot, "stage_seconds", stage="stt").get("p50"),
+        "llm_p50": _series(snapshot, "stage_seconds", stage="llm").get("p50"),
+        "paste_p50": _series(snapshot, "stage_seconds", stage="paste").get("p50"),
+        "stt_model_load": _series(snapshot, "stage_seconds", stage="stt_model_load").get("sum"),
+        "wer": sum(wers) / len(wers) if wers else None,
+        "failures": sum(1 for r in per_clip if r["error"]),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    return {
+        "commit": git_commit(),
+        "timestamp": time.time(),
+        "config": {"model": args.model, "compute_type": args.compute_type, "backend": args.backend,
+                   "vibe": args.vibe, "latency": args.latency, "token_delay": args.token_delay,
+                   "repeat": args.repeat, "clips": len(clips)},
+        "summary": summary,
+        "clips": per_clip,
+        "metrics": snapshot["metrics"],
+    }
+
+
+def compare(current: dict, baseline: dict, max_slowdown: float, max_wer_increase: float) -> list[str]:
+    """Return a message for each summary value that regressed beyond its threshold."""
+    if current["config"] != baseline["config"]:
+        print("Warning: baseline was run with a different configuration", file=sys.stderr)
+    regressions = []
+    for key, kind in COMPARED.items():
+        new, old = current["summary"].get(key), baseline["summary"].get(key)
+        if new is None or old is None:
+            continue
+        if kind == "relative" and old > 0 and new > old * (1 + max_slowdown):
+            regressions.append(f"{key}: {old:.3f} -> {new:.3f} (+{(new / old - 1) * 100:.0f}%)")
+        elif kind == "absolute" and new > old + max_wer_increase:
+            regressions.append(f"{key}: {old:.3f} -> {new:.3f}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="End-to-end VibeFlow benchmark (CPU, stub LLM)")
+    parser.add_argument("--corpus", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus"))
+    parser.add_argument("--model", default="small", help="Whisper model size")
+    parser.add_argument("--compute-type", default="int8")
+    parser.add_argument("--backend", default="openai", help="LLM_BACKEND (openai or agno)")
+    parser.add_argument("--vibe", default="confidential")
+    parser.add_argument("--latency", type=float, default=0.3, help="Stub LLM seconds before the first byte")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="Stub LLM seconds between streamed tokens")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--output", help="Result JSON (default: benchmarks/results/<commit>.json)")
+    parser.add_argument("--baseline", help="Result JSON of another commit to compare against")
+    parser.add_argument("--max-slowdown", type=float, default=0.15,
+                        help="Allowed relative increase of latencies, RTF and memory")
+    parser.add_argument("--max-wer-increase", type=float, default=0.02,
+                        help="Allowed absolute increase of the mean WER")
+    args = parser.parse_args()
+
+    results = run(args)
+    output = args.output or os.path.join(RESULTS_DIR, f"{results['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    print(f"\nCommit {results['commit']} -> {output}")
+    for key, value in results["summary"].items():
+        print(f"  {key:<20} {value if value is None else round(value, 4)}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.max_slowdown, args.max_wer_increase)
+        if regressions:
+            print(f"\nRegressions vs {baseline['commit']}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nNo regressions vs {baseline['commit']}")
+
+
+if __name__ == "__main__":
+    main()
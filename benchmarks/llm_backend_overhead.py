@@ -0,0 +1,118 @@
+"""Micro-benchmark: per-call overhead of each LLM backend.
+
+Runs every backend against the zero-latency stub server and compares it with a
+raw httpx POST of the same request, so the difference is pure client overhead
+(SDK, Agno agent machinery, stream parsing).
+
+    python -m benchmarks.llm_backend_overhead --calls 200
+"""
+import time
+import asyncio
+import argparse
+import statistics
+import httpx
+from benchmarks.stub_openai_server import StubOpenAIServer
+from llm_backends import SUPPORTED_BACKENDS, HttpSettings, create_backend
+from prompts import build_system_prefix, build_user_message, chat_messages
+
+SYSTEM_PREFIX = build_system_prefix("Sei un correttore di bozze.", vibe="confidential")
+USER_MESSAGE = build_user_message("ehm ciao allora tipo volevo sapere se ci vediamo domani")
+
+
+def _summary(samples: list[float]) -> dict:
+    ordered = sorted(samples)
+    return {
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "p50_ms": ordered[len(ordered) // 2] * 1000,
+        "p95_ms": ordered[int(len(ordered) * 0.95) - 1] * 1000,
+    }
+
+
+def _time_calls(fn, calls: int) -> list[float]:
+    fn()  # Warm-up: open the connection, build agents
+    samples = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+async def _atime_calls(fn, calls: int) -> list[float]:
+    await fn()
+    samples = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        await fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def run(calls: int) -> dict:
+    stub = StubOpenAIServer().start()
+    results = {}
+    try:
+        # Baseline: raw HTTP request, no SDK
+        payload = {"model": "stub-model", "messages": chat_messages(SYSTEM_PREFIX, USER_MESSAGE),
+                   "max_tokens": 64}
+        with httpx.Client(base_url=stub.base_url) as raw:
+            results["raw-httpx"] = {
+                "complete": _summary(_time_calls(lambda: raw.post("/chat/completions", json=payload), calls))}
+
+        for kind in SUPPORTED_BACKENDS:
+            start = time.perf_counter()
+            try:
+                backend = create_backend(kind, "lmstudio", stub.base_url, "stub", "stub-model",
+                                         http=HttpSettings(max_retries=0))
+            except ImportError as e:
+                print(f"Skipping {kind}: {e}")
+                continue
+            construct = time.perf_counter() - start
+
+            def stream_all():
+                for _ in backend.stream(SYSTEM_PREFIX, USER_MESSAGE, 64):
+                    pass
+
+            async def astream_all():
+                async for _ in backend.astream(SYSTEM_PREFIX, USER_MESSAGE, 64):
+                    pass
+
+            async def async_suite():
+                return {
+                    "acomplete": _summary(await _atime_calls(
+                        lambda: backend.acomplete(SYSTEM_PREFIX, USER_MESSAGE, 64), calls)),
+                    "astream": _summary(await _atime_calls(astream_all, calls)),
+                }
+
+            results[kind] = {
+                "construct_ms": construct * 1000,
+                "complete": _summary(_time_calls(lambda: backend.complete(SYSTEM_PREFIX, USER_MESSAGE, 64), calls)),
+                "stream": _summary(_time_calls(stream_all, calls)),
+                **asyncio.run(async_suite()),
+            }
+            backend.close()
+    finally:
+        stub.stop()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Per-call overhead of the LLM backends")
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+
+    results = run(args.calls)
+    baseline = results["raw-httpx"]["complete"]["mean_ms"]
+    print(f"\n{'backend':<10} {'method':<10} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'overhead':>9}")
+    for kind, methods in results.items():
+        for method, stats in methods.items():
+            if method == "construct_ms":
+                continue
+            print(f"{kind:<10} {method:<10} {stats['mean_ms']:>9.2f} {stats['p50_ms']:>9.2f} "
+                  f"{stats['p95_ms']:>9.2f} {stats['mean_ms'] - baseline:>+9.2f}")
+        if "construct_ms" in methods:
+            print(f"{kind:<10} {'construct':<10} {methods['construct_ms']:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
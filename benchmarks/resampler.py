@@ -0,0 +1,92 @@
+"""CPU cost and quality of the capture resampler (resampler.py).
+
+For each native rate, streams `--seconds` of noise through Resampler in
+chunks of `--chunk-ms` (as the sounddevice callback delivers them) and reports
+milliseconds of CPU per second of audio, i.e. the share of one core spent on
+resampling while recording. Quality is measured with sine tones: gain in the
+speech band and attenuation above 8 kHz, where anything left would alias.
+
+    python -m benchmarks.resampler --rates 44100 48000 96000 --chunk-ms 10 30 100
+
+Results are written to benchmarks/results/resampler-<commit>.json.
+"""
+import os
+import json
+import time
+import argparse
+import numpy as np
+from benchmarks.e2e import RESULTS_DIR, git_commit
+from resampler import Resampler
+
+TARGET_RATE = 16000
+PASSBAND_HZ = (300, 1000, 3400)
+STOPBAND_HZ = (9000, 12000, 20000)
+
+
+def cpu_ms_per_second(rate: int, chunk_ms: float, seconds: float, repeat: int) -> float:
+    """Best CPU time over `repeat` runs, per second of audio."""
+    audio = (np.random.default_rng(0).standard_normal(int(rate * seconds)) * 3000).astype(np.int16)
+    chunk = max(1, int(rate * chunk_ms / 1000))
+    best = float("inf")
+    for _ in range(repeat):
+        resampler = Resampler(rate, TARGET_RATE)
+        start = time.process_time()
+        for i in range(0, len(audio), chunk):
+            resampler.process(audio[i:i + chunk])
+        best = min(best, time.process_time() - start)
+    return best / seconds * 1000
+
+
+def tone_gain_db(rate: int, freq: float) -> float:
+    """Output/input RMS of a sine at `freq`, in dB."""
+    t = np.arange(rate) / rate
+    tone = (10000 * np.sin(2 * np.pi * freq * t)).astype(np.int16)
+    resampler = Resampler(rate, TARGET_RATE)
+    out = np.concatenate([resampler.process(tone), resampler.flush()]).astype(np.float64)
+    margin = TARGET_RATE // 10  # Skip the filter's start-up and tail
+    rms_out = np.sqrt(np.mean(out[margin:-margin] ** 2))
+    rms_in = 10000 / np.sqrt(2)
+    return 20 * np.log10(max(rms_out, 1e-3) / rms_in)
+
+
+def run(args) -> dict:
+    results = {}
+    for rate in args.rates:
+        resampler = Resampler(rate, TARGET_RATE)
+        entry = {
+            "ratio": f"{resampler.up}/{resampler.down}",
+            "taps": resampler.taps,
+            "cpu_ms_per_s": {str(ms): cpu_ms_per_second(rate, ms, args.seconds, args.repeat)
+                             for ms in args.chunk_ms},
+            "passband_db": {str(f): tone_gain_db(rate, f) for f in PASSBAND_HZ},
+            "stopband_db": {str(f): tone_gain_db(rate, f) for f in STOPBAND_HZ if f < rate / 2},
+        }
+        results[str(rate)] = entry
+        cpu = ", ".join(f"{ms} ms chunks {v:.2f}" for ms, v in entry["cpu_ms_per_s"].items())
+        passband = max(abs(v) for v in entry["passband_db"].values())
+        stopband = max(entry["stopband_db"].values(), default=None)
+        print(f"{rate:>6} Hz ({entry['ratio']}, {entry['taps']} taps/phase): CPU ms per s of audio: {cpu}; "
+              f"passband within {passband:.2f} dB"
+              + (f", stopband <= {stopband:.0f} dB" if stopband is not None else ""), flush=True)
+    return {"commit": git_commit(), "timestamp": time.time(), "config": vars(args), "rates": results}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Capture resampler CPU cost and quality")
+    parser.add_argument("--rates", type=int, nargs="+", default=[22050, 32000, 44100, 48000, 96000])
+    parser.add_argument("--chunk-ms", type=float, nargs="+", default=[10, 30, 100])
+    parser.add_argument("--seconds", type=float, default=30, help="Audio per measurement")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="Result JSON (default: benchmarks/results/resampler-<commit>.json)")
+    args = parser.parse_args()
+
+    results = run(args)
+    output = args.output or os.path.join(RESULTS_DIR, f"resampler-{results['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nCommit {results['commit']} -> {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""Soak test: thousands of synthetic dictations, watching for resource leaks.
+
+Drives the real dictation pipeline (pipeline.py) with the clips of a WAV corpus
+replayed as temp files (like a recording), STTService on CPU, LLMService
+talking to the stub OpenAI server, the dictation history in a scratch
+directory and the in-memory output backend. Some dictations are cancelled in flight
+and some "record" nothing, so the failure paths run as often as the happy one.
+
+Every `--sample-every` dictations it samples threads, open file descriptors
+(handles on Windows), temp files and RSS. Growth is measured from the first
+sample after `--warmup` dictations to the last one; beyond the thresholds the
+exit code is 1.
+
+    python -m benchmarks.soak --corpus benchmarks/corpus --dictations 2000 --model tiny
+
+`--stub-stt` replaces Whisper with the clips' reference transcripts, for long
+runs focused on the pipeline itself. Results are written to
+benchmarks/results/soak-<commit>.json.
+"""
+import os
+import gc
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+from collections import Counter
+from benchmarks.e2e import RESULTS_DIR, load_corpus, git_commit, _ReplayAudio, _NullIndicator
+from benchmarks.stub_openai_server import StubOpenAIServer
+from clipboard_manager import ClipboardManager
+from output_backends import MemoryBackend
+
+try:
+    import psutil  # Optional: handle count on Windows, RSS everywhere
+except ImportError:
+    psutil = None
+
+# Sampled value -> threshold option
+THRESHOLDS = {
+    "threads": "max_thread_growth",
+    "fds": "max_fd_growth",
+    "temp_files": "max_temp_growth",
+    "rss_mb": "max_rss_growth",
+}
+
+
+def open_handles() -> int | None:
+    """Open file descriptors of this process (handles on Windows)."""
+    if psutil is not None:
+        process = psutil.Process()
+        return process.num_handles() if sys.platform == "win32" else process.num_fds()
+    for fd_dir in ("/proc/self/fd", "/dev/fd"):
+        if os.path.isdir(fd_dir):
+            return len(os.listdir(fd_dir))
+    return None
+
+
+def rss_mb() -> float | None:
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 1024 / 1024
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def sample(done: int, scratch: str) -> dict:
+    gc.collect()
+    return {
+        "dictations": done,
+        "threads": threading.active_count(),
+        "fds": open_handles(),
+        "temp_files": sum(len(files) for _, _, files in os.walk(scratch)),
+        "rss_mb": rss_mb(),
+    }
+
+
+def _slope_per_1000(samples: list[dict], key: str) -> float | None:
+    """Least-squares growth of `key` per 1000 dictations."""
+    points = [(s["dictations"], s[key]) for s in samples if s[key] is not None]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    var = sum((x - mean_x) ** 2 for x, _ in points)
+    if var == 0:
+        return None
+    return 1000 * sum((x - mean_x) * (y - mean_y) for x, y in points) / var
+
+
+class _SoakAudio(_ReplayAudio):
+    """_ReplayAudio that can also "record" nothing (no speech, like AudioManager)."""
+
+    def __init__(self):
+        super().__init__()
+        self.silent = False
+
+    def record_audio(self, stop_callback=None, audio_level_callback=None, cancel_token=None,
+                     spectrum_callback=None, silence_duration=None):
+        if self.silent:
+            return None
+        return super().record_audio(stop_callback, audio_level_callback, cancel_token, spectrum_callback)
+
+
+class _StubSTT:
+    """Returns the clip's reference transcript and deletes the file, like STTService.
+
+    Clips are told apart by file size, so the stub keeps no per-dictation state.
+    """
+
+    def __init__(self, clips: list[dict]):
+        self.references = {os.path.getsize(clip["path"]): clip["reference"] for clip in clips}
+
+    def transcribe(self, audio_file: str, cancel_token=None, beam_size=None, model=None) -> str:
+        size = os.path.getsize(audio_file)
+        os.remove(audio_file)
+        return self.references.get(size) or "prova di dettatura sintetica"
+
+
+def run(args) -> dict:
+    clips = load_corpus(args.corpus)
+    if not clips:
+        raise SystemExit(f"No .wav clips found in {args.corpus}")
+
+    # Everything this run writes goes under `scratch`, so temp files can be counted
+    scratch = tempfile.mkdtemp(prefix="vibeflow_soak_")
+    tempfile.tempdir = scratch
+    stub = StubOpenAIServer(latency=args.latency, token_delay=args.token_delay).start()
+    os.environ.pop("LLM_PROVIDERS", None)
+    os.environ.update({"LLM_PROVIDER": "lmstudio", "LMSTUDIO_BASE_URL": stub.base_url,
+                       "LMSTUDIO_MODEL_ID": "stub-model", "LLM_KEEPALIVE_INTERVAL": "0"})
+    # Rejected presses and failed dictations are expected here: keep the output readable
+    if args.verbose:
+        from log_setup import setup_logging
+        setup_logging(os.path.join(scratch, "vibeflow.log"))
+    else:
+        logging.getLogger("vibeflow").setLevel(logging.ERROR)
+    counts = Counter()
+    samples = []
+    try:
+        # Imported late so the environment above is in place
+        from llm_service import LLMService
+        from pipeline import DictationPipeline
+        from history import DictationHistory
+
+        audio = _SoakAudio()
+        if args.stub_stt:
+            stt_service = _StubSTT(clips)
+        else:
+            from stt_service import STTService
+            stt_service = STTService(model_size=args.model, device="cpu", compute_type=args.compute_type)
+        llm_service = LLMService()
+        llm_service.warm_up()
+        history = DictationHistory(os.path.join(scratch, "history.db"), audio_format=args.history_audio,
+                                   audio_dir=os.path.join(scratch, "history_audio"),
+                                   max_entries=args.history_entries)
+
+        pipeline = DictationPipeline(audio, stt_service, llm_service, ClipboardManager(MemoryBackend()),
+                                     _NullIndicator(), history=history, profiles=llm_service.profiles)
+        jobs = []
+        baseline_threads = None
+        start = time.perf_counter()
+        for n in range(1, args.dictations + 1):
+            clip = clips[n % len(clips)]
+            audio.next_clip = clip["path"]
+            audio.silent = args.silent_every > 0 and n % args.silent_every == 0
+            job = pipeline.submit(args.vibe)
+            if job is None:
+                counts["rejected"] += 1
+            while job is None:  # Pipeline full: wait like a user would
+                time.sleep(0.002)
+                job = pipeline.submit(args.vibe)
+            if args.cancel_every > 0 and n % args.cancel_every == 0:
+                pipeline.cancel_latest()
+            jobs.append(job)
+
+            if n % args.sample_every == 0 or n == args.dictations:
+                while pipeline.busy:
+                    time.sleep(0.005)
+                history.flush()
+                for done in jobs:
+                    counts["cancelled" if done.token.cancelled else "failed" if done.error else "pasted"] += 1
+                jobs.clear()
+                samples.append(sample(n, scratch))
+                if n >= args.warmup and baseline_threads is None:
+                    baseline_threads = Counter(t.name.rstrip("0123456789_") for t in threading.enumerate())
+                last = samples[-1]
+                print(f"{n:>6} dictations  threads={last['threads']} fds={last['fds']} "
+                      f"temp={last['temp_files']} rss={last['rss_mb'] or float('nan'):.1f}MB", flush=True)
+        elapsed = time.perf_counter() - start
+        final_threads = Counter(t.name.rstrip("0123456789_") for t in threading.enumerate())
+        pipeline.stop()
+        history.close()
+    finally:
+        stub.stop()
+        tempfile.tempdir = None
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    steady = [s for s in samples if s["dictations"] >= args.warmup] or samples
+    growth = {}
+    for key in THRESHOLDS:
+        first, last = steady[0][key], steady[-1][key]
+        growth[key] = {
+            "start": first,
+            "end": last,
+            "max": max((s[key] for s in steady if s[key] is not None), default=None),
+            "growth": None if first is None or last is None else last - first,
+            "per_1000": _slope_per_1000(steady, key),
+        }
+    return {
+        "commit": git_commit(),
+        "timestamp": time.time(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output",)},
+        "dictations": args.dictations,
+        "seconds": elapsed,
+        "dictations_per_second": args.dictations / elapsed if elapsed else None,
+        "counts": dict(counts),
+        "growth": growth,
+        "new_threads": dict(final_threads - (baseline_threads or Counter())),
+        "samples": samples,
+    }
+
+
+def _fmt(value) -> str:
+    return f"{value:.1f}" if isinstance(value, float) else str(value)
+
+
+def check(results: dict, args) -> list[str]:
+    """A message for each resource that grew beyond its threshold."""
+    leaks = []
+    for key, option in THRESHOLDS.items():
+        growth = results["growth"][key]["growth"]
+        if growth is not None and growth > getattr(args, option):
+            leaks.append(f"{key}: {_fmt(results['growth'][key]['start'])} -> {_fmt(results['growth'][key]['end'])} "
+                         f"(+{growth:.1f}, limit {getattr(args, option)})")
+    return leaks
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="VibeFlow soak test (resource growth over many dictations)")
+    parser.add_argument("--corpus", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus"))
+    parser.add_argument("--dictations", type=int, default=2000)
+    parser.add_argument("--model", default="tiny", help="Whisper model size")
+    parser.add_argument("--compute-type", default="int8")
+    parser.add_argument("--stub-stt", action="store_true", help="Skip Whisper: use the reference transcripts")
+    parser.add_argument("--vibe", default="confidential")
+    parser.add_argument("--latency", type=float, default=0.0, help="Stub LLM seconds before the first byte")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="Stub LLM seconds between streamed tokens")
+    parser.add_argument("--cancel-every", type=int, default=10, help="Cancel every Nth dictation (0 = never)")
+    parser.add_argument("--silent-every", type=int, default=15,
+                        help="Every Nth dictation records nothing (0 = never)")
+    parser.add_argument("--history-audio", default="off", help="Audio kept by the history: off, flac or opus")
+    parser.add_argument("--history-entries", type=int, default=500)
+    parser.add_argument("--sample-every", type=int, default=100)
+    parser.add_argument("--warmup", type=int, default=100, help="Dictations before the growth baseline")
+    parser.add_argument("--max-thread-growth", type=float, default=0)
+    parser.add_argument("--max-fd-growth", type=float, default=2)
+    parser.add_argument("--max-temp-growth", type=float, default=0)
+    parser.add_argument("--max-rss-growth", type=float, default=30, help="MB")
+    parser.add_argument("--verbose", action="store_true", help="Print the pipeline log (INFO)")
+    parser.add_argument("--output", help="Result JSON (default: benchmarks/results/soak-<commit>.json)")
+    args = parser.parse_args()
+
+    results = run(args)
+    output = args.output or os.path.join(RESULTS_DIR, f"soak-{results['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    print(f"\nCommit {results['commit']} -> {output}")
+    print(f"  {results['dictations']} dictations in {results['seconds']:.0f}s "
+          f"({results['dictations_per_second']:.1f}/s): {results['counts']}")
+    for key, growth in results["growth"].items():
+        per_1000 = growth["per_1000"]
+        start, end, peak = (_fmt(growth[k]) for k in ("start", "end", "max"))
+        print(f"  {key:<11} {start} -> {end} (max {peak}, "
+              f"{'n/a' if per_1000 is None else f'{per_1000:+.2f}'} per 1000 dictations)")
+    if results["new_threads"]:
+        print(f"  new threads: {results['new_threads']}")
+
+    leaks = check(results, args)
+    if leaks:
+        print("\nResource growth beyond the limits:")
+        for line in leaks:
+            print(f"  {line}")
+        sys.exit(1)
+    print("\nNo resource growth beyond the limits")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Minimal OpenAI-compatible server for benchmarks.
+
+Serves /v1/models and /v1/chat/completions (plain and streamed) with a
+configurable response latency and per-token delay, so LLMService can be
+measured without LM Studio or DeepSeek.
+
+Run standalone:
+    python -m benchmarks.stub_openai_server --port 1234 --latency 0.3 --token-delay 0.01
+"""
+import json
+import time
+import socket
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+def echo_transcript(messages: list[dict]) -> str:
+    """Default reply: the transcript after the last "TESTO:" marker, unchanged."""
+    content = messages[-1]["content"] if messages else ""
+    marker = content.rfind("TESTO:\n")
+    return content[marker + len("TESTO:\n"):] if marker >= 0 else content
+
+
+class StubOpenAIServer:
+    """OpenAI-compatible stub running in a background thread.
+
+    Args:
+        latency: seconds to wait before the first byte of every completion.
+        token_delay: seconds between streamed tokens (words).
+        reply: function(messages) -> str producing the completion text.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                 token_delay: float = 0.0, reply=echo_transcript):
+        self.latency = latency
+        self.token_delay = token_delay
+        self.reply = reply
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                # Headers and body are written separately: without NODELAY, Nagle +
+                # delayed ACK add ~40 ms to every non-streamed response
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, payload: dict) -> None:
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_event(self, payload) -> None:
+                data = ("data: " + (payload if isinstance(payload, str) else json.dumps(payload)) + "\n\n").encode()
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+
+            def do_GET(self):
+                self._send_json({"object": "list", "data": [
+                    {"id": "stub-model", "object": "model", "created": 0, "owned_by": "stub"}]})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                server.requests += 1
+                messages = request.get("messages", [])
+                text = server.reply(messages)
+                words = text.split(" ")
+                max_tokens = request.get("max_tokens") or len(words)
+                finish = "length" if len(words) > max_tokens else "stop"
+                words = words[:max_tokens]
+                prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4
+                usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(words),
+                         "total_tokens": prompt_tokens + len(words),
+                         "prompt_tokens_details": {"cached_tokens": 0}}
+                if server.latency:
+                    time.sleep(server.latency)
+
+                if not request.get("stream"):
+                    if server.token_delay:
+                        time.sleep(server.token_delay * len(words))
+                    self._send_json({
+                        "id": "stub", "object": "chat.completion", "created": 0, "model": request.get("model"),
+                        "choices": [{"index": 0, "finish_reason": finish,
+                                     "message": {"role": "assistant", "content": " ".join(words)}}],
+                        "usage": usage,
+                    })
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    for i, word in enumerate(words):
+                        self._send_event({
+                            "id": "stub", "object": "chat.completion.chunk", "created": 0,
+                            "model": request.get("model"),
+                            "choices": [{"index": 0, "finish_reason": None,
+                                         "delta": {"content": word if i == 0 else " " + word}}],
+                        })
+                        if server.token_delay:
+                            time.sleep(server.token_delay)
+                    self._send_event({
+                        "id": "stub", "object": "chat.completion.chunk", "created": 0,
+                        "model": request.get("model"),
+                        "choices": [{"index": 0, "finish_reason": finish, "delta": {}}],
+                        "usage": usage if request.get("stream_options", {}).get("include_usage") else None,
+                    })
+                    self._send_event("[DONE]")
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # Client closed the stream early (early stop / cancellation)
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "StubOpenAIServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="stub-openai", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1234)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before the first byte")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="Seconds between streamed tokens")
+    args = parser.parse_args()
+    stub = StubOpenAIServer(args.host, args.port, args.latency, args.token_delay).start()
+    print(f"Stub OpenAI server on {stub.base_url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stub.stop()
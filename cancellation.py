@@ -0,0 +1,54 @@
+import threading
+import logging
+
+logger = logging.getLogger("vibeflow")
+
+
+class PipelineCancelled(Exception):
+    """Raised by a pipeline stage when its cancellation token has been triggered."""
+
+
+class CancellationToken:
+    """Cooperative cancellation flag shared by the stages of one dictation.
+
+    Stages poll `cancelled` (or call `raise_if_cancelled()`) at safe points:
+    between audio chunks, between Whisper segments, between streamed LLM tokens.
+    Callbacks registered with `on_cancel()` run once, on the cancelling thread.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self) -> None:
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.debug(f"Cancellation callback failed: {e}")
+
+    def on_cancel(self, callback) -> None:
+        """Run `callback` when the token is cancelled (immediately if it already is)."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def raise_if_cancelled(self) -> None:
+        if self._event.is_set():
+            raise PipelineCancelled()
+
+    def wait(self, timeout: float) -> bool:
+        """Sleep up to `timeout` seconds; returns True early if cancelled."""
+        return self._event.wait(timeout)
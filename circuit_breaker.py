@@ -0,0 +1,73 @@
+import time
+import threading
+import logging
+
+logger = logging.getLogger("vibeflow")
+
+
+class CircuitBreaker:
+    """Per-backend circuit breaker.
+
+    CLOSED: requests flow normally; consecutive failures are counted.
+    OPEN: after `failure_threshold` consecutive failures the backend is skipped
+          for `reset_timeout` seconds.
+    HALF_OPEN: once the timeout expires a single trial request is let through;
+               success closes the circuit, failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 3, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        """Return True if a request may be sent to this backend right now."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+                logger.info(f"Circuit breaker '{self.name}' half-open: sending a trial request")
+            # HALF_OPEN: only one trial request at a time
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info(f"Circuit breaker '{self.name}' closed")
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(
+                        f"Circuit breaker '{self.name}' open after {self.failures} failure(s); "
+                        f"skipping it for {self.reset_timeout:.0f}s"
+                    )
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """Give back a half-open trial slot whose request was cancelled (no verdict)."""
+        with self._lock:
+            self._trial_in_flight = False
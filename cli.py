@@ -0,0 +1,234 @@
+"""Headless VibeFlow: run STT + rewrite without hotkeys, overlay or clipboard.
+
+Inputs:
+    python cli.py memo.wav                      # one file
+    python cli.py recordings/ --vibe formal     # every .wav in a directory
+    arecord -f S16_LE -r 16000 -c 1 | python cli.py --stdin-pcm
+                                                # raw PCM stream, split at pauses
+    python cli.py --serve                       # long-running: one request per stdin line
+
+Results go to stdout (final text, or one JSON object per line with --format jsonl)
+or to --output. Logs go to stderr and vibeflow.log. Models are loaded once and
+reused for every input.
+"""
+import os
+import sys
+import json
+import time
+import queue
+import shutil
+import argparse
+import tempfile
+import threading
+from dotenv import load_dotenv
+from log_setup import setup_logging
+
+load_dotenv()
+logger = setup_logging()
+
+from stt_service import STTService
+
+# WebRTC VAD accepts 10/20/30 ms frames of 16-bit mono PCM at these rates
+VAD_FRAME_MS = 30
+VAD_RATES = (8000, 16000, 32000, 48000)
+
+
+class HeadlessVibeFlow:
+    """STTService + LLMService behind a plain function call."""
+
+    def __init__(self, model_size: str, device: str, compute_type: str | None, skip_llm: bool):
+        if compute_type is None:
+            compute_type = "float16" if device == "cuda" else "int8"
+        self.stt_service = STTService(model_size=model_size, device=device, compute_type=compute_type)
+        self.llm_service = None
+        if not skip_llm:
+            from llm_service import LLMService
+            self.llm_service = LLMService()
+            threading.Thread(target=self.llm_service.warm_up, name="llm-warmup", daemon=True).start()
+        # Per-profile STT settings (beam size, model) come with the LLM profiles
+        self.profiles = self.llm_service.profiles if self.llm_service else {}
+
+    def process_file(self, path: str, vibe: str) -> dict:
+        """Transcribe and rewrite `path` (left untouched: STT works on a copy)."""
+        tmp_fd, temp_file = tempfile.mkstemp(suffix=".wav", prefix="vibeflow_cli_")
+        os.close(tmp_fd)
+        try:
+            shutil.copyfile(path, temp_file)
+        except OSError:
+            os.remove(temp_file)
+            raise
+        return self._process(temp_file, vibe, source=path)
+
+    def process_pcm(self, pcm: bytes, sample_rate: int, vibe: str, source: str) -> dict:
+        import numpy as np
+        import soundfile as sf
+        tmp_fd, temp_file = tempfile.mkstemp(suffix=".wav", prefix="vibeflow_cli_")
+        os.close(tmp_fd)
+        sf.write(temp_file, np.frombuffer(pcm, dtype=np.int16), sample_rate)
+        return self._process(temp_file, vibe, source=source)
+
+    def _process(self, temp_file: str, vibe: str, source: str) -> dict:
+        start = time.perf_counter()
+        profile = self.profiles.get(vibe)
+        # Deletes temp_file
+        transcript = self.stt_service.transcribe(temp_file, **(profile.stt_options() if profile else {}))
+        stt_seconds = time.perf_counter() - start
+        text = transcript
+        llm_seconds = 0.0
+        if transcript and self.llm_service:
+            start = time.perf_counter()
+            text = self.llm_service.rewrite_text(transcript, vibe)
+            llm_seconds = time.perf_counter() - start
+        return {"input": source, "vibe": vibe if self.llm_service else None, "transcript": transcript,
+                "text": text, "stt_seconds": round(stt_seconds, 3), "llm_seconds": round(llm_seconds, 3)}
+
+
+class ResultWriter:
+    def __init__(self, fmt: str, output: str | None):
+        self.fmt = fmt
+        self.stream = open(output, "a", encoding="utf-8") if output else sys.stdout
+
+    def write(self, result: dict) -> None:
+        if self.fmt == "jsonl":
+            self.stream.write(json.dumps(result, ensure_ascii=False) + "\n")
+        else:
+            self.stream.write((result["text"] or "") + "\n")
+        self.stream.flush()
+
+    def write_error(self, source: str, error: Exception) -> None:
+        """Record a failed input (JSONL only: plain text output has no place for it)."""
+        if self.fmt == "jsonl":
+            self.write({"input": source, "error": str(error), "text": None})
+
+    def close(self) -> None:
+        if self.stream is not sys.stdout:
+            self.stream.close()
+
+
+def iter_wav_files(paths: list[str]):
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.lower().endswith(".wav"):
+                    yield os.path.join(path, name)
+        else:
+            yield path
+
+
+def process_files(app: HeadlessVibeFlow, writer: ResultWriter, paths: list[str], vibe: str) -> None:
+    """Process every WAV in `paths`; one missing or undecodable file does not stop the others."""
+    for path in iter_wav_files(paths):
+        try:
+            writer.write(app.process_file(path, vibe))
+        except Exception as e:
+            logger.error(f"{path} failed: {e}")
+            writer.write_error(path, e)
+
+
+def split_pcm_stream(stream, sample_rate: int, pause: float, max_seconds: float):
+    """Yield utterances (raw PCM bytes) from a 16-bit mono stream, cut at `pause`
+    seconds of silence after speech (same WebRTC VAD as the microphone path)."""
+    import webrtcvad
+    vad = webrtcvad.Vad(3)
+    frame_bytes = int(sample_rate * VAD_FRAME_MS / 1000) * 2
+    max_bytes = int(max_seconds * sample_rate) * 2
+    utterance = bytearray()
+    speech = False
+    silence = 0.0
+    while True:
+        frame = stream.read(frame_bytes)
+        if len(frame) < frame_bytes:
+            break
+        if vad.is_speech(frame, sample_rate):
+            speech = True
+            silence = 0.0
+        elif speech:
+            silence += VAD_FRAME_MS / 1000.0
+        if speech:
+            utterance += frame
+        if speech and (silence >= pause or len(utterance) >= max_bytes):
+            yield bytes(utterance)
+            utterance.clear()
+            speech = False
+            silence = 0.0
+    if speech and utterance:
+        yield bytes(utterance)
+
+
+def run_stdin_pcm(app: HeadlessVibeFlow, writer: ResultWriter, args) -> None:
+    # Reading and processing run on different threads so a slow rewrite never
+    # stalls the pipe (and the recorder feeding it)
+    utterances: queue.Queue = queue.Queue()
+
+    def reader():
+        for pcm in split_pcm_stream(sys.stdin.buffer, args.rate, args.pause, args.max_seconds):
+            utterances.put(pcm)
+        utterances.put(None)
+
+    threading.Thread(target=reader, name="pcm-reader", daemon=True).start()
+    index = 0
+    while (pcm := utterances.get()) is not None:
+        index += 1
+        writer.write(app.process_pcm(pcm, args.rate, args.vibe, source=f"stdin#{index}"))
+
+
+def run_serve(app: HeadlessVibeFlow, writer: ResultWriter, args) -> None:
+    """One request per stdin line: a WAV path, or {"path": ..., "vibe": ...}."""
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            request = json.loads(line) if line.startswith("{") else {"path": line}
+            process_files(app, writer, [request["path"]], request.get("vibe", args.vibe))
+        except Exception as e:
+            logger.error(f"Request failed ({line}): {e}")
+            writer.write_error(line, e)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Headless VibeFlow (STT + rewrite)")
+    parser.add_argument("inputs", nargs="*", help="WAV files or directories of WAV files")
+    parser.add_argument("--vibe", help="Profile from profiles.json (default: the first one)")
+    parser.add_argument("--stdin-pcm", action="store_true",
+                        help="Read raw 16-bit mono PCM from stdin, split at pauses")
+    parser.add_argument("--serve", action="store_true",
+                        help="Keep models loaded and process one request per stdin line")
+    parser.add_argument("--rate", type=int, default=16000, choices=VAD_RATES,
+                        help="Sample rate of --stdin-pcm (one the VAD supports)")
+    parser.add_argument("--pause", type=float, default=1.0, help="Silence (s) that ends an utterance")
+    parser.add_argument("--max-seconds", type=float, default=60.0, help="Longest utterance (s)")
+    parser.add_argument("--no-llm", action="store_true", help="Transcribe only")
+    parser.add_argument("--model", default="medium", help="Whisper model size")
+    parser.add_argument("--device", default="cuda", help="cuda or cpu")
+    parser.add_argument("--compute-type", help="Default: float16 on cuda, int8 on cpu")
+    parser.add_argument("--format", choices=("text", "jsonl"), default="text")
+    parser.add_argument("--output", help="Append results to this file instead of stdout")
+    args = parser.parse_args()
+
+    modes = bool(args.inputs) + args.stdin_pcm + args.serve
+    if modes != 1:
+        parser.error("give input files/directories, --stdin-pcm or --serve (exactly one)")
+
+    app = HeadlessVibeFlow(args.model, args.device, args.compute_type, args.no_llm)
+    if app.llm_service and args.vibe is None:
+        args.vibe = app.llm_service.default_profile
+    if app.llm_service and args.vibe not in app.llm_service.PROFILES:
+        parser.error(f"unknown vibe '{args.vibe}'. Available: {', '.join(app.llm_service.PROFILES)}")
+
+    writer = ResultWriter(args.format, args.output)
+    try:
+        if args.stdin_pcm:
+            run_stdin_pcm(app, writer, args)
+        elif args.serve:
+            run_serve(app, writer, args)
+        else:
+            process_files(app, writer, args.inputs, args.vibe)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        writer.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,66 +1,124 @@
-import pyperclip
+import os
+import math
 import time
 import threading
 import logging
-import win32clipboard
-import win32con
+from concurrent.futures import ThreadPoolExecutor
+from metrics import observe, span
+from output_backends import OutputBackend, create_output_backend
 
 logger = logging.getLogger("vibeflow")
 
 
 class ClipboardManager:
-    def __init__(self):
-        pass
+    """Pastes text into the focused application through an output backend
+    (output_backends.py), then puts back what the user had on the clipboard.
+
+    Nothing waits a fixed time when the backend can confirm things: the paste
+    keystroke goes out once the clipboard is ours, and the original text comes
+    back as soon as the application has read the dictation. Backends that
+    cannot confirm the paste fall back to `restore_delay`.
+    """
+
+    def __init__(self, backend: OutputBackend | None = None, paste_timeout: float = 1.0,
+                 restore_delay: float = 1.5):
+        self.backend = backend or create_output_backend(os.getenv("VIBEFLOW_OUTPUT_BACKEND", "auto"))
+        self.paste_timeout = paste_timeout  # Wait for the application to read the text
+        self.restore_delay = restore_delay  # Restore after this long when the paste is not confirmed
+        # One thread restores the clipboard; pastes in quick succession share
+        # a single pending restore instead of stacking timers
+        self._restore_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="clipboard-restore")
+        self._restore_lock = threading.Condition()  # Notified when the restore time changes
+        self._restore_future = None
+        self._restore_original: str | None = None  # What the user had before our pastes
+        self._restore_at = 0.0  # inf while a paste is in progress
+
+    def wait_ready(self, timeout: float, cancel_token=None) -> bool:
+        """Wait (up to `timeout`) until the hotkey's modifiers are released, so the
+        paste keystroke is not combined with them. Returns False if cancelled."""
+        deadline = time.monotonic() + timeout
+        while not self.backend.keys_released() and time.monotonic() < deadline:
+            if cancel_token is None:
+                time.sleep(0.01)
+            elif cancel_token.wait(0.01):
+                return False
+        return not (cancel_token is not None and cancel_token.cancelled)
 
     def _restore_clipboard(self, original: str, delay: float = 1.5) -> None:
         """Restore the original clipboard contents after a delay.
 
-        Runs in a background thread so paste_text() returns immediately
-        without blocking the main pipeline.  The delay gives the target
-        application enough time to read the clipboard before we overwrite it.
+        Runs on the restore thread so paste_text() returns immediately without
+        blocking the main pipeline. Another paste within the delay pushes the
+        restore back and keeps the first original.
         """
-        def _do_restore():
-            time.sleep(delay)
-            try:
-                win32clipboard.OpenClipboard()
-                win32clipboard.EmptyClipboard()
-                win32clipboard.SetClipboardText(original, win32con.CF_UNICODETEXT)
-                win32clipboard.CloseClipboard()
-            except Exception:
-                try:
-                    pyperclip.copy(original)
-                except Exception:
-                    pass
-            logger.debug("Clipboard restored to original content")
+        with self._restore_lock:
+            if self._restore_original is None:
+                self._restore_original = original
+            self._restore_at = time.monotonic() + delay
+            if self._restore_future is None:
+                self._restore_future = self._restore_executor.submit(self._restore_when_due)
+            self._restore_lock.notify_all()
+
+    def _restore_when_due(self) -> None:
+        with self._restore_lock:
+            while True:
+                remaining = self._restore_at - time.monotonic()
+                if remaining <= 0:
+                    # Under the lock, so a paste starting now backs up the restored text
+                    try:
+                        self.backend.write(self._restore_original)
+                        logger.debug("Clipboard restored to original content")
+                    except Exception as e:
+                        logger.warning(f"Could not restore the clipboard: {e}")
+                    self._restore_original = None
+                    self._restore_future = None
+                    return
+                # Held back (inf) while a paste is in progress, until it reschedules
+                self._restore_lock.wait(None if math.isinf(remaining) else remaining)
 
-        threading.Thread(target=_do_restore, daemon=True).start()
+    def paste_text(self, text: str) -> bool:
+        """Back up the clipboard, inject text, send Ctrl+V, then restore asynchronously.
 
-    def paste_text(self, text: str) -> None:
-        """Back up the clipboard, inject text, send Ctrl+V, then restore asynchronously."""
+        Returns True if the backend confirmed that the application read the text.
+        """
         logger.info(f"Pasting text: {text[:50]}..." if len(text) > 50 else f"Pasting text: {text}")
 
-        # Back up original clipboard
-        try:
-            original_clipboard = pyperclip.paste()
-        except Exception:
-            original_clipboard = ""
+        # Back up original clipboard (unless a restore of it is still pending). A
+        # pending restore is held back until this paste is done, otherwise it could
+        # put the old text back between our write and the paste keystroke.
+        with self._restore_lock:
+            original_clipboard = self._restore_original
+            self._restore_at = math.inf
+        if original_clipboard is None:
+            try:
+                original_clipboard = self.backend.read()
+            except Exception as e:
+                logger.warning(f"Could not read the clipboard: {e}")
 
-        # Write new text to clipboard using Windows API
+        confirmed = False
+        delay = self.restore_delay
         try:
-            win32clipboard.OpenClipboard()
-            win32clipboard.EmptyClipboard()
-            win32clipboard.SetClipboardText(text, win32con.CF_UNICODETEXT)
-            win32clipboard.CloseClipboard()
-        except Exception as e:
-            logger.warning(f"win32clipboard error, falling back to pyperclip: {e}")
-            pyperclip.copy(text)
-
-        # Small wait to make sure the clipboard is fully populated before paste
-        time.sleep(0.2)
+            with span("clipboard_write"):
+                owned = self.backend.write(text, confirm=True)
+            if not owned:
+                logger.warning("Clipboard ownership not confirmed, pasting anyway")
 
-        import keyboard
-        keyboard.send('ctrl+v')
-        logger.info("Paste command sent")
+            start = time.perf_counter()
+            self.backend.send_paste()
+            confirmed = self.backend.confirms_paste and self.backend.wait_pasted(self.paste_timeout)
+            if confirmed:
+                confirm_seconds = time.perf_counter() - start
+                observe("stage_seconds", confirm_seconds, stage="paste_confirm")
+                logger.info(f"Paste confirmed in {confirm_seconds * 1000:.0f} ms")
+            else:
+                logger.info("Paste command sent")
+            # Right away once the text was read, otherwise after a safe delay
+            delay = 0.0 if confirmed else max(0.0, self.restore_delay - (time.perf_counter() - start))
+        finally:
+            # Restore original clipboard in background (also reschedules a held-back restore)
+            if original_clipboard is not None:
+                self._restore_clipboard(original_clipboard, delay=delay)
+        return confirmed
 
-        # Restore original clipboard in background after a safe delay
-        self._restore_clipboard(original_clipboard, delay=1.5)
+    def close(self) -> None:
+        self.backend.close()
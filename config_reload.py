@@ -0,0 +1,219 @@
+"""Live configuration reload for main.py.
+
+A `FileWatcher` polls profiles.json, the personal dictionary and .env. When one
+of them changes, `ConfigReloader` validates the new content off the hot path
+(parsing, prompt prefixes, new provider clients) and then swaps only the
+affected component state between dictations. The Whisper model, the HTTP pools
+of unchanged providers and the overlay are kept. Of .env, the LLM provider
+settings and the profiler settings (profiler.py) apply live.
+"""
+import os
+import time
+import logging
+import threading
+from dotenv import dotenv_values
+from llm_service import RELOADABLE_SETTINGS
+from profiler import PROFILER_SETTINGS, read_profiler_settings
+
+logger = logging.getLogger("vibeflow")
+
+
+class FileWatcher:
+    """Calls `on_change(names)` when watched files change (mtime or size).
+
+    A change is reported once the file has looked the same for one poll, so a
+    file that is still being written is not read half-way. `on_change` may
+    return names it could not handle yet; they are reported again next poll.
+    """
+
+    def __init__(self, paths: dict[str, str], on_change, interval: float = 1.0):
+        self.paths = paths
+        self.on_change = on_change
+        self.interval = interval
+        self._seen = {name: self._signature(path) for name, path in paths.items()}
+        self._pending: dict[str, tuple] = {}
+        self._retry: list[str] = []
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @staticmethod
+    def _signature(path: str) -> tuple | None:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._loop, name="config-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            changed, self._retry = self._retry, []
+            for name, path in self.paths.items():
+                signature = self._signature(path)
+                if signature == self._seen[name]:
+                    self._pending.pop(name, None)
+                elif self._pending.get(name) == signature:
+                    # Stable for a whole poll: the writer is done
+                    self._seen[name] = signature
+                    del self._pending[name]
+                    if name not in changed:
+                        changed.append(name)
+                else:
+                    self._pending[name] = signature
+            if changed:
+                try:
+                    self._retry = list(self.on_change(changed) or [])
+                except Exception as e:
+                    logger.error(f"Config reload failed: {e}", exc_info=True)
+
+
+class ConfigReloader:
+    """Validates changed configuration and applies it through the pipeline.
+
+    Each component is reloaded in two steps: `prepare` reads and validates (an
+    error keeps the current configuration) and `apply` swaps the prepared state
+    in while no dictation is in flight. If the pipeline stays busy for
+    `apply_timeout` seconds the prepared state is dropped and the change is
+    prepared again on the next poll. `on_profiles(profiles)` is called after
+    new profiles are applied (hotkeys), outside the pipeline lock.
+    """
+
+    def __init__(self, pipeline, stt_service, llm_service, indicator, profiles_path: str,
+                 dictionary_path: str, env_path: str = ".env", interval: float = 1.0, on_profiles=None,
+                 apply_timeout: float = 1.0):
+        self.pipeline = pipeline
+        self.stt_service = stt_service
+        self.llm_service = llm_service
+        self.indicator = indicator
+        self.env_path = env_path
+        self.on_profiles = on_profiles
+        self.apply_timeout = apply_timeout
+        self._env = dict(dotenv_values(env_path))
+        self.watcher = FileWatcher({"profiles": profiles_path, "dictionary": dictionary_path, "env": env_path},
+                                   self.reload, interval)
+
+    def start(self) -> None:
+        self.watcher.start()
+        logger.info(f"Watching {', '.join(self.watcher.paths.values())} for changes")
+
+    def stop(self) -> None:
+        self.watcher.stop()
+
+    def reload(self, names: list[str]) -> list[str]:
+        """Reload the changed files. Returns those postponed because the pipeline was busy."""
+        # prepare() blocks on components still loading in the background (Deferred)
+        postponed = []
+        for name in names:
+            try:
+                if name == "profiles":
+                    profiles = self._reload("profiles", self.llm_service.prepare_profiles, self._apply_profiles)
+                    if profiles is not None and self.on_profiles:
+                        self.on_profiles(profiles)
+                elif name == "dictionary":
+                    self._reload("dictionary", self.stt_service.prepare_dictionary, self._apply_dictionary)
+                elif name == "env":
+                    self._reload(".env settings", self._prepare_env, self._apply_env, self._discard_env)
+            except TimeoutError:
+                logger.info(f"Dictation in progress: {name} reload postponed")
+                postponed.append(name)
+        return postponed
+
+    def _reload(self, component: str, prepare, apply, discard=None):
+        """Returns the applied state, or None if nothing was applied. Raises
+        TimeoutError (after `discard(state)`) if the pipeline stayed busy."""
+        start = time.perf_counter()
+        try:
+            state = prepare()
+        except Exception as e:
+            logger.error(f"Invalid {component}, keeping the current configuration: {e}")
+            return None
+        if state is None:
+            return None
+        prepared = time.perf_counter()
+        try:
+            detail = self.pipeline.apply_when_idle(lambda: apply(state), timeout=self.apply_timeout)
+        except TimeoutError:
+            if discard is not None:
+                discard(state)
+            raise
+        end = time.perf_counter()
+        logger.info(f"Reloaded {component} in {(end - start) * 1000:.1f} ms "
+                    f"(validate {(prepared - start) * 1000:.1f} ms, "
+                    f"swap {(end - prepared) * 1000:.2f} ms){detail}")
+        return state
+
+    def _apply_profiles(self, profiles) -> str:
+        changed = self.llm_service.apply_profiles(profiles)
+        self.pipeline.profiles = profiles
+        return f": {', '.join(changed)} changed" if changed else ""
+
+    def _apply_dictionary(self, words) -> str:
+        self.stt_service.apply_dictionary(words)
+        return f": {len(words)} words"
+
+    def _prepare_env(self):
+        """Read .env; returns (changed values, LLM settings, profiler settings, .env
+        content) or None if nothing relevant changed. The settings of an untouched
+        component are None.
+
+        Validation reads a copy of the environment with the changes applied; the
+        process environment (which LLMService and the profiler read) is only
+        updated in _apply_env.
+        """
+        values = dict(dotenv_values(self.env_path))
+        changed = {key: value for key, value in values.items() if self._env.get(key) != value}
+        removed = [key for key in self._env if key not in values]
+        live = RELOADABLE_SETTINGS + PROFILER_SETTINGS
+        restart = sorted(key for key in list(changed) + removed if key not in live)
+        if restart:
+            logger.warning(f"{', '.join(restart)} changed in {self.env_path}: restart VibeFlow to apply")
+        reloadable = {key: value for key, value in changed.items() if key in live}
+        reloadable.update({key: None for key in removed if key in live})
+        if not reloadable:
+            self._env = values
+            return None
+        env = dict(os.environ)
+        _set_env(reloadable, env)
+        settings = profiling = None
+        if any(key in RELOADABLE_SETTINGS for key in reloadable):
+            settings = self.llm_service.prepare_settings(env)
+        if any(key in PROFILER_SETTINGS for key in reloadable):
+            try:
+                profiling = read_profiler_settings(env)
+            except Exception:
+                if settings is not None:
+                    self.llm_service.discard_settings(settings)
+                raise
+        return reloadable, settings, profiling, values
+
+    def _apply_env(self, state) -> str:
+        reloadable, settings, profiling, values = state
+        _set_env(reloadable)
+        self._env = values
+        if settings is not None:
+            self.llm_service.apply_settings(settings)
+            self.indicator.provider = self.llm_service.provider
+        if profiling is not None and self.pipeline.profiler is not None:
+            self.pipeline.profiler.configure(profiling)
+        return f": {', '.join(sorted(reloadable))}"
+
+    def _discard_env(self, state) -> None:
+        settings = state[1]
+        if settings is not None:
+            self.llm_service.discard_settings(settings)
+
+
+def _set_env(values: dict, env=None) -> None:
+    """Write `values` into `env` (default os.environ); None removes a key."""
+    env = os.environ if env is None else env
+    for key, value in values.items():
+        if value is None:
+            env.pop(key, None)
+        else:
+            env[key] = value
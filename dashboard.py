@@ -1,41 +1,73 @@
 import os
 import sys
+import html
 import json
+import time
+import shutil
+import tempfile
+import logging
 import subprocess
 import threading
-import gradio as gr
-from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv, set_key
 from stt_service import STTService
-from llm_service import LLMService
+from llm_service import LLMService, SUPPORTED_PROVIDERS
+from metrics import load_snapshot
+from startup import Deferred, StartupTimeline
+from log_store import LogStore
+from history import history_from_env
+from profiles import parse_profiles
+from profiler import PROFILE_MODES, list_profiles, read_profiler_settings
+from remote_services import server_url, RemoteSTTService, RemoteLLMService
 
 # Load environment variables from .env file
 load_dotenv()
 
-print("Initializing Dashboard Services...")
-stt_service = STTService()
-llm_service = LLMService()
-print("Services Initialized.")
+
+def _create_stt_service():
+    """Local Whisper model, or the shared server when VIBEFLOW_SERVER_URL is set."""
+    return RemoteSTTService(server_url()) if server_url() else STTService()
+
+
+def _create_llm_service():
+    return RemoteLLMService(server_url()) if server_url() else LLMService()
+
+
+# Models load in background while gradio is imported and the UI is built;
+# the first request waits for them if needed
+timeline = StartupTimeline()
+_startup = ThreadPoolExecutor(max_workers=2, thread_name_prefix="dashboard-init")
+stt_service = Deferred(_startup.submit(timeline.run, "init STTService", _create_stt_service), "Whisper model")
+llm_service = Deferred(_startup.submit(timeline.run, "init LLMService", _create_llm_service), "LLM Service")
+_startup.shutdown(wait=False)
 
 PROFILES_PATH = os.getenv("PROFILES_PATH", "./profiles.json")
 PERSONAL_DICT_PATH = os.getenv("PERSONAL_DICT_PATH", "./personal_dictionary.txt")
+METRICS_PATH = os.getenv("VIBEFLOW_METRICS_PATH", "./vibeflow_metrics.json")
 MAIN_SCRIPT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+# main.py runs in its own directory: relative paths in .env are relative to it
+ENV_PATH = os.path.join(os.path.dirname(MAIN_SCRIPT_PATH), ".env")
+PROFILE_DIR = os.path.join(os.path.dirname(MAIN_SCRIPT_PATH), os.getenv("VIBEFLOW_PROFILE_DIR", "./profiling"))
 
 # --- Process management state ---
 _main_process: subprocess.Popen | None = None
-_log_buffer: list[str] = []
-_log_lock = threading.Lock()
-MAX_LOG_LINES = 500
+# Lines kept in memory (all runs); the console shows the last LOG_VIEW_LINES matching ones
+_log_store = LogStore(int(os.getenv("DASHBOARD_LOG_HISTORY", "5000")))
+LOG_VIEW_LINES = 1000
+# An idle stream still yields this often, so gradio can reap streams whose page is gone
+LOG_HEARTBEAT_SECONDS = 15
+# Running console stream of each browser session: a new one (filter change) ends the old one
+_log_streams: dict[str, threading.Event] = {}
+_log_streams_lock = threading.Lock()
+LOG_LEVELS = {"Tutti": logging.NOTSET, "INFO": logging.INFO, "WARNING": logging.WARNING,
+              "ERROR": logging.ERROR}
 
 
 def _read_output(proc: subprocess.Popen) -> None:
     """Background thread: reads stdout/stderr from the child process."""
     try:
         for raw_line in iter(proc.stdout.readline, b""):
-            line = raw_line.decode("utf-8", errors="replace").rstrip()
-            with _log_lock:
-                _log_buffer.append(line)
-                if len(_log_buffer) > MAX_LOG_LINES:
-                    _log_buffer.pop(0)
+            _log_store.append(raw_line.decode("utf-8", errors="replace").rstrip())
     except ValueError:
         pass  # pipe closed
 
@@ -45,8 +77,7 @@ def start_main() -> str:
     global _main_process
     if _main_process and _main_process.poll() is None:
         return "⚠️ VibeFlow è già in esecuzione"
-    with _log_lock:
-        _log_buffer.clear()
+    _log_store.append("─" * 20 + " VibeFlow avviato " + "─" * 20)
     _main_process = subprocess.Popen(
         [sys.executable, MAIN_SCRIPT_PATH],
         stdout=subprocess.PIPE,
@@ -77,49 +108,176 @@ def get_process_status() -> str:
     return "🔴 Fermo"
 
 
-def get_logs() -> str:
-    with _log_lock:
-        return "\n".join(_log_buffer)
+def stream_logs(level: str, text_filter: str, owner: str | None = None):
+    """Generator feeding the log console: yields when new matching lines arrive.
+
+    Gradio streams each yield as a diff of the previous value, so appended lines
+    are the only thing sent to the browser. The view is trimmed to LOG_VIEW_LINES
+    in one go once it reaches twice that size.
+
+    Each next() runs in a worker thread gradio cannot interrupt: a stream is only
+    reaped at a yield after its page has gone (reload, filter change). Without
+    matching lines the unchanged view is yielded every LOG_HEARTBEAT_SECONDS, an
+    empty diff for a live page, so abandoned streams do not pin the thread pool.
+
+    With an `owner` (the browser session), starting a stream ends the one the
+    same session had running, so a filter change never leaves two streams
+    writing to the console.
+    """
+    superseded = threading.Event()
+    if owner is not None:
+        with _log_streams_lock:
+            previous = _log_streams.get(owner)
+            _log_streams[owner] = superseded
+        if previous is not None:
+            previous.set()
+            _log_store.wake()
+    try:
+        min_level = LOG_LEVELS.get(level, logging.NOTSET)
+        lines, seq = _log_store.since(0, min_level, text_filter)
+        shown = lines[-LOG_VIEW_LINES:]
+        yield "\n".join(shown)
+        last_yield = time.monotonic()
+        while True:
+            remaining = LOG_HEARTBEAT_SECONDS - (time.monotonic() - last_yield)
+            if _log_store.wait(seq, timeout=max(remaining, 0), stop=superseded):
+                if superseded.is_set():
+                    return
+                lines, seq = _log_store.since(seq, min_level, text_filter)
+                if lines:
+                    shown.extend(lines)
+                    if len(shown) > 2 * LOG_VIEW_LINES:
+                        shown = shown[-LOG_VIEW_LINES:]
+                elif remaining > 0:
+                    continue
+            yield "\n".join(shown)
+            last_yield = time.monotonic()
+    finally:
+        if owner is not None:
+            with _log_streams_lock:
+                if _log_streams.get(owner) is superseded:
+                    del _log_streams[owner]
+
+
+def get_metrics():
+    """Latency table and p50/p95 chart from the snapshot written by main.py."""
+    import pandas as pd
+    columns = ["metrica", "etichette", "count", "p50", "p95", "p99"]
+    snapshot = load_snapshot(METRICS_PATH)
+    if not snapshot:
+        return pd.DataFrame(columns=columns), pd.DataFrame(columns=["stage", "quantile", "secondi"])
+    rows, chart = [], []
+    for name, series in snapshot["metrics"].items():
+        for entry in series:
+            labels = ", ".join(f"{k}={v}" for k, v in entry["labels"].items())
+            rows.append([name, labels, entry["count"], entry["p50"], entry["p95"], entry["p99"]])
+            if name == "stage_seconds":
+                stage = "/".join(entry["labels"].values())
+                chart.append([stage, "p50", entry["p50"]])
+                chart.append([stage, "p95", entry["p95"]])
+    return pd.DataFrame(rows, columns=columns), pd.DataFrame(chart, columns=["stage", "quantile", "secondi"])
+
+
+def set_profiling(mode, threshold):
+    """Turn the profiling of slow dictations on or off through .env.
+
+    A running main.py reloads it live; the environment is updated too, so a
+    main.py started from here gets the same settings.
+    """
+    if threshold is None or threshold < 0:
+        return "❌ La soglia deve essere un numero di secondi >= 0"
+    values = {"VIBEFLOW_PROFILE": mode, "VIBEFLOW_PROFILE_THRESHOLD": f"{threshold:g}"}
+    try:
+        for key, value in values.items():
+            set_key(ENV_PATH, key, value, quote_mode="never")
+            os.environ[key] = value
+    except OSError as e:
+        return f"❌ Impossibile aggiornare .env: {e}"
+    if mode == "off":
+        return "Profilatura disattivata"
+    return f"✅ Profilatura {mode}: salvate le dettature oltre {threshold:g}s"
+
+
+def get_profiles():
+    """Saved profiles of slow dictations, newest first."""
+    import pandas as pd
+    rows = [[p["created"], p["trace_id"], p["seconds"], p["format"], p["name"]] for p in list_profiles(PROFILE_DIR)]
+    return pd.DataFrame(rows, columns=["data", "trace ID", "time-to-paste (s)", "formato", "file"])
 
-def load_profiles():
-    """Load profiles from JSON file."""
+
+def _atomic_write(path: str, content: str) -> None:
+    # main.py watches these files: it must never read a half-written one
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp, path)
+
+
+def _read_raw_profiles() -> dict:
+    with open(PROFILES_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_profile(name):
+    """System prompt and other settings (as JSON) of one profile."""
+    import gradio as gr
     try:
-        with open(PROFILES_PATH, "r", encoding="utf-8") as f:
-            profiles = json.load(f)
-        return (
-            profiles.get("confidential", {}).get("system_prompt", ""),
-            profiles.get("formal", {}).get("system_prompt", ""),
-            profiles.get("technical", {}).get("system_prompt", ""),
-            "✅ Profili caricati correttamente"
-        )
+        profiles = _read_raw_profiles()
     except Exception as e:
-        return "", "", "", f"❌ Errore nel caricamento: {str(e)}"
+        return gr.Dropdown(), "", "{}", f"❌ Errore nel caricamento: {str(e)}"
+    names = list(profiles)
+    if not name:
+        name = names[0]
+    elif name not in profiles:
+        return gr.Dropdown(choices=names, value=name), "", "{}", f"ℹ️ Nuovo profilo {name}: salva per crearlo"
+    settings = {key: value for key, value in profiles[name].items() if key != "system_prompt"}
+    return (gr.Dropdown(choices=names, value=name), profiles[name].get("system_prompt", ""),
+            json.dumps(settings, indent=2, ensure_ascii=False), "✅ Profili caricati correttamente")
+
+
+def _write_profiles(profiles: dict) -> None:
+    """Validate, save and apply profiles.json (raises ValueError if invalid)."""
+    for profile in parse_profiles(profiles).values():
+        if profile.llm_provider and profile.llm_provider not in SUPPORTED_PROVIDERS:
+            raise ValueError(f"provider '{profile.llm_provider}' non supportato")
+    _atomic_write(PROFILES_PATH, json.dumps(profiles, indent=2, ensure_ascii=False))
+    # Swap the profiles in place: clients and connections are kept.
+    # A running main.py picks the file up by itself (config_reload.py)
+    llm_service.reload_profiles()
+
+
+def save_profile(name, system_prompt, settings_json):
+    """Create or update one profile, keeping the others (and the file's order)."""
+    import gradio as gr
+    name = (name or "").strip()
+    if not name:
+        return gr.Dropdown(), "❌ Indica il nome del profilo"
+    try:
+        settings = json.loads(settings_json or "{}")
+        if not isinstance(settings, dict):
+            raise ValueError("le impostazioni devono essere un oggetto JSON")
+        profiles = _read_raw_profiles()
+        profile = dict(settings)
+        if system_prompt.strip():
+            profile["system_prompt"] = system_prompt
+        profiles[name] = profile
+        _write_profiles(profiles)
+        return gr.Dropdown(choices=list(profiles), value=name), f"✅ Profilo {name} salvato e ricaricato"
+    except Exception as e:
+        return gr.Dropdown(), f"❌ Errore nel salvataggio: {str(e)}"
+
 
-def save_profiles(confidential_prompt, formal_prompt, technical_prompt):
-    """Save profiles to JSON file."""
+def delete_profile(name):
+    import gradio as gr
     try:
-        profiles = {
-            "confidential": {
-                "system_prompt": confidential_prompt
-            },
-            "formal": {
-                "system_prompt": formal_prompt
-            },
-            "technical": {
-                "system_prompt": technical_prompt
-            }
-        }
-        
-        with open(PROFILES_PATH, "w", encoding="utf-8") as f:
-            json.dump(profiles, f, indent=2, ensure_ascii=False)
-        
-        # Reload LLM service to pick up new profiles
-        global llm_service
-        llm_service = LLMService()
-        
-        return "✅ Profili salvati e ricaricati con successo!"
+        profiles = _read_raw_profiles()
+        if name not in profiles:
+            return gr.Dropdown(), f"❌ Profilo {name} non trovato"
+        del profiles[name]
+        _write_profiles(profiles)
+        return gr.Dropdown(choices=list(profiles), value=next(iter(profiles))), f"✅ Profilo {name} eliminato"
     except Exception as e:
-        return f"❌ Errore nel salvataggio: {str(e)}"
+        return gr.Dropdown(), f"❌ Errore nell'eliminazione: {str(e)}"
 
 def load_dictionary():
     """Load personal dictionary from file."""
@@ -133,20 +291,27 @@ def load_dictionary():
 def save_dictionary(content):
     """Save personal dictionary to file."""
     try:
-        with open(PERSONAL_DICT_PATH, "w", encoding="utf-8") as f:
-            f.write(content)
-        # Reload STT service so the new words are picked up
-        global stt_service
-        stt_service = STTService()
+        _atomic_write(PERSONAL_DICT_PATH, content)
+        # Only the word list changes: the Whisper model stays loaded
+        stt_service.reload_dictionary()
         return "✅ Dizionario salvato e STT ricaricato con successo!"
     except Exception as e:
         return f"❌ Errore nel salvataggio: {str(e)}"
 
 def update_provider(provider):
-    global llm_service
-    # LLMService reads LLM_PROVIDER from env – set it before instantiating
+    if server_url():
+        return f"Provider gestito dal server VibeFlow ({server_url()})"
+    # LLMService reads LLM_PROVIDER from env; existing provider clients are reused
+    previous = os.environ.get("LLM_PROVIDER")
     os.environ["LLM_PROVIDER"] = provider.lower()
-    llm_service = LLMService()
+    try:
+        llm_service.apply_settings(llm_service.prepare_settings())
+    except Exception as e:
+        if previous is None:
+            os.environ.pop("LLM_PROVIDER", None)
+        else:
+            os.environ["LLM_PROVIDER"] = previous
+        return f"❌ {e}"
     return f"Provider impostato su {provider}"
 
 def process_audio(audio_path, vibe):
@@ -161,187 +326,434 @@ def process_audio(audio_path, vibe):
         return "Errore nella trascrizione o audio vuoto.", ""
         
     # 2. Rewrite
-    mapping = {
-        "Confidenziale": "confidential",
-        "Formale": "formal",
-        "Tecnico": "technical"
-    }
-    vibe_key = mapping.get(vibe, "confidential")
-    
-    final_text = llm_service.rewrite_text(transcription, vibe_key)
+    final_text = llm_service.rewrite_text(transcription, vibe)
     
     return transcription, final_text
 
-with gr.Blocks(title="VibeFlow Dashboard") as demo:
-    gr.Markdown("# 🚀 VibeFlow Dashboard")
-    gr.Markdown("Testa il flusso di STT e LLM, e configura i profili di scrittura.")
-    
-    with gr.Tabs():
-        # Tab 1: Audio Testing
-        with gr.Tab("🎤 Test Audio"):
-            gr.Markdown("### Testa il flusso di STT e LLM indipendentemente dalle hotkeys e dalla clipboard.")
-            
-            with gr.Row():
-                with gr.Column(scale=1):
-                    provider_dropdown = gr.Dropdown(
-                        choices=["LMStudio", "DeepSeek"],
-                        value="LMStudio",
-                        label="Seleziona il Provider LLM"
+# Comparison mode: rewrites of one transcript run concurrently, one per profile x provider
+_compare_executor = ThreadPoolExecutor(max_workers=int(os.getenv("DASHBOARD_COMPARE_WORKERS", "6")),
+                                       thread_name_prefix="compare")
+
+
+def _profile_names() -> list[str]:
+    try:
+        with open(PROFILES_PATH, "r", encoding="utf-8") as f:
+            return list(json.load(f))
+    except Exception:
+        return ["confidential", "formal", "technical"]
+
+
+def _render_comparison(results: list[dict]) -> str:
+    """Side-by-side cards, one per rewrite (profile order, then provider)."""
+    cards = []
+    for r in results:
+        if r.get("pending"):
+            meta, body = "⏳ in corso...", ""
+        elif r["error"]:
+            meta, body = f"❌ {r['seconds']:.2f}s", html.escape(r["error"])
+        else:
+            meta = f"⏱️ {r['seconds']:.2f}s"
+            if r["ttft"] is not None:
+                meta += f" (primo token {r['ttft']:.2f}s)"
+            if r["completion_tokens"] is not None:
+                tokens = f"{r['prompt_tokens']} → " if r["prompt_tokens"] is not None else ""
+                meta += f" · {tokens}{r['completion_tokens']} token"
+            if r["cached_tokens"]:
+                meta += f" ({r['cached_tokens']} in cache)"
+            body = html.escape(r["text"])
+        cards.append(
+            '<div style="flex:1 1 280px;border:1px solid #8884;border-radius:8px;padding:10px">'
+            f'<b>{html.escape(r["vibe"])} · {html.escape(r["provider"])}</b>'
+            f'<div style="opacity:.75;font-size:.9em">{meta}</div>'
+            f'<pre style="white-space:pre-wrap;font-family:inherit">{body}</pre></div>'
+        )
+    return '<div style="display:flex;flex-wrap:wrap;gap:10px">' + "".join(cards) + "</div>"
+
+
+def compare_audio(audio_path, transcription, transcribed_path, vibes, providers):
+    """Transcribe once, then rewrite with every selected profile x provider at the same time.
+
+    The transcript is reused while the audio does not change, so tuning a prompt
+    and re-running costs only the rewrites (the transcript box can also be edited).
+    Yields (transcript, status, cards, transcribed_path) as results come in.
+    """
+    if not audio_path:
+        yield "", "Nessun audio fornito.", "", None
+        return
+    if not vibes or not providers:
+        yield transcription, "Seleziona almeno un vibe e un provider.", "", transcribed_path
+        return
+
+    status = ""
+    if audio_path != transcribed_path or not transcription:
+        # STT deletes the file it transcribes: keep gradio's copy for the next run
+        tmp_fd, temp_file = tempfile.mkstemp(suffix=".wav", prefix="vibeflow_cmp_")
+        os.close(tmp_fd)
+        shutil.copyfile(audio_path, temp_file)
+        start = time.perf_counter()
+        transcription = stt_service.transcribe(temp_file)
+        status = f"Trascrizione in {time.perf_counter() - start:.2f}s. "
+        if not transcription:
+            yield "", "Errore nella trascrizione o audio vuoto.", "", None
+            return
+        transcribed_path = audio_path
+
+    combos = [(vibe, provider.lower()) for vibe in vibes for provider in providers]
+    results = [{"vibe": vibe, "provider": provider, "pending": True} for vibe, provider in combos]
+    yield transcription, status + f"{len(combos)} riscritture in corso...", _render_comparison(results), transcribed_path
+
+    rewrite_with = llm_service.rewrite_with  # Waits here if the service is still loading
+    start = time.perf_counter()
+    futures = {_compare_executor.submit(rewrite_with, transcription, vibe, provider): i
+               for i, (vibe, provider) in enumerate(combos)}
+    for done, future in enumerate(as_completed(futures), 1):
+        results[futures[future]] = future.result()
+        yield (transcription, status + f"{done}/{len(combos)} riscritture",
+               _render_comparison(results), transcribed_path)
+
+    wall = time.perf_counter() - start
+    sequential = sum(r["seconds"] or 0.0 for r in results)
+    yield (transcription, status + f"{len(combos)} riscritture in {wall:.2f}s "
+           f"(in sequenza ~{sequential:.2f}s)", _render_comparison(results), transcribed_path)
+
+
+# Dictation history written by main.py (same SQLite file), opened on first use
+_history = None
+_history_lock = threading.Lock()
+
+
+def _get_history():
+    global _history
+    with _history_lock:
+        if _history is None:
+            _history = history_from_env()
+        return _history
+
+
+def search_history(query):
+    """Most recent dictations whose raw or final text matches every word of `query`."""
+    history = _get_history()
+    if history is None:
+        return [], "Cronologia disattivata (VIBEFLOW_HISTORY_PATH vuoto)."
+    rows = history.search(query or "", limit=100)
+    table = [[r["id"], time.strftime("%Y-%m-%d %H:%M", time.localtime(r["created_at"])), r["vibe"],
+              r["raw_text"], r["final_text"], "🔊" if r["audio_path"] else ""] for r in rows]
+    return table, f"{len(rows)} dettature trovate."
+
+
+def load_history_entry(entry_id):
+    history = _get_history()
+    entry = history.get(int(entry_id)) if history and entry_id else None
+    if entry is None:
+        return "", "", None
+    audio = entry["audio_path"] if entry["audio_path"] and os.path.exists(entry["audio_path"]) else None
+    return entry["raw_text"], entry["final_text"], audio
+
+
+def rewrite_history_entry(entry_id, raw_text, vibe):
+    """Rewrite a stored transcript with another vibe (no STT) and save it as a new entry."""
+    history = _get_history()
+    if not raw_text:
+        return "", "Seleziona una dettatura."
+    start = time.perf_counter()
+    final_text = llm_service.rewrite_text(raw_text, vibe)
+    elapsed = time.perf_counter() - start
+    if not final_text:
+        return "", "Errore nella riscrittura."
+    if history:
+        history.record(raw_text, final_text, vibe, provider=llm_service.provider,
+                       parent_id=int(entry_id) if entry_id else None)
+    return final_text, f"Riscritto in {elapsed:.2f}s (senza trascrizione)."
+
+
+def build_ui():
+    """Build the Gradio app (gradio is imported here, not at module load)."""
+    import gradio as gr
+
+    with gr.Blocks(title="VibeFlow Dashboard") as demo:
+        gr.Markdown("# 🚀 VibeFlow Dashboard")
+        gr.Markdown("Testa il flusso di STT e LLM, e configura i profili di scrittura.")
+
+        with gr.Tabs():
+            # Tab 1: Audio Testing
+            with gr.Tab("🎤 Test Audio"):
+                gr.Markdown("### Testa il flusso di STT e LLM indipendentemente dalle hotkeys e dalla clipboard.")
+
+                with gr.Row():
+                    with gr.Column(scale=1):
+                        provider_dropdown = gr.Dropdown(
+                            choices=["LMStudio", "DeepSeek"],
+                            value="LMStudio",
+                            label="Seleziona il Provider LLM"
+                        )
+                        provider_status = gr.Textbox(label="Status", value="Provider impostato su LMStudio", interactive=False)
+                        provider_dropdown.change(fn=update_provider, inputs=provider_dropdown, outputs=provider_status)
+
+                        audio_input = gr.Audio(sources=["microphone", "upload"], type="filepath", label="Registra o Carica Audio")
+                        vibe_dropdown = gr.Dropdown(
+                            choices=_profile_names(),
+                            value=_profile_names()[0],
+                            label="Seleziona il Vibe"
+                        )
+                        submit_btn = gr.Button("Elabora", variant="primary")
+
+                    with gr.Column(scale=2):
+                        transcription_output = gr.Textbox(label="1. Trascrizione Grezza (faster-whisper)", lines=3)
+                        final_output = gr.Textbox(label="2. Output Formattato (LLM)", lines=6)
+
+                submit_btn.click(
+                    fn=process_audio,
+                    inputs=[audio_input, vibe_dropdown],
+                    outputs=[transcription_output, final_output]
+                )
+
+            # Tab 2: Side-by-side comparison
+            with gr.Tab("🔬 Confronto"):
+                gr.Markdown("### Trascrivi una volta e confronta le riscritture di più vibe e provider in parallelo")
+
+                with gr.Row():
+                    with gr.Column(scale=1):
+                        compare_audio_input = gr.Audio(sources=["microphone", "upload"], type="filepath",
+                                                       label="Registra o Carica Audio")
+                        compare_vibes = gr.CheckboxGroup(choices=_profile_names(),
+                                                         value=_profile_names(), label="Vibe")
+                        compare_providers = gr.CheckboxGroup(choices=["LMStudio", "DeepSeek"],
+                                                             value=["LMStudio"], label="Provider")
+                        compare_btn = gr.Button("Confronta", variant="primary")
+
+                    with gr.Column(scale=2):
+                        compare_transcription = gr.Textbox(
+                            label="Trascrizione (riusata finché l'audio non cambia, modificabile)", lines=3)
+                        compare_status = gr.Textbox(label="Status", interactive=False)
+
+                compare_output = gr.HTML()
+                transcribed_path = gr.State(None)
+
+                compare_btn.click(
+                    fn=compare_audio,
+                    inputs=[compare_audio_input, compare_transcription, transcribed_path,
+                            compare_vibes, compare_providers],
+                    outputs=[compare_transcription, compare_status, compare_output, transcribed_path]
+                )
+
+            # Tab 3: Dictation history
+            with gr.Tab("🕘 Cronologia"):
+                gr.Markdown("### Cerca tra le dettature e riscrivile con un altro vibe, senza ritrascrivere")
+
+                with gr.Row():
+                    history_query = gr.Textbox(label="Cerca nel testo grezzo e finale", scale=4)
+                    history_search_btn = gr.Button("🔍 Cerca", scale=1)
+                history_status = gr.Textbox(label="Status", interactive=False)
+                history_table = gr.Dataframe(headers=["ID", "Data", "Vibe", "Trascrizione", "Testo finale", "Audio"],
+                                             interactive=False, wrap=True)
+
+                with gr.Row():
+                    with gr.Column(scale=1):
+                        history_id = gr.Number(label="ID selezionato", precision=0)
+                        history_audio = gr.Audio(type="filepath", label="Audio", interactive=False)
+                        history_vibe = gr.Dropdown(choices=_profile_names(), value=_profile_names()[0],
+                                                   label="Nuovo vibe")
+                        history_rewrite_btn = gr.Button("Riscrivi", variant="primary")
+                    with gr.Column(scale=2):
+                        history_raw = gr.Textbox(label="Trascrizione", lines=3)
+                        history_final = gr.Textbox(label="Testo finale", lines=4, interactive=False)
+                        history_rewritten = gr.Textbox(label="Nuova riscrittura", lines=4)
+
+                def select_history_row(evt: gr.SelectData):
+                    return evt.row_value[0]
+
+                for trigger in (history_search_btn.click, history_query.submit, demo.load):
+                    trigger(fn=search_history, inputs=[history_query], outputs=[history_table, history_status])
+                history_table.select(fn=select_history_row, inputs=[], outputs=[history_id])
+                history_id.change(fn=load_history_entry, inputs=[history_id],
+                                  outputs=[history_raw, history_final, history_audio])
+                history_rewrite_btn.click(fn=rewrite_history_entry, inputs=[history_id, history_raw, history_vibe],
+                                          outputs=[history_rewritten, history_status])
+
+            # Tab 4: Profile Editor
+            with gr.Tab("⚙️ Editor Profili"):
+                gr.Markdown("### Modifica prompt, hotkey e impostazioni di ogni profilo")
+                gr.Markdown("I profili vengono salvati in `profiles.json` e ricaricati automaticamente. "
+                            "Scrivi un nuovo nome per creare un profilo.")
+
+                with gr.Row():
+                    profile_name = gr.Dropdown(choices=_profile_names(), value=_profile_names()[0],
+                                               label="Profilo", allow_custom_value=True, scale=3)
+                    load_btn = gr.Button("🔄 Carica", variant="secondary", scale=1)
+
+                with gr.Row():
+                    status_text = gr.Textbox(label="Status", interactive=False)
+
+                with gr.Row():
+                    prompt_textbox = gr.Textbox(
+                        label="System Prompt",
+                        lines=14,
+                        placeholder="Inserisci il prompt di sistema del profilo...",
+                        scale=3,
                     )
-                    provider_status = gr.Textbox(label="Status", value="Provider impostato su LMStudio", interactive=False)
-                    provider_dropdown.change(fn=update_provider, inputs=provider_dropdown, outputs=provider_status)
-                    
-                    audio_input = gr.Audio(sources=["microphone", "upload"], type="filepath", label="Registra o Carica Audio")
-                    vibe_dropdown = gr.Dropdown(
-                        choices=["Confidenziale", "Formale", "Tecnico"], 
-                        value="Confidenziale", 
-                        label="Seleziona il Vibe"
+                    settings_textbox = gr.Code(
+                        label="Impostazioni (hotkey, beam_size, stt_model, llm_provider, "
+                              "llm_timeout, max_tokens, skip_llm, ...)",
+                        language="json",
+                        scale=2,
                     )
-                    submit_btn = gr.Button("Elabora", variant="primary")
-                    
-                with gr.Column(scale=2):
-                    transcription_output = gr.Textbox(label="1. Trascrizione Grezza (faster-whisper)", lines=3)
-                    final_output = gr.Textbox(label="2. Output Formattato (LLM)", lines=6)
-                    
-            submit_btn.click(
-                fn=process_audio,
-                inputs=[audio_input, vibe_dropdown],
-                outputs=[transcription_output, final_output]
-            )
-        
-        # Tab 2: Profile Editor
-        with gr.Tab("⚙️ Editor Profili"):
-            gr.Markdown("### Modifica i prompt di sistema per ogni stile di scrittura")
-            gr.Markdown("I profili vengono salvati in `profiles.json` e ricaricati automaticamente.")
-            
-            with gr.Row():
-                load_btn = gr.Button("🔄 Carica Profili", variant="secondary")
-            
-            with gr.Row():
-                status_text = gr.Textbox(label="Status", interactive=False)
-            
-            with gr.Column():
-                gr.Markdown("#### 📝 Confidenziale (CTRL+ALT+1)")
-                confidential_textbox = gr.Textbox(
-                    label="System Prompt",
-                    lines=10,
-                    placeholder="Inserisci il prompt di sistema per lo stile confidenziale..."
+
+                with gr.Row():
+                    save_btn = gr.Button("💾 Salva Profilo", variant="primary", size="lg")
+                    delete_btn = gr.Button("🗑️ Elimina Profilo", variant="stop")
+
+                profile_outputs = [profile_name, prompt_textbox, settings_textbox, status_text]
+                load_btn.click(fn=load_profile, inputs=[profile_name], outputs=profile_outputs)
+                profile_name.select(fn=load_profile, inputs=[profile_name], outputs=profile_outputs)
+                save_btn.click(fn=save_profile, inputs=[profile_name, prompt_textbox, settings_textbox],
+                               outputs=[profile_name, status_text])
+                delete_btn.click(fn=delete_profile, inputs=[profile_name], outputs=[profile_name, status_text]) \
+                    .then(fn=load_profile, inputs=[profile_name], outputs=profile_outputs)
+
+                # Auto-load profiles on dashboard startup
+                demo.load(fn=load_profile, inputs=[profile_name], outputs=profile_outputs)
+
+            # Tab 5: Personal Dictionary Editor
+            with gr.Tab("📖 Dizionario Personale"):
+                gr.Markdown("### Gestisci il dizionario personale per migliorare l'accuratezza di Whisper")
+                gr.Markdown(
+                    "Aggiungi parole personalizzate (nomi propri, termini tecnici, acronimi) — una per riga.\n"
+                    "Le righe che iniziano con `#` sono commenti e vengono ignorate da Whisper."
+                )
+
+                with gr.Row():
+                    dict_load_btn = gr.Button("🔄 Carica Dizionario", variant="secondary")
+
+                with gr.Row():
+                    dict_status = gr.Textbox(label="Status", interactive=False)
+
+                dict_textbox = gr.Textbox(
+                    label="Contenuto del dizionario personale",
+                    lines=20,
+                    placeholder="# Aggiungi parole qui\nNomeAzienda\nTermineTecnico\n..."
+                )
+
+                with gr.Row():
+                    dict_save_btn = gr.Button("💾 Salva Dizionario", variant="primary", size="lg")
+
+                dict_load_btn.click(
+                    fn=load_dictionary,
+                    inputs=[],
+                    outputs=[dict_textbox, dict_status]
                 )
-                
-                gr.Markdown("#### 💼 Formale (CTRL+ALT+2)")
-                formal_textbox = gr.Textbox(
-                    label="System Prompt",
-                    lines=10,
-                    placeholder="Inserisci il prompt di sistema per lo stile formale..."
+
+                dict_save_btn.click(
+                    fn=save_dictionary,
+                    inputs=[dict_textbox],
+                    outputs=[dict_status]
+                )
+
+                demo.load(
+                    fn=load_dictionary,
+                    inputs=[],
+                    outputs=[dict_textbox, dict_status]
                 )
-                
-                gr.Markdown("#### 🔧 Tecnico (CTRL+ALT+3)")
-                technical_textbox = gr.Textbox(
-                    label="System Prompt",
-                    lines=10,
-                    placeholder="Inserisci il prompt di sistema per lo stile tecnico..."
+
+            # Tab 6: VibeFlow Control
+            with gr.Tab("▶️ Controllo VibeFlow"):
+                gr.Markdown("### Avvia e ferma il processo principale di VibeFlow")
+                gr.Markdown(
+                    "Utilizza i pulsanti per avviare/fermare `main.py`. "
+                    "I log compaiono in tempo reale, filtrati per livello e testo."
                 )
-            
-            with gr.Row():
-                save_btn = gr.Button("💾 Salva Profili", variant="primary", size="lg")
-            
-            # Load profiles on button click
-            load_btn.click(
-                fn=load_profiles,
-                inputs=[],
-                outputs=[confidential_textbox, formal_textbox, technical_textbox, status_text]
-            )
-            
-            # Save profiles on button click
-            save_btn.click(
-                fn=save_profiles,
-                inputs=[confidential_textbox, formal_textbox, technical_textbox],
-                outputs=[status_text]
-            )
-            
-            # Auto-load profiles on dashboard startup
-            demo.load(
-                fn=load_profiles,
-                inputs=[],
-                outputs=[confidential_textbox, formal_textbox, technical_textbox, status_text]
-            )
-
-        # Tab 3: Personal Dictionary Editor
-        with gr.Tab("📖 Dizionario Personale"):
-            gr.Markdown("### Gestisci il dizionario personale per migliorare l'accuratezza di Whisper")
-            gr.Markdown(
-                "Aggiungi parole personalizzate (nomi propri, termini tecnici, acronimi) — una per riga.\n"
-                "Le righe che iniziano con `#` sono commenti e vengono ignorate da Whisper."
-            )
-
-            with gr.Row():
-                dict_load_btn = gr.Button("🔄 Carica Dizionario", variant="secondary")
-
-            with gr.Row():
-                dict_status = gr.Textbox(label="Status", interactive=False)
-
-            dict_textbox = gr.Textbox(
-                label="Contenuto del dizionario personale",
-                lines=20,
-                placeholder="# Aggiungi parole qui\nNomeAzienda\nTermineTecnico\n..."
-            )
-
-            with gr.Row():
-                dict_save_btn = gr.Button("💾 Salva Dizionario", variant="primary", size="lg")
-
-            dict_load_btn.click(
-                fn=load_dictionary,
-                inputs=[],
-                outputs=[dict_textbox, dict_status]
-            )
-
-            dict_save_btn.click(
-                fn=save_dictionary,
-                inputs=[dict_textbox],
-                outputs=[dict_status]
-            )
-
-            demo.load(
-                fn=load_dictionary,
-                inputs=[],
-                outputs=[dict_textbox, dict_status]
-            )
-
-        # Tab 4: VibeFlow Control
-        with gr.Tab("▶️ Controllo VibeFlow"):
-            gr.Markdown("### Avvia e ferma il processo principale di VibeFlow")
-            gr.Markdown(
-                "Utilizza i pulsanti per avviare/fermare `main.py`. "
-                "I log vengono aggiornati automaticamente ogni 2 secondi."
-            )
-
-            with gr.Row():
-                start_btn = gr.Button("▶️ Avvia VibeFlow", variant="primary", size="lg")
-                stop_btn = gr.Button("⏹️ Ferma VibeFlow", variant="stop", size="lg")
-
-            with gr.Row():
-                process_status = gr.Textbox(
-                    label="Stato processo",
-                    value=get_process_status,
+
+                with gr.Row():
+                    start_btn = gr.Button("▶️ Avvia VibeFlow", variant="primary", size="lg")
+                    stop_btn = gr.Button("⏹️ Ferma VibeFlow", variant="stop", size="lg")
+
+                with gr.Row():
+                    process_status = gr.Textbox(
+                        label="Stato processo",
+                        value=get_process_status,
+                        interactive=False,
+                    )
+                    action_status = gr.Textbox(label="Ultimo comando", interactive=False)
+
+                with gr.Row():
+                    log_level = gr.Dropdown(choices=list(LOG_LEVELS), value="Tutti", label="Livello minimo")
+                    log_filter = gr.Textbox(label="Filtra testo", placeholder="es. LLM request")
+
+                log_console = gr.Textbox(
+                    label=f"Console log (ultime {LOG_VIEW_LINES} righe, in tempo reale)",
+                    lines=25,
+                    max_lines=25,
                     interactive=False,
+                    autoscroll=True,
+                )
+
+                gr.Markdown("#### 📊 Latenze per fase (finestra mobile)")
+                metrics_chart = gr.BarPlot(
+                    x="stage",
+                    y="secondi",
+                    color="quantile",
+                    label="p50 / p95 per fase (secondi)",
                 )
-                action_status = gr.Textbox(label="Ultimo comando", interactive=False)
+                metrics_table = gr.Dataframe(label="Metriche (RTF Whisper, token/s LLM, TTFT, ...)", interactive=False)
+
+                start_btn.click(fn=start_main, inputs=[], outputs=[action_status])
+                stop_btn.click(fn=stop_main, inputs=[], outputs=[action_status])
 
-            log_console = gr.Textbox(
-                label="Console log (ultimi 500 righe)",
-                lines=25,
-                max_lines=25,
-                interactive=False,
-                autoscroll=True,
-            )
+                # Log console: one long-lived stream per page, restarted when the filters change.
+                # A trigger never waits for the running stream (trigger_mode="multiple"):
+                # the new stream ends the session's previous one itself.
+                def stream_console(level: str, text_filter: str, request: gr.Request):
+                    yield from stream_logs(level, text_filter, owner=request.session_hash)
 
-            start_btn.click(fn=start_main, inputs=[], outputs=[action_status])
-            stop_btn.click(fn=stop_main, inputs=[], outputs=[action_status])
+                gr.on(triggers=[demo.load, log_level.change, log_filter.submit], fn=stream_console,
+                      inputs=[log_level, log_filter], outputs=[log_console],
+                      trigger_mode="multiple", concurrency_limit=None)
+
+                # Process status every 2 seconds
+                timer = gr.Timer(value=2)
+                timer.tick(fn=get_process_status, inputs=[], outputs=[process_status])
+
+                metrics_timer = gr.Timer(value=5)
+                metrics_timer.tick(fn=get_metrics, inputs=[], outputs=[metrics_table, metrics_chart])
+
+                gr.Markdown("#### 🔥 Profilatura delle dettature lente")
+                gr.Markdown(
+                    "Con la profilatura attiva, VibeFlow salva il profilo di ogni dettatura con time-to-paste "
+                    "oltre la soglia: `sampling` (speedscope, leggero) o `cprofile` (pstats, più lento). "
+                    "Selezionare una riga per scaricare il file."
+                )
+                try:
+                    profiling = read_profiler_settings()
+                except ValueError:
+                    profiling = {"mode": "off", "threshold": 2.0}
+                with gr.Row():
+                    profile_mode = gr.Dropdown(choices=list(PROFILE_MODES), value=profiling["mode"],
+                                               label="Profilatura")
+                    profile_threshold = gr.Number(value=profiling["threshold"], minimum=0,
+                                                  label="Soglia time-to-paste (s)")
+                    profile_apply_btn = gr.Button("Applica")
+                profile_status = gr.Textbox(label="Stato profilatura", interactive=False)
+                profiles_table = gr.Dataframe(value=get_profiles, label=f"Profili salvati ({PROFILE_DIR})",
+                                              interactive=False)
+                profile_file = gr.File(label="Profilo selezionato", interactive=False)
+
+                def select_profile_row(evt: gr.SelectData):
+                    path = os.path.join(PROFILE_DIR, evt.row_value[-1])
+                    return path if os.path.exists(path) else None
+
+                profile_apply_btn.click(fn=set_profiling, inputs=[profile_mode, profile_threshold],
+                                        outputs=[profile_status])
+                profiles_table.select(fn=select_profile_row, inputs=[], outputs=[profile_file])
+                metrics_timer.tick(fn=get_profiles, inputs=[], outputs=[profiles_table])
+
+    return demo
 
-            # Auto-refresh every 2 seconds
-            timer = gr.Timer(value=2)
-            timer.tick(fn=get_logs, inputs=[], outputs=[log_console])
-            timer.tick(fn=get_process_status, inputs=[], outputs=[process_status])
 
 if __name__ == "__main__":
-    demo.launch(server_name="127.0.0.1")
+    # The dashboard has no log file of its own: vibeflow records go to the console
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)-8s] %(message)s",
+                        datefmt="%Y-%m-%d %H:%M:%S")
+    with timeline.step("build UI"):
+        demo = build_ui()
+    timeline.log()
+    # Profiles live outside gradio's temp dir: allow downloading them
+    demo.launch(server_name="127.0.0.1", allowed_paths=[PROFILE_DIR])
@@ -0,0 +1,73 @@
+import re
+
+# Average characters per token for Italian text with Llama/DeepSeek tokenizers.
+# We have no tokenizer at hand, so budgets are computed from this estimate.
+CHARS_PER_TOKEN = 3.5
+
+# Output/input token ratio per profile. "confidential" only cleans the text and
+# should come back roughly as long as it went in; "formal" and "technical" may add
+# greetings, paragraphs and list markup.
+DEFAULT_OUTPUT_RATIOS = {
+    "confidential": 1.3,
+    "formal": 2.0,
+    "technical": 2.2,
+}
+FALLBACK_OUTPUT_RATIO = 1.8
+
+# Trailing chatter that means the model stopped rewriting and started talking to
+# the user. Only matched at the start of a line, after some real output.
+STOP_PATTERNS = [
+    re.compile(r"\n\s*(?:Nota|N\.B\.|Note|Spiegazione|Risposta)\s*:", re.IGNORECASE),
+    re.compile(r"\n\s*(?:Spero (?:che|di)|Fammi sapere|Se hai bisogno|Se vuoi|Posso aiutarti)", re.IGNORECASE),
+    re.compile(r"\n\s*(?:Ecco (?:il|la|una) (?:testo|versione))", re.IGNORECASE),
+]
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count of `text` (no tokenizer required)."""
+    return max(1, int(len(text) / CHARS_PER_TOKEN + 0.5))
+
+
+class GenerationBudget:
+    """Output budget for one rewrite, derived from input length and profile.
+
+    `max_tokens` is sent to the server as a hard cap. While streaming,
+    `check()` is called with the text produced so far and returns a reason
+    string when generation should be cut short:
+
+    - "length": output is already longer than the budget allows (some servers
+      ignore max_tokens),
+    - "stop pattern": the model started commenting on its own output,
+    - "repetition": the same line is being repeated.
+    """
+
+    def __init__(self, text: str, vibe: str, ratio: float | None = None,
+                 cap: int = 2048, slack: int = 64):
+        self.input_tokens = estimate_tokens(text)
+        self.ratio = ratio if ratio is not None else DEFAULT_OUTPUT_RATIOS.get(vibe, FALLBACK_OUTPUT_RATIO)
+        self.max_tokens = max(slack, min(cap, int(self.input_tokens * self.ratio) + slack))
+
+    def check(self, output: str) -> str | None:
+        if estimate_tokens(output) > self.max_tokens:
+            return "length"
+        tail = output[-300:]
+        for pattern in STOP_PATTERNS:
+            if pattern.search(tail):
+                return "stop pattern"
+        if output.endswith("\n"):
+            lines = [line.strip() for line in output.rstrip("\n").split("\n")[-3:]]
+            if len(lines) == 3 and len(lines[0]) >= 20 and lines[0] == lines[1] == lines[2]:
+                return "repetition"
+        return None
+
+    def trim(self, output: str, reason: str) -> str:
+        """Drop the part of `output` that triggered an early stop."""
+        if reason == "stop pattern":
+            for pattern in STOP_PATTERNS:
+                match = pattern.search(output)
+                if match:
+                    output = output[:match.start()]
+        elif reason == "repetition":
+            lines = output.rstrip("\n").split("\n")
+            output = "\n".join(lines[:-2])
+        return output.strip()
@@ -0,0 +1,308 @@
+"""Local dictation history: SQLite with a full-text index over raw and final text.
+
+Records are queued by the pipeline and written in batches by a background
+thread, so a dictation never waits on the disk. Optionally the audio is kept
+too, compressed to FLAC or Opus, within count/age/size limits.
+"""
+import os
+import time
+import queue
+import shutil
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger("vibeflow")
+
+AUDIO_FORMATS = {
+    "flac": ("flac", {"format": "FLAC"}),
+    "opus": ("ogg", {"format": "OGG", "subtype": "OPUS"}),
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dictations (
+    id INTEGER PRIMARY KEY,
+    created_at REAL NOT NULL,
+    trace_id TEXT,
+    vibe TEXT,
+    provider TEXT,
+    raw_text TEXT NOT NULL,
+    final_text TEXT,
+    parent_id INTEGER,
+    audio_path TEXT,
+    audio_bytes INTEGER,
+    audio_seconds REAL
+);
+CREATE INDEX IF NOT EXISTS dictations_created ON dictations(created_at);
+"""
+
+# External-content FTS5 index kept in sync by triggers
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS dictations_fts USING fts5(
+    raw_text, final_text, content='dictations', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS dictations_ai AFTER INSERT ON dictations BEGIN
+    INSERT INTO dictations_fts(rowid, raw_text, final_text) VALUES (new.id, new.raw_text, new.final_text);
+END;
+CREATE TRIGGER IF NOT EXISTS dictations_ad AFTER DELETE ON dictations BEGIN
+    INSERT INTO dictations_fts(dictations_fts, rowid, raw_text, final_text)
+    VALUES ('delete', old.id, old.raw_text, old.final_text);
+END;
+"""
+
+_COLUMNS = ("id", "created_at", "trace_id", "vibe", "provider", "raw_text", "final_text", "parent_id",
+            "audio_path", "audio_seconds")
+
+
+def _fts_query(text: str) -> str:
+    """Every word must match, as a prefix; quotes make FTS5 syntax characters literal."""
+    return " ".join('"' + word.replace('"', '""') + '"*' for word in text.split())
+
+
+class DictationHistory:
+    """Dictation history in SQLite.
+
+    `record()` only enqueues: a writer thread collects records for up to
+    `batch_window` seconds and stores them in one transaction (encoding the
+    audio first, when kept). Reads use their own connection.
+    """
+
+    def __init__(self, path: str = "vibeflow_history.db", audio_format: str = "off",
+                 audio_dir: str | None = None, max_entries: int = 5000, audio_max_days: float = 30,
+                 audio_max_mb: float = 500, batch_window: float = 0.5):
+        if audio_format not in ("off", *AUDIO_FORMATS):
+            raise ValueError(f"History audio format '{audio_format}' not supported. "
+                             f"Use off, {', '.join(AUDIO_FORMATS)}")
+        self.path = path
+        self.audio_format = audio_format
+        self.audio_dir = audio_dir or os.path.join(os.path.dirname(os.path.abspath(path)), "history_audio")
+        self.max_entries = max_entries
+        self.audio_max_days = audio_max_days
+        self.audio_max_mb = audio_max_mb
+        self.batch_window = batch_window
+        if self.keep_audio:
+            os.makedirs(self.audio_dir, exist_ok=True)
+
+        self._read_lock = threading.Lock()
+        self._reader = self._connect()
+        self.fts = self._create_schema(self._reader)
+        self._queue: queue.Queue = queue.Queue()
+        self._last: dict | None = None  # Newest recorded entry; its id is set once written
+        self._written = threading.Condition()  # Notified after each batch is written
+        self._writer = threading.Thread(target=self._write_loop, name="history-writer", daemon=True)
+        self._writer.start()
+
+    @property
+    def keep_audio(self) -> bool:
+        return self.audio_format != "off"
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        # WAL: main.py and the dashboard can read while the other one writes
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @staticmethod
+    def _create_schema(conn: sqlite3.Connection) -> bool:
+        conn.executescript(_SCHEMA)
+        try:
+            conn.executescript(_FTS_SCHEMA)
+            return True
+        except sqlite3.OperationalError as e:
+            logger.warning(f"SQLite without FTS5 ({e}): history search falls back to LIKE")
+            return False
+
+    # --- Writing ----------------------------------------------------------
+
+    def stash_audio(self, audio_file: str) -> str | None:
+        """Keep a copy of a WAV that STT is about to delete; the writer thread
+        compresses it. Returns the copy's path, or None if audio is not kept."""
+        if not self.keep_audio or not audio_file:
+            return None
+        pending = os.path.join(self.audio_dir, os.path.basename(audio_file) + ".pending")
+        try:
+            try:
+                os.link(audio_file, pending)  # Same volume: no data copied
+            except OSError:
+                shutil.copyfile(audio_file, pending)
+        except OSError as e:
+            logger.warning(f"History: could not keep audio ({e})")
+            return None
+        return pending
+
+    def record(self, raw_text: str, final_text: str, vibe: str, provider: str | None = None,
+               trace_id: str | None = None, parent_id: int | None = None, audio_file: str | None = None) -> None:
+        """Queue a dictation for writing (returns immediately)."""
+        entry = {"id": None, "created_at": time.time(), "trace_id": trace_id, "vibe": vibe, "provider": provider,
+                 "raw_text": raw_text, "final_text": final_text, "parent_id": parent_id,
+                 "audio_path": None, "audio_bytes": None, "audio_seconds": None}
+        with self._written:
+            self._last = entry  # The writer fills in its id
+        self._queue.put((entry, audio_file))
+
+    def flush(self, timeout: float | None = None) -> None:
+        """Wait until everything recorded so far is written."""
+        done = threading.Event()
+        self._queue.put((None, done))
+        done.wait(timeout)
+
+    def close(self) -> None:
+        self.flush(timeout=10)
+
+    def _write_loop(self) -> None:
+        conn = self._connect()
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.batch_window
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            entries = [(entry, audio) for entry, audio in batch if entry is not None]
+            try:
+                if entries:
+                    self._write_batch(conn, entries)
+                    self._enforce_retention(conn)
+            except Exception as e:
+                logger.error(f"History write failed: {e}", exc_info=True)
+            with self._written:
+                if any(entry is self._last and entry["id"] is None for entry, _ in entries):
+                    self._last = None  # Never written: latest() falls back to the database
+                self._written.notify_all()
+            for entry, done in batch:
+                if entry is None:
+                    done.set()
+
+    def _write_batch(self, conn: sqlite3.Connection, entries: list) -> None:
+        start = time.perf_counter()
+        for entry, pending in entries:
+            if pending:
+                entry.update(self._encode_audio(pending, entry))
+        with conn:
+            for entry, _ in entries:
+                entry["id"] = conn.execute(
+                    "INSERT INTO dictations (created_at, trace_id, vibe, provider, raw_text, final_text, parent_id,"
+                    " audio_path, audio_bytes, audio_seconds) VALUES (:created_at, :trace_id, :vibe, :provider,"
+                    " :raw_text, :final_text, :parent_id, :audio_path, :audio_bytes, :audio_seconds)",
+                    entry).lastrowid
+        logger.debug(f"History: wrote {len(entries)} dictation(s) in {time.perf_counter() - start:.3f}s")
+
+    def _encode_audio(self, pending: str, entry: dict) -> dict:
+        import soundfile as sf
+        extension, options = AUDIO_FORMATS[self.audio_format]
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(entry["created_at"]))
+        target = os.path.join(self.audio_dir, f"{stamp}_{entry['trace_id'] or 'dictation'}.{extension}")
+        try:
+            data, sample_rate = sf.read(pending, dtype="int16")
+            sf.write(target, data, sample_rate, **options)
+            return {"audio_path": target, "audio_bytes": os.path.getsize(target),
+                    "audio_seconds": len(data) / sample_rate}
+        except Exception as e:
+            logger.warning(f"History: could not keep audio ({e})")
+            return {}
+        finally:
+            try:
+                os.remove(pending)
+            except OSError:
+                pass
+
+    def _enforce_retention(self, conn: sqlite3.Connection) -> None:
+        drop_audio = []
+        with conn:
+            if self.max_entries > 0:
+                old = conn.execute("SELECT id, audio_path FROM dictations WHERE id <= "
+                                   "(SELECT id FROM dictations ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                                   (self.max_entries,)).fetchall()
+                if old:
+                    conn.execute("DELETE FROM dictations WHERE id <= ?", (old[-1]["id"],))
+                    drop_audio += [row["audio_path"] for row in old if row["audio_path"]]
+            if self.keep_audio:
+                expired = []
+                if self.audio_max_days > 0:
+                    cutoff = time.time() - self.audio_max_days * 86400
+                    expired += conn.execute("SELECT id, audio_path FROM dictations WHERE audio_path IS NOT NULL "
+                                            "AND created_at < ?", (cutoff,)).fetchall()
+                if self.audio_max_mb > 0:
+                    budget = self.audio_max_mb * 1024 * 1024
+                    for row in conn.execute("SELECT id, audio_path, audio_bytes FROM dictations "
+                                            "WHERE audio_path IS NOT NULL ORDER BY id DESC"):
+                        budget -= row["audio_bytes"] or 0
+                        if budget < 0:
+                            expired.append(row)
+                if expired:
+                    conn.executemany("UPDATE dictations SET audio_path = NULL, audio_bytes = NULL WHERE id = ?",
+                                     [(row["id"],) for row in expired])
+                    drop_audio += [row["audio_path"] for row in expired]
+        for path in set(drop_audio):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        if drop_audio:
+            logger.info(f"History retention: removed {len(set(drop_audio))} audio file(s)")
+
+    # --- Reading ----------------------------------------------------------
+
+    def _query(self, sql: str, params: tuple = ()) -> list[dict]:
+        with self._read_lock:
+            return [dict(row) for row in self._reader.execute(sql, params).fetchall()]
+
+    def recent(self, limit: int = 50) -> list[dict]:
+        return self._query(f"SELECT {', '.join(_COLUMNS)} FROM dictations ORDER BY id DESC LIMIT ?", (limit,))
+
+    def search(self, text: str, limit: int = 50) -> list[dict]:
+        """Dictations whose raw or final text contains every word of `text` (newest first)."""
+        if not text.strip():
+            return self.recent(limit)
+        columns = ", ".join(f"d.{c}" for c in _COLUMNS)
+        if self.fts:
+            return self._query(f"SELECT {columns} FROM dictations_fts f JOIN dictations d ON d.id = f.rowid "
+                               "WHERE dictations_fts MATCH ? ORDER BY d.id DESC LIMIT ?",
+                               (_fts_query(text), limit))
+        pattern = f"%{text.strip()}%"
+        return self._query(f"SELECT {columns} FROM dictations d WHERE d.raw_text LIKE ? OR d.final_text LIKE ? "
+                           "ORDER BY d.id DESC LIMIT ?", (pattern, pattern, limit))
+
+    def get(self, entry_id: int) -> dict | None:
+        rows = self._query(f"SELECT {', '.join(_COLUMNS)} FROM dictations WHERE id = ?", (entry_id,))
+        return rows[0] if rows else None
+
+    @property
+    def pending(self) -> bool:
+        """True while the newest recorded dictation has not been written yet."""
+        last = self._last
+        return last is not None and last["id"] is None
+
+    def latest(self, timeout: float = 2.0) -> dict | None:
+        """The newest dictation. One recorded but not yet written is waited for (up
+        to `timeout` seconds, usually one batch window), so the entry always has
+        its id; None if it is still pending after that (see `pending`)."""
+        with self._written:
+            if not self._written.wait_for(lambda: not self.pending, timeout):
+                return None
+            last = self._last
+        if last is not None:
+            return last
+        rows = self.recent(1)
+        return rows[0] if rows else None
+
+
+def history_from_env() -> DictationHistory | None:
+    """History configured by VIBEFLOW_HISTORY_* (None when VIBEFLOW_HISTORY_PATH is empty)."""
+    path = os.getenv("VIBEFLOW_HISTORY_PATH", "./vibeflow_history.db").strip()
+    if not path:
+        return None
+    return DictationHistory(
+        path,
+        audio_format=os.getenv("VIBEFLOW_HISTORY_AUDIO", "off").strip().lower(),
+        audio_dir=os.getenv("VIBEFLOW_HISTORY_AUDIO_DIR") or None,
+        max_entries=int(os.getenv("VIBEFLOW_HISTORY_MAX_ENTRIES", "5000")),
+        audio_max_days=float(os.getenv("VIBEFLOW_HISTORY_AUDIO_DAYS", "30")),
+        audio_max_mb=float(os.getenv("VIBEFLOW_HISTORY_AUDIO_MAX_MB", "500")),
+    )
@@ -0,0 +1,309 @@
+"""LLM backends behind a single interface.
+
+LLMService talks to every provider through an `LLMBackend`. Two implementations
+are available, selected with LLM_BACKEND in .env:
+
+- "openai": raw OpenAI SDK (default, lowest overhead),
+- "agno":   Agno agents, one per profile, built once and reused.
+
+Both expose the same sync/async and streaming methods. Clients, HTTP pools and
+agents are created once per backend and reused across calls.
+
+The openai/httpx imports (~0.6s) are deferred to the first backend creation so
+importing this module at startup stays cheap.
+"""
+import time
+import logging
+import threading
+from typing import AsyncIterator, Iterator
+from prompts import chat_messages
+
+logger = logging.getLogger("vibeflow")
+
+SUPPORTED_BACKENDS = ("openai", "agno")
+
+
+class HttpSettings:
+    """Timeouts and pool sizes for the HTTP clients of a backend."""
+
+    def __init__(self, connect_timeout: float = 5.0, read_timeout: float = 60.0,
+                 max_connections: int = 4, max_keepalive: int = 2,
+                 keepalive_expiry: float = 30.0, max_retries: int = 2):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self.max_retries = max_retries
+
+    def _timeout(self) -> "httpx.Timeout":
+        import httpx
+        return httpx.Timeout(self.read_timeout, connect=self.connect_timeout)
+
+    def _limits(self) -> "httpx.Limits":
+        import httpx
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    def build_sync(self) -> "httpx.Client":
+        from openai import DefaultHttpxClient
+        return DefaultHttpxClient(timeout=self._timeout(), limits=self._limits())
+
+    def build_async(self) -> "httpx.AsyncClient":
+        from openai import DefaultAsyncHttpxClient
+        return DefaultAsyncHttpxClient(timeout=self._timeout(), limits=self._limits())
+
+
+class Completion:
+    """A complete response, or one piece of a streamed response."""
+
+    __slots__ = ("text", "finish_reason", "usage")
+
+    def __init__(self, text: str = "", finish_reason: str | None = None, usage=None):
+        self.text = text
+        self.finish_reason = finish_reason
+        self.usage = usage  # Token usage object, when the backend reports it
+
+
+class LLMBackend:
+    """Common interface of the LLM backends.
+
+    Every call takes the profile's stable system prefix and the variable user
+    message (see prompts.py). Streaming methods are generators: closing them
+    (or breaking out of the loop) closes the underlying HTTP stream.
+    """
+
+    kind = "base"
+
+    def __init__(self, name: str, base_url: str, api_key: str, model_id: str,
+                 http: HttpSettings | None = None, temperature: float = 0.3,
+                 stream_usage: bool = True):
+        self.name = name
+        self.base_url = base_url
+        self.api_key = api_key
+        self.model_id = model_id
+        self.http = http or HttpSettings()
+        self.temperature = temperature
+        self.stream_usage = stream_usage
+        from openai import OpenAI
+        # Plain client used for pings by every backend kind
+        self.client = OpenAI(base_url=base_url, api_key=api_key,
+                             http_client=self.http.build_sync(),
+                             max_retries=self.http.max_retries)
+
+    def ping(self) -> None:
+        """Send the cheapest request that keeps the backend warm.
+
+        LMStudio unloads idle models, so we need a real (1-token) completion to keep
+        the weights in memory. For DeepSeek listing models is free and is enough to
+        keep the pooled TLS connection open.
+        """
+        if self.name == "lmstudio":
+            self.client.chat.completions.create(
+                model=self.model_id,
+                messages=[{"role": "user", "content": "ok"}],
+                max_tokens=1,
+                temperature=0.0,
+            )
+        else:
+            self.client.models.list()
+
+    def complete(self, system_prefix: str, user_message: str, max_tokens: int) -> Completion:
+        raise NotImplementedError
+
+    def stream(self, system_prefix: str, user_message: str, max_tokens: int) -> Iterator[Completion]:
+        raise NotImplementedError
+
+    async def acomplete(self, system_prefix: str, user_message: str, max_tokens: int) -> Completion:
+        raise NotImplementedError
+
+    def astream(self, system_prefix: str, user_message: str, max_tokens: int) -> AsyncIterator[Completion]:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        self.client.close()
+
+
+class OpenAIBackend(LLMBackend):
+    """Backend on the raw OpenAI SDK (sync + async clients, both pooled)."""
+
+    kind = "openai"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._async_client: "AsyncOpenAI | None" = None
+
+    @property
+    def async_client(self) -> "AsyncOpenAI":
+        # Created lazily: only long-text mode and the benchmarks use it
+        if self._async_client is None:
+            from openai import AsyncOpenAI
+            self._async_client = AsyncOpenAI(base_url=self.base_url, api_key=self.api_key,
+                                             http_client=self.http.build_async(),
+                                             max_retries=self.http.max_retries)
+        return self._async_client
+
+    def _stream_kwargs(self) -> dict:
+        # Usage on the last chunk (cached prompt tokens)
+        return {"stream_options": {"include_usage": True}} if self.stream_usage else {}
+
+    def complete(self, system_prefix: str, user_message: str, max_tokens: int) -> Completion:
+        response = self.client.chat.completions.create(
+            model=self.model_id,
+            messages=chat_messages(system_prefix, user_message),
+            temperature=self.temperature,
+            max_tokens=max_tokens,
+        )
+        choice = response.choices[0]
+        return Completion(choice.message.content or "", choice.finish_reason, response.usage)
+
+    def stream(self, system_prefix: str, user_message: str, max_tokens: int) -> Iterator[Completion]:
+        stream = self.client.chat.completions.create(
+            model=self.model_id,
+            messages=chat_messages(system_prefix, user_message),
+            temperature=self.temperature,
+            max_tokens=max_tokens,
+            stream=True,
+            **self._stream_kwargs(),
+        )
+        try:
+            for chunk in stream:
+                choice = chunk.choices[0] if chunk.choices else None
+                yield Completion(
+                    (choice.delta.content or "") if choice else "",
+                    choice.finish_reason if choice else None,
+                    chunk.usage,
+                )
+        finally:
+            stream.close()  # Closes the HTTP response, freeing the connection
+
+    async def acomplete(self, system_prefix: str, user_message: str, max_tokens: int) -> Completion:
+        response = await self.async_client.chat.completions.create(
+            model=self.model_id,
+            messages=chat_messages(system_prefix, user_message),
+            temperature=self.temperature,
+            max_tokens=max_tokens,
+        )
+        choice = response.choices[0]
+        return Completion(choice.message.content or "", choice.finish_reason, response.usage)
+
+    async def astream(self, system_prefix: str, user_message: str, max_tokens: int) -> AsyncIterator[Completion]:
+        stream = await self.async_client.chat.completions.create(
+            model=self.model_id,
+            messages=chat_messages(system_prefix, user_message),
+            temperature=self.temperature,
+            max_tokens=max_tokens,
+            stream=True,
+            **self._stream_kwargs(),
+        )
+        try:
+            async for chunk in stream:
+                choice = chunk.choices[0] if chunk.choices else None
+                yield Completion(
+                    (choice.delta.content or "") if choice else "",
+                    choice.finish_reason if choice else None,
+                    chunk.usage,
+                )
+        finally:
+            await stream.close()
+
+    def close(self) -> None:
+        super().close()
+        # The async client belongs to the service's event loop and is closed with it
+
+
+class AgnoBackend(LLMBackend):
+    """Backend on Agno agents: one Agent per profile prefix, built once and reused.
+
+    Agno configures max_tokens on the model, not per call, so the model is
+    created with the service's token cap; the per-rewrite budget is enforced
+    client-side by closing the stream early. Agno keeps a single `http_client`
+    for either sync or async use, so the model relies on Agno's shared pooled
+    clients and only gets the read timeout.
+    """
+
+    kind = "agno"
+
+    def __init__(self, *args, max_tokens: int = 2048, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Lazy imports: agno is only required when LLM_BACKEND=agno
+        if self.name == "lmstudio":
+            from agno.models.lmstudio import LMStudio
+            self.model = LMStudio(id=self.model_id, base_url=self.base_url, name="LMStudio",
+                                  temperature=self.temperature, max_tokens=max_tokens,
+                                  timeout=self.http.read_timeout, max_retries=self.http.max_retries)
+        else:
+            from agno.models.deepseek import DeepSeek
+            self.model = DeepSeek(id=self.model_id, api_key=self.api_key, base_url=self.base_url,
+                                  temperature=self.temperature, max_tokens=max_tokens,
+                                  timeout=self.http.read_timeout, max_retries=self.http.max_retries)
+        self._agents = {}
+        self._agents_lock = threading.Lock()
+
+    def agent(self, system_prefix: str):
+        """Return the Agent for a profile prefix, creating it on first use."""
+        agent = self._agents.get(system_prefix)
+        if agent is None:
+            from agno.agent import Agent
+            with self._agents_lock:
+                agent = self._agents.get(system_prefix)
+                if agent is None:
+                    # markdown=False: the profile prompts already say when Markdown is
+                    # allowed, and Agno's generic hint would contradict "confidential".
+                    # telemetry=False: Agno otherwise reports every run over the network,
+                    # which costs ~50 ms per call and leaks usage data.
+                    agent = Agent(model=self.model, instructions=system_prefix, markdown=False,
+                                  telemetry=False)
+                    self._agents[system_prefix] = agent
+        return agent
+
+    def complete(self, system_prefix: str, user_message: str, max_tokens: int) -> Completion:
+        response = self.agent(system_prefix).run(user_message)
+        return Completion(response.content or "", None, getattr(response, "metrics", None))
+
+    def stream(self, system_prefix: str, user_message: str, max_tokens: int) -> Iterator[Completion]:
+        events = self.agent(system_prefix).run(user_message, stream=True)
+        try:
+            for event in events:
+                content = getattr(event, "content", None)
+                if isinstance(content, str) and content:
+                    yield Completion(content)
+        finally:
+            close = getattr(events, "close", None)
+            if close:
+                close()
+
+    async def acomplete(self, system_prefix: str, user_message: str, max_tokens: int) -> Completion:
+        response = await self.agent(system_prefix).arun(user_message)
+        return Completion(response.content or "", None, getattr(response, "metrics", None))
+
+    async def astream(self, system_prefix: str, user_message: str, max_tokens: int) -> AsyncIterator[Completion]:
+        events = self.agent(system_prefix).arun(user_message, stream=True)
+        try:
+            async for event in events:
+                content = getattr(event, "content", None)
+                if isinstance(content, str) and content:
+                    yield Completion(content)
+        finally:
+            aclose = getattr(events, "aclose", None)
+            if aclose:
+                await aclose()
+
+
+def create_backend(kind: str, name: str, base_url: str, api_key: str, model_id: str,
+                   http: HttpSettings | None = None, max_tokens: int = 2048,
+                   stream_usage: bool = True) -> LLMBackend:
+    """Build the backend `kind` ("openai" or "agno") for provider `name`."""
+    start = time.perf_counter()
+    if kind == "openai":
+        backend = OpenAIBackend(name, base_url, api_key, model_id, http, stream_usage=stream_usage)
+    elif kind == "agno":
+        backend = AgnoBackend(name, base_url, api_key, model_id, http, stream_usage=stream_usage,
+                              max_tokens=max_tokens)
+    else:
+        raise ValueError(f"LLM backend '{kind}' not supported. Use one of: {', '.join(SUPPORTED_BACKENDS)}")
+    logger.debug(f"{kind} backend for {name} created in {time.perf_counter() - start:.3f}s")
+    return backend
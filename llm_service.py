@@ -1,75 +1,831 @@
 import os
-import json
+import time
+import asyncio
 import logging
-from openai import OpenAI
+import contextvars
+import threading
+from collections import deque
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, TimeoutError as FutureTimeout
+from circuit_breaker import CircuitBreaker
+from generation_budget import GenerationBudget
+from text_chunking import TextChunk, split_text, reassemble
+from prompts import build_user_message
+from profiles import Profile, read_profiles
+from llm_backends import LLMBackend, HttpSettings, SUPPORTED_BACKENDS, create_backend
+from cancellation import CancellationToken, PipelineCancelled
+from metrics import span, observe
 
 logger = logging.getLogger("vibeflow")
 
+SUPPORTED_PROVIDERS = ("lmstudio", "deepseek")
+
+# How often blocking waits wake up to check a cancellation token (seconds)
+CANCEL_POLL_INTERVAL = 0.05
+
+
+def _cached_prompt_tokens(usage) -> int | None:
+    """Extract the number of prompt tokens served from cache, if the backend reports it.
+
+    OpenAI-style servers (LM Studio) use usage.prompt_tokens_details.cached_tokens,
+    DeepSeek reports usage.prompt_cache_hit_tokens.
+    """
+    if usage is None:
+        return None
+    hit = getattr(usage, "prompt_cache_hit_tokens", None)
+    if hit is not None:
+        return hit
+    details = getattr(usage, "prompt_tokens_details", None)
+    return getattr(details, "cached_tokens", None) if details is not None else None
+
+
+def _format_cache_info(usage) -> str:
+    cached = _cached_prompt_tokens(usage)
+    if cached is None or usage is None:
+        return ""
+    return f", cached {cached}/{usage.prompt_tokens} prompt tokens"
+
+
+class RequestCancelled(Exception):
+    """Raised inside a provider call when its result is no longer wanted."""
+
+
+class _Provider:
+    """One configured provider: its backend, latency history and circuit breaker."""
+
+    def __init__(self, backend: LLMBackend, breaker: CircuitBreaker):
+        self.backend = backend
+        self.name = backend.name
+        self.model_id = backend.model_id
+        self.breaker = breaker
+        self.latencies: deque[float] = deque(maxlen=50)
+        self.last_request_at: float | None = None
+
+    def latency_percentile(self, pct: float) -> float | None:
+        """Return the `pct` percentile of recent successful latencies (None if too few samples)."""
+        if len(self.latencies) < 5:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+        return ordered[index]
+
+
+# Settings LLMService.prepare_settings() can apply to a running service; the
+# others (backend kind, timeouts, pool sizes, breakers) need a restart
+RELOADABLE_SETTINGS = (
+    "LLM_PROVIDER", "LLM_PROVIDERS", "LMSTUDIO_BASE_URL", "LMSTUDIO_MODEL_ID", "DEEPSEEK_API_KEY",
+    "DEEPSEEK_BASE_URL", "LLM_KEEPALIVE_INTERVAL", "LLM_HEDGE_PERCENTILE", "LLM_HEDGE_DELAY",
+    "LLM_WARMUP_PROFILES", "LLM_MAX_TOKENS", "LLM_CHUNK_THRESHOLD", "LLM_CHUNK_SIZE", "LLM_CHUNK_CONCURRENCY",
+)
+
+
+def _provider_names_from_env(env: Mapping[str, str] | None = None) -> list[str]:
+    """Configured providers, primary first (from `env`, default os.environ).
+
+    LLM_PROVIDERS enables multi-provider mode ("lmstudio,deepseek"): the first
+    entry is the primary, the others are hedging/failover targets.
+    """
+    env = os.environ if env is None else env
+    names = env.get("LLM_PROVIDERS", "").strip()
+    if names:
+        provider_names = [n.strip().lower() for n in names.split(",") if n.strip()]
+    else:
+        provider_names = [env.get("LLM_PROVIDER", "lmstudio")]
+    for name in provider_names:
+        if name not in SUPPORTED_PROVIDERS:
+            raise ValueError(f"Provider '{name}' not supported. Use 'lmstudio' or 'deepseek'")
+    return list(dict.fromkeys(provider_names))
+
+
+def _provider_endpoint(name: str, env: Mapping[str, str] | None = None) -> tuple[str, str, str]:
+    """(base_url, api_key, model_id) of a provider, from `env` (default os.environ)."""
+    env = os.environ if env is None else env
+    if name == "lmstudio":
+        return (env.get("LMSTUDIO_BASE_URL", "http://127.0.0.1:1234/v1"), "lm-studio",
+                env.get("LMSTUDIO_MODEL_ID", "meta-llama-3.1-8b-instruct"))
+    api_key = env.get("DEEPSEEK_API_KEY")
+    if not api_key:
+        raise ValueError("DEEPSEEK_API_KEY not set. Please set it in .env file")
+    return env.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com"), api_key, "deepseek-chat"
+
 
 class LLMService:
     def __init__(self):
         """Initialize LLM service with configuration from environment variables."""
-        self.provider = os.getenv("LLM_PROVIDER", "lmstudio")
-
-        if self.provider == "lmstudio":
-            base_url = os.getenv("LMSTUDIO_BASE_URL", "http://127.0.0.1:1234/v1")
-            self.model_id = os.getenv("LMSTUDIO_MODEL_ID", "meta-llama-3.1-8b-instruct")
-            self.client = OpenAI(base_url=base_url, api_key="lm-studio")
-            logger.info(f"Using LMStudio at {base_url} with model {self.model_id}")
-
-        elif self.provider == "deepseek":
-            api_key = os.getenv("DEEPSEEK_API_KEY")
-            if not api_key:
-                raise ValueError("DEEPSEEK_API_KEY not set. Please set it in .env file")
-            self.client = OpenAI(base_url="https://api.deepseek.com", api_key=api_key)
-            self.model_id = "deepseek-chat"
-            logger.info("Using DeepSeek cloud API")
+        provider_names = _provider_names_from_env()
 
-        else:
-            raise ValueError(f"Provider '{self.provider}' not supported. Use 'lmstudio' or 'deepseek'")
+        # Backend implementation: "openai" (raw SDK) or "agno" (reusable agents)
+        self.backend_kind = os.getenv("LLM_BACKEND", "openai").strip().lower()
+        if self.backend_kind not in SUPPORTED_BACKENDS:
+            raise ValueError(f"LLM_BACKEND '{self.backend_kind}' not supported. "
+                             f"Use one of: {', '.join(SUPPORTED_BACKENDS)}")
 
-        profiles_path = os.getenv("PROFILES_PATH", "./profiles.json")
-        with open(profiles_path, "r", encoding="utf-8") as f:
-            raw = json.load(f)
-        self.PROFILES = {name: data["system_prompt"] for name, data in raw.items()}
+        # HTTP client tuning: explicit timeouts and a small persistent pool so the
+        # TLS/TCP connection survives between dictations.
+        self.connect_timeout = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+        self.read_timeout = float(os.getenv("LLM_READ_TIMEOUT", "60"))
+        self.pool_max_connections = int(os.getenv("LLM_POOL_MAX_CONNECTIONS", "4"))
+        self.pool_max_keepalive = int(os.getenv("LLM_POOL_MAX_KEEPALIVE", "2"))
+        self.breaker_failures = int(os.getenv("LLM_BREAKER_FAILURES", "3"))
+        self.breaker_cooldown = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+        # Ask for token usage on streamed responses (cached prompt tokens)
+        self.stream_usage = os.getenv("LLM_STREAM_USAGE", "1") == "1"
+        # Rewrites that may run at the same time (>1 only in server mode)
+        self.parallel_requests = max(1, int(os.getenv("LLM_PARALLEL_REQUESTS", "1")))
+        self._apply_tunables(self._read_tunables())
 
-    def rewrite_text(self, text: str, vibe: str) -> str:
-        if not text:
-            return ""
+        # With a fallback available we'd rather fail over than let the SDK retry
+        self._max_retries = 0 if len(provider_names) > 1 else 2
+        with span("llm_client_init"):
+            self._set_providers([self._create_provider(name) for name in provider_names])
 
-        if vibe not in self.PROFILES:
-            vibe = "confidential"
+        self.profiles_path = os.getenv("PROFILES_PATH", "./profiles.json")
+        self._set_profiles(self.prepare_profiles())
 
-        logger.info(f"Rewriting text with vibe: {vibe}...")
+        # Cumulative early-stopping statistics (see get_generation_stats)
+        self._stats_lock = threading.Lock()
+        self.generation_stats = {
+            "requests": 0,
+            "early_stops": 0,
+            "budget_hits": 0,
+            "tokens_cut": 0,
+            "seconds_cut": 0.0,
+        }
+
+        # Providers outside LLM_PROVIDERS, created on demand by rewrite_with
+        self._extra_providers: dict[str, _Provider] = {}
+
+        self._keepalive_stop = threading.Event()
+        self._keepalive_thread: threading.Thread | None = None
+        # Re-warms after a profile reload run one at a time
+        self._warmup_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="llm-prefix-warmup")
 
-        system_prompt = self.PROFILES[vibe]
+        # Event loop for the async client, started on first long-text rewrite
+        self._loop: asyncio.AbstractEventLoop | None = None  # Shared by all backends
+        self._loop_lock = threading.Lock()
 
-        # User prompt adattato al vibe
-        if vibe == "confidential":
-            user_prompt = (
-                "Pulisci il seguente testo secondo le tue istruzioni. "
-                "Stampa SOLO il testo pulito, nient'altro.\n\n"
-                f"TESTO:\n{text}"
+    @staticmethod
+    def _read_tunables(env: Mapping[str, str] | None = None) -> dict:
+        """Settings that can change on a running service (see prepare_settings)."""
+        env = os.environ if env is None else env
+        return {
+            # Seconds between keep-alive pings (0 disables the pinger)
+            "keepalive_interval": float(env.get("LLM_KEEPALIVE_INTERVAL", "240")),
+            # Hedging: send the request to the next provider when the primary has not
+            # answered within this percentile of its recent latencies.
+            "hedge_percentile": float(env.get("LLM_HEDGE_PERCENTILE", "95")),
+            "hedge_default_delay": float(env.get("LLM_HEDGE_DELAY", "3.0")),
+            # Warm the prompt cache with every profile prefix at startup
+            "warmup_profiles": env.get("LLM_WARMUP_PROFILES", "1") == "1",
+            # Upper bound for the length-proportional generation budget
+            "max_tokens_cap": int(env.get("LLM_MAX_TOKENS", "2048")),
+            # Long-text mode: transcripts longer than the threshold (chars, 0 disables)
+            # are split into chunks rewritten concurrently
+            "chunk_threshold": int(env.get("LLM_CHUNK_THRESHOLD", "2000")),
+            "chunk_size": int(env.get("LLM_CHUNK_SIZE", "800")),
+            "chunk_concurrency": int(env.get("LLM_CHUNK_CONCURRENCY", "3")),
+        }
+
+    def _apply_tunables(self, tunables: dict) -> None:
+        for name, value in tunables.items():
+            setattr(self, name, value)
+
+    def _set_providers(self, providers: list[_Provider]) -> None:
+        self.providers = providers
+        primary = providers[0]
+        # Kept for callers that only care about the primary backend (overlay icon, logs)
+        self.provider = primary.name
+        self.model_id = primary.model_id
+        if len(providers) > 1:
+            logger.info(
+                "Multi-provider mode: " + " -> ".join(p.name for p in providers)
+                + f" (hedge at p{self.hedge_percentile:.0f})"
             )
+        # Two slots per provider and concurrent rewrite, so a cancelled request that
+        # is still draining never delays the next one
+        workers = 2 * len(providers) * self.parallel_requests
+        executor = getattr(self, "_executor", None)
+        if executor is None or executor._max_workers < workers:
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="llm")
+            if executor is not None:
+                executor.shutdown(wait=False)
+
+    def _create_provider(self, name: str, max_retries: int | None = None,
+                         endpoint: tuple[str, str, str] | None = None) -> _Provider:
+        """Backend and circuit breaker for `name`. `max_retries` defaults to the current
+        policy, `endpoint` (base_url, api_key, model_id) to the one in os.environ."""
+        breaker = CircuitBreaker(name, self.breaker_failures, self.breaker_cooldown)
+        base_url, api_key, model_id = endpoint or _provider_endpoint(name)
+        if name == "lmstudio":
+            logger.info(f"Using LMStudio at {base_url} with model {model_id} ({self.backend_kind} backend)")
         else:
-            user_prompt = (
-                "Formatta il seguente testo secondo le tue istruzioni. "
-                "Stampa SOLO il testo formattato, senza commenti o spiegazioni. "
-                "Conserva TUTTE le informazioni del testo originale.\n\n"
-                f"TESTO:\n{text}"
-            )
+            logger.info(f"Using DeepSeek cloud API ({self.backend_kind} backend)")
+        if max_retries is None:
+            max_retries = self._max_retries
+        backend = create_backend(self.backend_kind, name, base_url, api_key, model_id,
+                                 http=self._http_settings(max_retries), max_tokens=self.max_tokens_cap,
+                                 stream_usage=self.stream_usage)
+        return _Provider(backend, breaker)
+
+    def prepare_profiles(self) -> dict[str, Profile]:
+        """Read and validate profiles.json for apply_profiles (raises on errors)."""
+        profiles = read_profiles(self.profiles_path)
+        for profile in profiles.values():
+            if profile.llm_provider and profile.llm_provider not in SUPPORTED_PROVIDERS:
+                raise ValueError(f"profile '{profile.name}': provider '{profile.llm_provider}' not supported. "
+                                 "Use 'lmstudio' or 'deepseek'")
+        return profiles
+
+    def _set_profiles(self, profiles: dict[str, Profile]) -> None:
+        self.profiles = profiles
+        self.default_profile = next(iter(profiles))
+        # Plain views kept for callers that only need prompts and prefixes
+        self.PROFILES = {name: p.system_prompt for name, p in profiles.items()}
+        self.PREFIXES = {name: p.prefix for name, p in profiles.items() if p.prefix is not None}
+
+    def apply_profiles(self, profiles: dict[str, Profile]) -> list[str]:
+        """Swap in profiles from prepare_profiles. Returns the names of new or changed
+        profiles; changed prompt prefixes are re-warmed in the background."""
+        changed = [name for name, profile in profiles.items() if self.profiles.get(name) != profile]
+        warm = [name for name in changed if profiles[name].prefix != getattr(self.profiles.get(name), "prefix", None)
+                and profiles[name].prefix is not None]
+        self._set_profiles(profiles)
+        if warm and self.warmup_profiles:
+            self._warmup_executor.submit(self._warm_up_prefixes, self.providers[0], warm)
+        return changed
+
+    def reload_profiles(self) -> list[str]:
+        return self.apply_profiles(self.prepare_profiles())
 
+    def prepare_settings(self, env: Mapping[str, str] | None = None) -> dict:
+        """Read provider settings from `env` (default os.environ) for apply_settings.
+
+        Validates everything and creates only the providers that are new or whose
+        endpoint changed; existing providers (and their HTTP pools) are reused.
+        Raises ValueError on invalid settings, leaving the service untouched.
+        Prepared settings that are not applied go to discard_settings.
+        """
+        tunables = self._read_tunables(env)
+        known = {p.name: p for p in self.providers}
+        for name, provider in self._extra_providers.items():
+            known.setdefault(name, provider)
+        names = _provider_names_from_env(env)
+        # New clients follow the same retry policy as at startup (existing ones keep theirs);
+        # it becomes the service's policy only in apply_settings
+        max_retries = 0 if len(names) > 1 else 2
+        providers, created = [], []
         try:
-            response = self.client.chat.completions.create(
-                model=self.model_id,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.3,  # Bassa per output più deterministico
-                max_tokens=2048
+            for name in names:
+                endpoint = _provider_endpoint(name, env)
+                provider = known.get(name)
+                backend = provider.backend if provider else None
+                if not backend or (backend.base_url, backend.api_key, backend.model_id) != endpoint:
+                    provider = self._create_provider(name, max_retries, endpoint)
+                    created.append(provider)
+                providers.append(provider)
+        except Exception:
+            self.discard_settings({"created": created})
+            raise
+        return {"tunables": tunables, "providers": providers, "created": created, "max_retries": max_retries}
+
+    @staticmethod
+    def discard_settings(settings: dict) -> None:
+        """Close the clients prepare_settings created for settings that will not be applied."""
+        for provider in settings["created"]:
+            provider.backend.close()
+
+    def apply_settings(self, settings: dict) -> None:
+        """Swap in the state returned by prepare_settings."""
+        self._apply_tunables(settings["tunables"])
+        self._max_retries = settings["max_retries"]
+        old = {p.name: p for p in self.providers}
+        self._set_providers(settings["providers"])
+        active = {p.name for p in self.providers}
+        with self._stats_lock:
+            for provider in settings["created"]:
+                replaced = old.get(provider.name) or self._extra_providers.get(provider.name)
+                if replaced is not None:
+                    replaced.backend.close()
+            # Providers dropped from the list stay available to rewrite_with
+            for name, provider in old.items():
+                if name not in active:
+                    self._extra_providers[name] = provider
+            for name in active:
+                self._extra_providers.pop(name, None)
+
+    def _http_settings(self, max_retries: int) -> HttpSettings:
+        """Timeouts and pool sizes shared by every provider's clients."""
+        return HttpSettings(
+            connect_timeout=self.connect_timeout,
+            read_timeout=self.read_timeout,
+            # Long-text mode and server mode open several connections at once
+            max_connections=max(self.pool_max_connections, self.chunk_concurrency, self.parallel_requests),
+            max_keepalive=max(self.pool_max_keepalive, min(self.chunk_concurrency, self.pool_max_connections),
+                              self.parallel_requests),
+            # Keep idle connections a bit longer than the ping interval, otherwise the
+            # pool would drop the socket right before the next keep-alive reuses it.
+            keepalive_expiry=max(30.0, self.keepalive_interval + 30.0),
+            max_retries=max_retries,
+        )
+
+    def _is_cold(self, provider: _Provider) -> bool:
+        """True if no request was sent yet or the connection/model has likely gone idle."""
+        if provider.last_request_at is None:
+            return True
+        idle_limit = self.keepalive_interval if self.keepalive_interval > 0 else 240.0
+        return (time.perf_counter() - provider.last_request_at) > idle_limit * 1.5
+
+    def warm_up(self) -> float | None:
+        """Issue a warm-up request to every provider so the first dictation does not
+        pay the cold start.
+
+        Returns the primary provider's warm-up latency in seconds, or None if it was
+        unreachable.
+        """
+        primary_elapsed = None
+        for provider in self.providers:
+            cold = self._is_cold(provider)
+            start = time.perf_counter()
+            try:
+                provider.backend.ping()
+            except Exception as e:
+                logger.warning(f"LLM warm-up failed ({provider.name}): {e}")
+                continue
+            elapsed = time.perf_counter() - start
+            provider.last_request_at = time.perf_counter()
+            observe("stage_seconds", elapsed, stage="llm_warmup", provider=provider.name)
+            logger.info(f"LLM warm-up ({provider.name}, {'cold' if cold else 'warm'}) took {elapsed:.2f}s")
+            if provider is self.providers[0]:
+                primary_elapsed = elapsed
+            if self.warmup_profiles:
+                self._warm_up_prefixes(provider)
+        return primary_elapsed
+
+    def _warm_up_prefixes(self, provider: _Provider, vibes: list[str] | None = None) -> None:
+        """Send each profile's prompt prefix once so the backend caches it before
+        the first real dictation."""
+        for vibe, prefix in self.PREFIXES.items():
+            if vibes is not None and vibe not in vibes:
+                continue
+            if self.profiles[vibe].llm_provider not in (None, provider.name):
+                continue  # Served by another provider
+            start = time.perf_counter()
+            try:
+                response = provider.backend.complete(prefix, build_user_message("ok"), max_tokens=1)
+            except Exception as e:
+                logger.warning(f"Prefix warm-up failed ({provider.name}, {vibe}): {e}")
+                return
+            logger.info(f"Prefix warm-up ({provider.name}, {vibe}) took "
+                        f"{time.perf_counter() - start:.2f}s{_format_cache_info(response.usage)}")
+
+    def start_keep_alive(self) -> None:
+        """Start a background pinger that keeps the models loaded and the pools warm."""
+        if self.keepalive_interval <= 0:
+            logger.info("LLM keep-alive disabled (LLM_KEEPALIVE_INTERVAL=0)")
+            return
+        if self._keepalive_thread and self._keepalive_thread.is_alive():
+            return
+
+        def _loop():
+            while not self._keepalive_stop.wait(self.keepalive_interval):
+                for provider in self.providers:
+                    # Skip the ping if a real request already kept things warm
+                    if (provider.last_request_at is not None
+                            and time.perf_counter() - provider.last_request_at < self.keepalive_interval):
+                        continue
+                    try:
+                        start = time.perf_counter()
+                        provider.backend.ping()
+                        provider.last_request_at = time.perf_counter()
+                        logger.debug(f"LLM keep-alive ping ({provider.name}) took "
+                                     f"{time.perf_counter() - start:.2f}s")
+                    except Exception as e:
+                        logger.debug(f"LLM keep-alive ping ({provider.name}) failed: {e}")
+
+        self._keepalive_stop.clear()
+        self._keepalive_thread = threading.Thread(target=_loop, name="llm-keepalive", daemon=True)
+        self._keepalive_thread.start()
+        logger.info(f"LLM keep-alive started (every {self.keepalive_interval:.0f}s)")
+
+    def stop_keep_alive(self) -> None:
+        self._keepalive_stop.set()
+
+    def _hedge_delay(self, provider: _Provider) -> float:
+        observed = provider.latency_percentile(self.hedge_percentile)
+        return observed if observed is not None else self.hedge_default_delay
+
+    def get_generation_stats(self) -> dict:
+        """Return a snapshot of the cumulative early-stopping statistics."""
+        with self._stats_lock:
+            return dict(self.generation_stats)
+
+    def _record_generation(self, provider: _Provider, budget: GenerationBudget, tokens: int,
+                           elapsed: float, stop_reason: str | None, finish_reason: str | None) -> None:
+        """Update early-stopping stats and log how much generation was cut."""
+        with self._stats_lock:
+            stats = self.generation_stats
+            stats["requests"] += 1
+            if finish_reason == "length":
+                stats["budget_hits"] += 1
+                logger.warning(f"LLM output hit the budget of {budget.max_tokens} tokens "
+                               f"({provider.name}); output may be truncated")
+            if stop_reason:
+                # Estimate what we avoided: the rest of the budget at the observed speed
+                tokens_cut = max(0, budget.max_tokens - tokens)
+                rate = tokens / elapsed if elapsed > 0 else 0.0
+                seconds_cut = tokens_cut / rate if rate > 0 else 0.0
+                stats["early_stops"] += 1
+                stats["tokens_cut"] += tokens_cut
+                stats["seconds_cut"] += seconds_cut
+                logger.info(
+                    f"LLM early stop ({provider.name}, {stop_reason}) after {tokens} tokens: "
+                    f"cut up to {tokens_cut} tokens / {seconds_cut:.1f}s "
+                    f"[total: {stats['early_stops']}/{stats['requests']} requests, "
+                    f"{stats['tokens_cut']} tokens, {stats['seconds_cut']:.1f}s]"
+                )
+
+    def _call_provider(self, provider: _Provider, system_prefix: str, user_message: str,
+                       cancel: threading.Event, budget: GenerationBudget, report: dict | None = None) -> str:
+        """Stream a completion from one provider, aborting as soon as `cancel` is set
+        or the output runs away from its generation budget.
+
+        Updates the provider's circuit breaker and latency history. Cancellation is
+        not counted as a failure. If `report` is given it receives the call's
+        latency, time to first token and token counts.
+        """
+        cold = self._is_cold(provider)
+        start = time.perf_counter()
+        try:
+            stream = provider.backend.stream(system_prefix, user_message, budget.max_tokens)
+            output = ""
+            tokens = 0  # One streamed chunk is (almost always) one token
+            stop_reason = None
+            finish_reason = None
+            first_token_at = None
+            usage = None
+            try:
+                for chunk in stream:
+                    if cancel.is_set():
+                        raise RequestCancelled(provider.name)
+                    if chunk.usage is not None:
+                        usage = chunk.usage
+                    finish_reason = chunk.finish_reason or finish_reason
+                    if chunk.text:
+                        if first_token_at is None:
+                            first_token_at = time.perf_counter()
+                        output += chunk.text
+                        tokens += 1
+                        stop_reason = budget.check(output)
+                        if stop_reason:
+                            break
+            finally:
+                stream.close()  # Closes the HTTP stream, freeing the connection
+            content = budget.trim(output, stop_reason) if stop_reason else output.strip()
+            if not content:
+                raise ValueError("empty response")
+        except RequestCancelled:
+            provider.breaker.release()
+            logger.debug(f"LLM request to {provider.name} cancelled after "
+                         f"{time.perf_counter() - start:.2f}s")
+            raise
+        except Exception:
+            if cancel.is_set():
+                provider.breaker.release()
+                raise RequestCancelled(provider.name)
+            provider.breaker.record_failure()
+            raise
+
+        elapsed = time.perf_counter() - start
+        self._record_generation(provider, budget, tokens, elapsed, stop_reason, finish_reason)
+        provider.breaker.record_success()
+        provider.latencies.append(elapsed)
+        provider.last_request_at = time.perf_counter()
+        observe("stage_seconds", elapsed, stage="llm_request", provider=provider.name)
+        if first_token_at is not None:
+            observe("llm_ttft_seconds", first_token_at - start, provider=provider.name)
+            generation = elapsed - (first_token_at - start)
+            if tokens > 1 and generation > 0:
+                observe("llm_tokens_per_second", (tokens - 1) / generation, provider=provider.name)
+        if report is not None:
+            report.update(
+                seconds=elapsed,
+                ttft=first_token_at - start if first_token_at is not None else None,
+                prompt_tokens=getattr(usage, "prompt_tokens", None),
+                completion_tokens=getattr(usage, "completion_tokens", None) or tokens,
+                cached_tokens=_cached_prompt_tokens(usage),
             )
-            return response.choices[0].message.content.strip()
+        ttft = f", TTFT {first_token_at - start:.2f}s" if first_token_at is not None else ""
+        logger.info(f"LLM request ({provider.name}, {'cold' if cold else 'warm'}) took {elapsed:.2f}s"
+                    f"{ttft}{_format_cache_info(usage)}")
+        return content
+
+    @staticmethod
+    def _wait_first(pending: dict, timeout: float | None, cancel_token: CancellationToken | None) -> set:
+        """wait(FIRST_COMPLETED) that wakes up regularly to honour `cancel_token`."""
+        if cancel_token is None:
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            return done
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            cancel_token.raise_if_cancelled()
+            slice_ = CANCEL_POLL_INTERVAL
+            if deadline is not None:
+                slice_ = min(slice_, max(0.0, deadline - time.monotonic()))
+            done, _ = wait(pending, timeout=slice_, return_when=FIRST_COMPLETED)
+            if done or (deadline is not None and time.monotonic() >= deadline):
+                cancel_token.raise_if_cancelled()
+                return done
+
+    def _hedged_completion(self, system_prefix: str, user_message: str, budget: GenerationBudget,
+                           cancel_token: CancellationToken | None = None, providers: list[_Provider] | None = None,
+                           timeout: float | None = None) -> tuple[str, str]:
+        """Run a completion across providers with hedging and circuit breaking.
+
+        The primary provider (first of `providers`, default the configured chain)
+        gets the request first. If it has not answered within its latency
+        percentile (or fails), the next healthy provider is tried in parallel. The
+        first valid answer wins and the other requests are cancelled.
+
+        Returns (provider_name, content). Raises RuntimeError if every provider failed,
+        TimeoutError if none answered within `timeout` seconds and PipelineCancelled
+        if `cancel_token` fires; in-flight streams are then closed at their next token.
+        """
+        remaining = list(providers or self.providers)
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        cancel = threading.Event()
+        if cancel_token is not None:
+            cancel_token.on_cancel(cancel.set)
+        pending = {}
+        errors = []
+
+        def launch_next() -> _Provider | None:
+            while remaining:
+                provider = remaining.pop(0)
+                if provider.breaker.allow_request():
+                    # Run in the caller's context so the dictation's trace ID stays on the logs
+                    future = self._executor.submit(contextvars.copy_context().run, self._call_provider,
+                                                   provider, system_prefix, user_message, cancel, budget)
+                    pending[future] = provider
+                    return provider
+                logger.debug(f"Skipping {provider.name}: circuit open")
+            return None
+
+        current = launch_next()
+        try:
+            while pending:
+                hedge_timeout = self._hedge_delay(current) if remaining else None
+                wait_timeout = hedge_timeout
+                if deadline is not None:
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        raise TimeoutError(f"no answer within {timeout:g}s")
+                    wait_timeout = left if hedge_timeout is None else min(hedge_timeout, left)
+                done = self._wait_first(pending, wait_timeout, cancel_token)
+                if not done:
+                    if hedge_timeout is None or wait_timeout < hedge_timeout:
+                        continue  # Deadline reached, checked at the top of the loop
+                    slow = current
+                    current = launch_next()
+                    if current:
+                        logger.info(f"Hedging: {slow.name} slower than {hedge_timeout:.2f}s, "
+                                    f"also asking {current.name}")
+                    else:
+                        current = slow
+                    continue
+                for future in done:
+                    provider = pending.pop(future)
+                    try:
+                        content = future.result()
+                    except Exception as e:
+                        errors.append(f"{provider.name}: {e}")
+                        logger.warning(f"LLM provider {provider.name} failed: {e}")
+                        continue
+                    return provider.name, content
+                # A provider failed: fail over to the next one without waiting
+                current = launch_next() or current
+        finally:
+            cancel.set()  # Tell the losing requests to close their streams
+
+        if not errors:
+            errors.append("all circuits open")
+        raise RuntimeError("No LLM provider available (" + "; ".join(errors) + ")")
+
+    def _provider_named(self, name: str) -> _Provider:
+        """A configured provider, or a standalone one created on first use (kept for
+        later calls) so every supported provider can be compared."""
+        for provider in self.providers:
+            if provider.name == name:
+                return provider
+        if name not in SUPPORTED_PROVIDERS:
+            raise ValueError(f"Provider '{name}' not supported. Use 'lmstudio' or 'deepseek'")
+        with self._stats_lock:
+            provider = self._extra_providers.get(name)
+            if provider is None:
+                provider = self._extra_providers[name] = self._create_provider(name)
+        return provider
+
+    def fastest_provider(self) -> str | None:
+        """The configured provider with the lowest recent median latency (None until
+        every provider has enough samples, or with a single provider)."""
+        if len(self.providers) < 2:
+            return None
+        medians = [(p.latency_percentile(50), p.name) for p in self.providers]
+        if any(median is None for median, _ in medians):
+            return None
+        return min(medians)[1]
+
+    def _providers_for(self, profile: Profile) -> list[_Provider]:
+        """Provider chain of a profile: its own provider first, the configured ones as fallback."""
+        if not profile.llm_provider:
+            return self.providers
+        first = self._provider_named(profile.llm_provider)
+        return [first] + [p for p in self.providers if p is not first]
+
+    def _budget(self, text: str, profile: Profile) -> GenerationBudget:
+        return GenerationBudget(text, profile.name, ratio=profile.max_output_ratio,
+                                cap=profile.max_tokens or self.max_tokens_cap)
+
+    def rewrite_with(self, text: str, vibe: str, provider_name: str | None = None) -> dict:
+        """Rewrite `text` with exactly one profile and provider and report the call.
+
+        No hedging, failover, chunking or fallback to the original text: the result
+        is what that provider produced, for side-by-side comparisons. Returns a dict
+        with provider, vibe, text, seconds, ttft, prompt/completion/cached token
+        counts and error (None on success). Safe to call from several threads.
+        """
+        result = {"provider": provider_name or self.provider, "vibe": vibe, "text": "", "seconds": None,
+                  "ttft": None, "prompt_tokens": None, "completion_tokens": None, "cached_tokens": None,
+                  "error": None}
+        start = time.perf_counter()
+        try:
+            if vibe not in self.profiles:
+                raise ValueError(f"unknown profile '{vibe}'")
+            if self.profiles[vibe].skip_llm:
+                result.update(text=text, seconds=0.0)
+                return result
+            provider = self._provider_named(result["provider"])
+            budget = self._budget(text, self.profiles[vibe])
+            result["text"] = self._call_provider(provider, self.PREFIXES[vibe], build_user_message(text),
+                                                 threading.Event(), budget, report=result)
+        except Exception as e:
+            logger.warning(f"Rewrite with {result['provider']}/{vibe} failed: {e}")
+            result["error"] = str(e)
+            result["seconds"] = time.perf_counter() - start
+        return result
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        """Return the background event loop used by the async clients."""
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="llm-async", daemon=True).start()
+            return self._loop
+
+    async def _arewrite_chunk(self, provider: _Provider, chunk: TextChunk, total: int, profile: Profile,
+                              semaphore: asyncio.Semaphore) -> tuple[str, float]:
+        """Rewrite one chunk through the backend's async stream. Returns (text, seconds).
+
+        On failure the chunk's original text is returned so one bad chunk does not
+        lose the whole dictation.
+        """
+        async with semaphore:
+            budget = self._budget(chunk.text, profile)
+            start = time.perf_counter()
+            try:
+                stream = provider.backend.astream(
+                    profile.prefix,
+                    build_user_message(chunk.text, chunk.index + 1, total, chunk.context),
+                    budget.max_tokens,
+                )
+                output = ""
+                stop_reason = None
+                try:
+                    async for piece in stream:
+                        if piece.text:
+                            output += piece.text
+                            stop_reason = budget.check(output)
+                            if stop_reason:
+                                break
+                finally:
+                    await stream.aclose()
+                content = budget.trim(output, stop_reason) if stop_reason else output.strip()
+                if not content:
+                    raise ValueError("empty response")
+            except Exception as e:
+                provider.breaker.record_failure()
+                logger.warning(f"Chunk {chunk.index + 1}/{total} failed ({provider.name}): {e}; "
+                               "keeping original text")
+                return chunk.text, time.perf_counter() - start
+            provider.breaker.record_success()
+            elapsed = time.perf_counter() - start
+            logger.debug(f"Chunk {chunk.index + 1}/{total} rewritten in {elapsed:.2f}s")
+            return content, elapsed
+
+    async def _arewrite_chunks(self, provider: _Provider, chunks: list[TextChunk],
+                               profile: Profile) -> list[tuple[str, float]]:
+        semaphore = asyncio.Semaphore(max(1, self.chunk_concurrency))
+        return await asyncio.gather(
+            *(self._arewrite_chunk(provider, c, len(chunks), profile, semaphore) for c in chunks)
+        )
+
+    def _rewrite_chunked(self, text: str, profile: Profile, cancel_token: CancellationToken | None = None,
+                         providers: list[_Provider] | None = None, timeout: float | None = None) -> str:
+        """Long-text mode: rewrite chunks concurrently and reassemble them in order.
+
+        Raises TimeoutError if the chunks are not done within `timeout` seconds.
+        """
+        provider = next((p for p in providers or self.providers if p.breaker.allow_request()), None)
+        if provider is None:
+            raise RuntimeError("No LLM provider available (all circuits open)")
+
+        chunks = split_text(text, max_chars=self.chunk_size)
+        logger.info(f"Long-text mode: {len(text)} chars split into {len(chunks)} chunks "
+                    f"(concurrency {self.chunk_concurrency}, {provider.name})")
+        start = time.perf_counter()
+        future = asyncio.run_coroutine_threadsafe(
+            self._arewrite_chunks(provider, chunks, profile), self._get_loop())
+        poll = CANCEL_POLL_INTERVAL if cancel_token or timeout is not None else None
+        while True:
+            try:
+                results = future.result(timeout=poll)
+                break
+            except FutureTimeout:
+                # Cancelling the task closes every chunk stream (aclose in finally)
+                if cancel_token and cancel_token.cancelled:
+                    future.cancel()
+                    raise PipelineCancelled()
+                if timeout is not None and time.perf_counter() - start > timeout:
+                    future.cancel()
+                    raise TimeoutError(f"chunks not done within {timeout:g}s")
+        wall = time.perf_counter() - start
+        provider.last_request_at = time.perf_counter()
+
+        # Sum of chunk latencies approximates the single-prompt path, since output
+        # tokens are generated sequentially either way
+        sequential = sum(elapsed for _, elapsed in results)
+        speedup = sequential / wall if wall > 0 else 0.0
+        logger.info(f"Chunked rewrite took {wall:.2f}s vs ~{sequential:.2f}s sequential "
+                    f"({speedup:.1f}x)")
+        return reassemble([content for content, _ in results], chunks)
+
+    def rewrite_text(self, text: str, vibe: str | None, cancel_token: CancellationToken | None = None,
+                     profile: Profile | None = None) -> str:
+        """Rewrite `text` with the `vibe` profile (the default one if unknown).
+
+        The profile's provider, timeout and token cap apply; `profile` replaces
+        the registered settings for this call (see slo_controller.py). Falls back
+        to the original text if every provider fails or the profile's timeout
+        expires, and returns it unchanged for skip_llm profiles. Raises
+        PipelineCancelled if `cancel_token` is cancelled (open streams are closed).
+        """
+        if not text:
+            return ""
+
+        if profile is None:
+            if vibe not in self.profiles:
+                if vibe is not None:
+                    logger.warning(f"Unknown profile '{vibe}', using '{self.default_profile}'")
+                vibe = self.default_profile
+            profile = self.profiles[vibe]
+        vibe = profile.name
+        if profile.skip_llm:
+            logger.info(f"Profile {vibe} skips the LLM: keeping the transcript")
+            return text
+
+        logger.info(f"Rewriting text with vibe: {vibe}...")
+        try:
+            providers = self._providers_for(profile)
+        except ValueError as e:
+            logger.error(f"LLM Error: {e}")
+            return text
+        timeout = profile.llm_timeout
+        start = time.perf_counter()
+
+        if self.chunk_threshold and len(text) > self.chunk_threshold:
+            try:
+                return self._rewrite_chunked(text, profile, cancel_token, providers, timeout)
+            except PipelineCancelled:
+                raise
+            except TimeoutError as e:
+                logger.error(f"LLM Error: {e}")
+                return text
+            except Exception as e:
+                logger.error(f"Chunked rewrite failed, using single prompt: {e}")
+            if timeout is not None:
+                timeout = max(0.0, timeout - (time.perf_counter() - start))
+
+        budget = self._budget(text, profile)
+        logger.debug(f"Generation budget: ~{budget.input_tokens} input tokens x {budget.ratio} "
+                     f"-> max_tokens={budget.max_tokens}")
+        try:
+            provider_name, content = self._hedged_completion(profile.prefix, build_user_message(text),
+                                                             budget, cancel_token, providers, timeout)
+            if len(providers) > 1:
+                logger.info(f"Rewrite served by {provider_name}")
+            return content
+        except PipelineCancelled:
+            logger.info("Rewrite cancelled.")
+            raise
         except Exception as e:
             logger.error(f"LLM Error: {e}")
             return text  # fallback to original text if LLM fails
@@ -1,23 +1,97 @@
+import os
+import json
+import queue
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 
+# Dictation being processed by the current thread (see pipeline.py) and its stage.
+# Threads started from a traced one only inherit them through contextvars.copy_context().
+_trace_id: contextvars.ContextVar[str | None] = contextvars.ContextVar("trace_id", default=None)
+_stage: contextvars.ContextVar[str | None] = contextvars.ContextVar("stage", default=None)
 
-def setup_logging(log_file: str = "vibeflow.log") -> logging.Logger:
+_listener: QueueListener | None = None
+
+
+@contextmanager
+def trace_context(trace_id: str | None = None, stage: str | None = None):
+    """Tag every log record emitted inside the block with `trace_id` and `stage`."""
+    tokens = []
+    if trace_id is not None:
+        tokens.append((_trace_id, _trace_id.set(trace_id)))
+    if stage is not None:
+        tokens.append((_stage, _stage.set(stage)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+class _ContextFilter(logging.Filter):
+    """Copies the trace context onto the record. Runs in the logging thread,
+    before the record is handed to the listener."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = _trace_id.get()
+        record.stage = _stage.get()
+        return True
+
+
+class _TextFormatter(logging.Formatter):
+    """`2024-01-01 12:00:00 [INFO    ] [a1b2c3d4 transcribe] message`"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        trace_id = getattr(record, "trace_id", None)
+        stage = getattr(record, "stage", None)
+        record.context = f"[{' '.join(filter(None, (trace_id, stage)))}] " if trace_id or stage else ""
+        return super().format(record)
+
+
+class _JsonFormatter(logging.Formatter):
+    """One JSON object per line, with the same fields as the text format."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "trace_id": getattr(record, "trace_id", None),
+            "stage": getattr(record, "stage", None),
+            "thread": record.threadName,
+            # QueueHandler has already merged args and any traceback into the message
+            "msg": record.getMessage(),
+        }
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def setup_logging(log_file: str = "vibeflow.log", log_format: str | None = None) -> logging.Logger:
     """Configure application-wide logging to both file and console.
 
     File: DEBUG level, rotating (5 MB max, 3 backups).
     Console: INFO level.
+
+    Callers only put records on a queue; a listener thread formats them and does
+    the file/console I/O. `log_format` is "text" or "json" (JSON lines), default
+    from VIBEFLOW_LOG_FORMAT.
     """
+    global _listener
     logger = logging.getLogger("vibeflow")
     if logger.handlers:
         return logger  # Already configured – avoid duplicate handlers
 
     logger.setLevel(logging.DEBUG)
 
-    fmt = logging.Formatter(
-        "%(asctime)s [%(levelname)-8s] %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S",
-    )
+    log_format = (log_format or os.getenv("VIBEFLOW_LOG_FORMAT", "text")).strip().lower()
+    if log_format == "json":
+        fmt = _JsonFormatter()
+    else:
+        fmt = _TextFormatter(
+            "%(asctime)s [%(levelname)-8s] %(context)s%(message)s",
+            datefmt="%Y-%m-%d %H:%M:%S",
+        )
 
     # Rotating file handler
     fh = RotatingFileHandler(
@@ -31,6 +105,12 @@ def setup_logging(log_file: str = "vibeflow.log") -> logging.Logger:
     ch.setLevel(logging.INFO)
     ch.setFormatter(fmt)
 
-    logger.addHandler(fh)
-    logger.addHandler(ch)
+    qh = QueueHandler(queue.SimpleQueue())
+    qh.addFilter(_ContextFilter())
+    logger.addHandler(qh)
+
+    _listener = QueueListener(qh.queue, fh, ch, respect_handler_level=True)
+    _listener.start()
+    # Flush what is still queued when the process exits
+    atexit.register(_listener.stop)
     return logger
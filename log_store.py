@@ -0,0 +1,68 @@
+"""Log lines captured by the dashboard from main.py, streamed incrementally to the console."""
+import re
+import logging
+import threading
+from collections import deque
+
+# Level inside lines written by log_setup's formatters: "... [INFO    ] message"
+# (text) or {"ts": ..., "level": "INFO", ...} (JSON lines)
+_LEVEL_RE = re.compile(r'\[(DEBUG|INFO|WARNING|ERROR|CRITICAL)\s*\]|"level": "(DEBUG|INFO|WARNING|ERROR|CRITICAL)"')
+
+
+class LogStore:
+    """Bounded ring buffer of log lines with increasing sequence numbers.
+
+    Readers remember the last sequence number they saw and ask only for newer
+    lines (`since`), optionally blocking until some arrive (`wait`). Old lines
+    are dropped in O(1) once `capacity` is reached.
+    """
+
+    def __init__(self, capacity: int = 5000):
+        self._lines: deque[tuple[int, int, str]] = deque(maxlen=capacity)  # (seq, level, text)
+        self._next_seq = 0
+        self._last_level = logging.INFO
+        self._cond = threading.Condition()
+
+    def append(self, line: str) -> None:
+        match = _LEVEL_RE.search(line)
+        # Continuation lines (tracebacks, wrapped output) inherit the previous level
+        level = logging.getLevelName(match.group(1) or match.group(2)) if match else self._last_level
+        with self._cond:
+            self._last_level = level
+            self._lines.append((self._next_seq, level, line))
+            self._next_seq += 1
+            self._cond.notify_all()
+
+    @property
+    def last_seq(self) -> int:
+        """Sequence number the next line will get."""
+        with self._cond:
+            return self._next_seq
+
+    def since(self, seq: int, min_level: int = logging.NOTSET, text: str = "") -> tuple[list[str], int]:
+        """Lines numbered >= `seq` matching the filters, and the next sequence number."""
+        needle = text.lower()
+        entries = []
+        with self._cond:
+            # Walk back from the newest line: cost is proportional to the delta
+            for entry in reversed(self._lines):
+                if entry[0] < seq:
+                    break
+                entries.append(entry)
+            next_seq = self._next_seq
+        entries.reverse()
+        lines = [line for _, level, line in entries
+                 if level >= min_level and (not needle or needle in line.lower())]
+        return lines, next_seq
+
+    def wait(self, seq: int, timeout: float | None = None, stop: threading.Event | None = None) -> bool:
+        """Block until a line numbered >= `seq` exists, or `stop` is set (see wake).
+        False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._next_seq > seq or (stop is not None and stop.is_set()),
+                                       timeout)
+
+    def wake(self) -> None:
+        """Wake every waiter, so those whose `stop` event was just set return."""
+        with self._cond:
+            self._cond.notify_all()
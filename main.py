@@ -1,34 +1,81 @@
 import sys
-import keyboard
-import time
 import threading
 import os
-from dotenv import load_dotenv
-from log_setup import setup_logging
+from concurrent.futures import ThreadPoolExecutor, wait
+from startup import StartupTimeline, Deferred
+
+timeline = StartupTimeline()
+
+with timeline.step("import keyboard, dotenv, logging"):
+    import keyboard
+    from dotenv import load_dotenv
+    from log_setup import setup_logging
 
 load_dotenv()
 logger = setup_logging()
 
-from audio_manager import AudioManager
-from stt_service import STTService
-from llm_service import LLMService
-from clipboard_manager import ClipboardManager
-from recording_indicator import RecordingIndicator
+# Heavy dependencies (faster_whisper, openai) are imported lazily by the services
+with timeline.step("import audio_manager"):
+    from audio_manager import AudioManager
+with timeline.step("import stt_service"):
+    from stt_service import STTService
+with timeline.step("import llm_service"):
+    from llm_service import LLMService
+with timeline.step("import clipboard_manager"):
+    from clipboard_manager import ClipboardManager
+with timeline.step("import recording_indicator"):
+    from recording_indicator import RecordingIndicator
+with timeline.step("import pipeline, metrics"):
+    from pipeline import DictationPipeline
+    from metrics import MetricsExporter
+    from config_reload import ConfigReloader
+    from history import history_from_env
+    from profiles import read_profiles
+    from slo_controller import slo_controller_from_env
+    from profiler import profiler_from_env
+    from remote_services import server_url, RemoteSTTService, RemoteLLMService
+
+# Hotkey that aborts the dictation in progress (recording, STT or LLM) without pasting
+CANCEL_HOTKEY = os.getenv("VIBEFLOW_CANCEL_HOTKEY", "ctrl+alt+0")
+# Dictations that may wait for STT/LLM while a new one is being recorded
+MAX_PENDING = int(os.getenv("VIBEFLOW_MAX_PENDING", "3"))
+# Latency metrics: JSON snapshot read by the dashboard (empty disables) and optional HTTP port
+METRICS_PATH = os.getenv("VIBEFLOW_METRICS_PATH", "./vibeflow_metrics.json")
+METRICS_INTERVAL = float(os.getenv("VIBEFLOW_METRICS_INTERVAL", "5"))
+METRICS_PORT = int(os.getenv("VIBEFLOW_METRICS_PORT", "0"))
+# Seconds between checks of profiles.json, the personal dictionary and .env (0 disables live reload)
+CONFIG_RELOAD_INTERVAL = float(os.getenv("VIBEFLOW_CONFIG_RELOAD_INTERVAL", "1"))
+PROFILES_PATH = os.getenv("PROFILES_PATH", "./profiles.json")
+# Added to a profile hotkey to rewrite the last transcript again with that profile (no recording)
+REWRITE_MODIFIER = os.getenv("VIBEFLOW_REWRITE_MODIFIER", "shift")
+
+
+def _validate_config() -> list[str]:
+    """Validate critical configuration values at startup and exit early on errors.
+
+    Returns the configured LLM providers, primary first.
+    """
+    if server_url():
+        # Providers and keys are configured on the shared server
+        logger.info(f"Configurazione valida: VIBEFLOW_SERVER_URL={server_url()}")
+        return ["remote"]
 
-
-def _validate_config() -> None:
-    """Validate critical configuration values at startup and exit early on errors."""
     provider = os.getenv("LLM_PROVIDER", "lmstudio")
     valid_providers = ("lmstudio", "deepseek")
 
-    if provider not in valid_providers:
-        logger.error(
-            f"LLM_PROVIDER='{provider}' non valido. "
-            f"Usa uno tra: {', '.join(valid_providers)}."
-        )
-        sys.exit(1)
+    # LLM_PROVIDERS (multi-provider mode) takes precedence over LLM_PROVIDER
+    multi = os.getenv("LLM_PROVIDERS", "").strip()
+    providers = [p.strip().lower() for p in multi.split(",") if p.strip()] if multi else [provider]
+
+    for name in providers:
+        if name not in valid_providers:
+            logger.error(
+                f"Provider LLM '{name}' non valido. "
+                f"Usa uno tra: {', '.join(valid_providers)}."
+            )
+            sys.exit(1)
 
-    if provider == "deepseek":
+    if "deepseek" in providers:
         api_key = os.getenv("DEEPSEEK_API_KEY", "").strip()
         if not api_key or api_key == "your_api_key_here":
             logger.error(
@@ -37,7 +84,11 @@ def _validate_config() -> None:
             )
             sys.exit(1)
 
-    logger.info(f"Configurazione valida: LLM_PROVIDER={provider}")
+    if multi:
+        logger.info(f"Configurazione valida: LLM_PROVIDERS={','.join(providers)}")
+    else:
+        logger.info(f"Configurazione valida: LLM_PROVIDER={provider}")
+    return providers
 
 
 class VibeFlowApp:
@@ -46,100 +97,160 @@ class VibeFlowApp:
         logger.info("Initializing VibeFlow...")
         logger.info("=" * 60)
 
-        _validate_config()
-
-        logger.info("[1/4] Loading Audio Manager...")
-        self.audio_manager = AudioManager()
-        logger.info("Audio Manager ready")
-
-        logger.info("[2/4] Loading STT Service (Whisper model)...")
-        logger.info("This may take 30-60 seconds on first run (downloading model)...")
-        self.stt_service = STTService()
-        logger.info("Whisper model loaded and ready")
-
-        logger.info("[3/4] Loading LLM Service...")
-        self.llm_service = LLMService()
-        logger.info("LLM Service ready")
+        providers = _validate_config()
+        try:
+            # Hotkeys and per-profile settings; the LLM service validates providers later
+            self.profiles = read_profiles(PROFILES_PATH)
+        except (OSError, ValueError) as e:
+            logger.error(f"Profili non validi: {e}")
+            sys.exit(1)
+        self._hotkey_handles = []
+
+        # Audio, Whisper and the LLM clients load in parallel in the background;
+        # hotkeys and the overlay are live as soon as the indicator exists, and a
+        # dictation started meanwhile only waits for the components it needs.
+        logger.info("Loading Audio Manager, Whisper model and LLM Service in background...")
+        remote = server_url()
+        if remote:
+            stt_init = (RemoteSTTService, remote)
+        else:
+            logger.info("Whisper may take 30-60 seconds on first run (downloading model)...")
+            stt_init = (STTService,)
+        executor = ThreadPoolExecutor(max_workers=3, thread_name_prefix="startup")
+        self._startup_futures = {
+            "AudioManager": executor.submit(timeline.run, "init AudioManager", AudioManager),
+            "STTService": executor.submit(timeline.run, "init STTService", *stt_init),
+            "LLMService": executor.submit(timeline.run, "init LLMService", self._init_llm_service),
+        }
+        executor.shutdown(wait=False)
+        self.audio_manager = Deferred(self._startup_futures["AudioManager"], "Audio Manager")
+        self.stt_service = Deferred(self._startup_futures["STTService"], "Whisper model")
+        self.llm_service = Deferred(self._startup_futures["LLMService"], "LLM Service")
+
+        # Tk must be created on the main thread, which later runs its mainloop
+        with timeline.step("init RecordingIndicator"):
+            self.clipboard_manager = ClipboardManager()
+            self.indicator = RecordingIndicator(provider=providers[0])
+        with timeline.step("open history"):
+            self.history = history_from_env()
+        # Lowers decode/rewrite settings while dictations miss the time-to-paste target
+        # (local models only: with a shared server the settings are the server's)
+        self.slo_controller = None if remote else slo_controller_from_env(self.stt_service, self.llm_service)
+        # Keeps a profile of dictations slower than VIBEFLOW_PROFILE_THRESHOLD (off by default)
+        self.profiler = profiler_from_env()
+        self.pipeline = DictationPipeline(
+            self.audio_manager, self.stt_service, self.llm_service,
+            self.clipboard_manager, self.indicator,
+            max_pending=MAX_PENDING, history=self.history, profiles=self.profiles,
+            controller=self.slo_controller, profiler=self.profiler,
+        )
+        threading.Thread(target=self._report_startup, name="startup-report", daemon=True).start()
+
+        # Edits to profiles, dictionary, provider and profiler settings apply without a restart
+        # (with a shared server they are the server's business)
+        self.config_reloader = None
+        if CONFIG_RELOAD_INTERVAL > 0 and not remote:
+            self.config_reloader = ConfigReloader(
+                self.pipeline, self.stt_service, self.llm_service, self.indicator,
+                profiles_path=PROFILES_PATH,
+                dictionary_path=os.getenv("PERSONAL_DICT_PATH", "personal_dictionary.txt"),
+                interval=CONFIG_RELOAD_INTERVAL,
+                on_profiles=self._register_hotkeys,
+            )
+            self.config_reloader.start()
 
-        logger.info("[4/4] Initializing Recording Indicator...")
-        self.clipboard_manager = ClipboardManager()
-        self.indicator = RecordingIndicator(provider=self.llm_service.provider)
-        self.is_processing = False
+        self.metrics_exporter = None
+        if METRICS_PATH:
+            self.metrics_exporter = MetricsExporter(path=METRICS_PATH, interval=METRICS_INTERVAL,
+                                                    port=METRICS_PORT or None)
+            self.metrics_exporter.start()
 
         logger.info("=" * 60)
         logger.info("VibeFlow is ready and running in the background!")
         logger.info("=" * 60)
 
+    @staticmethod
+    def _init_llm_service() -> LLMService:
+        llm_service = RemoteLLMService(server_url()) if server_url() else LLMService()
+        # Warm up in background so the first dictation doesn't pay the cold start
+        threading.Thread(target=llm_service.warm_up, name="llm-warmup", daemon=True).start()
+        llm_service.start_keep_alive()
+        return llm_service
+
+    def _report_startup(self) -> None:
+        """Wait for the background components, then log the startup timeline."""
+        wait(self._startup_futures.values())
+        timeline.mark("all components loaded")
+        for name, future in self._startup_futures.items():
+            if future.exception() is not None:
+                logger.error(f"{name} failed to initialize: {future.exception()}")
+        timeline.log()
+        # Whisper sizes used by profiles, or by the SLO controller once it degrades,
+        # load now rather than on their first (already slow) dictation
+        if not server_url() and self._startup_futures["STTService"].exception() is None:
+            model_sizes = {p.stt_model for p in self.profiles.values() if p.stt_model}
+            if self.slo_controller is not None and self.slo_controller.degraded_stt_model:
+                model_sizes.add(self.slo_controller.degraded_stt_model)
+            for model_size in sorted(model_sizes):
+                try:
+                    self.stt_service.load_model(model_size)
+                except Exception as e:
+                    logger.warning(f"Could not preload Whisper model '{model_size}': {e}")
+
     def process_vibe(self, vibe: str):
-        if self.is_processing:
-            logger.warning("Already processing, please wait...")
+        """Queue a dictation; returns immediately (called from the hotkey thread)."""
+        self.pipeline.submit(vibe)
+
+    def rewrite_last(self, vibe: str):
+        """Rewrite the last transcript again with another profile and paste it,
+        skipping recording and STT (called from the hotkey thread)."""
+        # Never wait on the hotkey thread: an entry not written yet is not waited for
+        entry = self.history.latest(timeout=0) if self.history else None
+        if entry is None:
+            if self.history and self.history.pending:
+                logger.warning("The last dictation is still being written to the history, try again in a moment.")
+            else:
+                logger.warning("No dictation in the history to rewrite.")
             return
-
-        self.is_processing = True
-
-        try:
-            logger.info(f"--- Starting VibeFlow ({vibe} mode) ---")
-
-            # Show recording indicator
-            self.indicator.show()
-
-            # 1. Record Audio (with stop callback and real-time level feed)
-            audio_file = self.audio_manager.record_audio(
-                stop_callback=lambda: self.indicator.stop_recording,
-                audio_level_callback=self.indicator.set_audio_level,
-            )
-            if not audio_file:
-                logger.warning("No audio recorded. Aborting.")
-                self.indicator.update_status("error")
-                return
-
-            # 2. Transcribe (STT)
-            self.indicator.update_status("processing")
-            transcribed_text = self.stt_service.transcribe(audio_file)
-            if not transcribed_text:
-                logger.warning("Transcription failed or empty. Aborting.")
-                self.indicator.update_status("error")
-                return
-
-            # 3. Rewrite (LLM)
-            final_text = self.llm_service.rewrite_text(transcribed_text, vibe)
-            if not final_text:
-                logger.warning("Rewriting failed. Aborting.")
-                self.indicator.update_status("error")
-                return
-
-            logger.info(f"Final output: {final_text}")
-
-            # 4. Hide overlay
-            self.indicator.hide()
-
-            # 5. Additional small delay to ensure focus is stable
-            time.sleep(0.3)
-
-            # 6. Paste to user's active window
-            self.clipboard_manager.paste_text(final_text)
-
-            # 7. Success feedback (audio only)
-            self.audio_manager.play_sound("success")
-            logger.info("--- VibeFlow complete ---")
-
-        except Exception as e:
-            logger.error(f"An error occurred: {e}", exc_info=True)
-            self.indicator.update_status("error")
-        finally:
-            self.is_processing = False
+        self.pipeline.resubmit(entry["raw_text"], vibe, entry_id=entry["id"])
+
+    def cancel_current(self):
+        """Abort the most recent dictation that has not been pasted yet.
+
+        The worker handling it stops at its next checkpoint (audio chunk,
+        Whisper segment or LLM token) and never pastes; older dictations
+        already in the pipeline are not affected.
+        """
+        if self.pipeline.cancel_latest():
+            logger.info("Cancellation requested")
+
+    def _register_hotkeys(self, profiles: dict) -> None:
+        """(Re)bind one hotkey per profile from profiles.json, plus its rewrite variant."""
+        for handle in self._hotkey_handles:
+            keyboard.remove_hotkey(handle)
+        self._hotkey_handles = []
+        logger.info("Registered Hotkeys:")
+        for name, profile in profiles.items():
+            if not profile.hotkey:
+                continue
+            if profile.hotkey == CANCEL_HOTKEY:
+                logger.warning(f"Profile {name} uses the cancel hotkey {CANCEL_HOTKEY}: ignored")
+                continue
+            # Hotkeys only enqueue: the pipeline workers do the actual work
+            self._hotkey_handles.append(keyboard.add_hotkey(profile.hotkey, self.process_vibe, args=(name,)))
+            if self.history:
+                self._hotkey_handles.append(keyboard.add_hotkey(f"{REWRITE_MODIFIER}+{profile.hotkey}",
+                                                                self.rewrite_last, args=(name,)))
+            logger.info(f"{profile.hotkey.upper()} -> {name}")
+        if self.history:
+            logger.info(f"{REWRITE_MODIFIER.upper()}+<profile hotkey> -> Rewrite the last transcript with that profile")
 
     def run(self):
-        logger.info("Registered Hotkeys:")
-        logger.info("CTRL+ALT+1 -> Confidential")
-        logger.info("CTRL+ALT+2 -> Formal")
-        logger.info("CTRL+ALT+3 -> Technical")
+        self._register_hotkeys(self.profiles)
+        keyboard.add_hotkey(CANCEL_HOTKEY, self.cancel_current)
+        logger.info(f"{CANCEL_HOTKEY.upper()} -> Cancel current dictation")
         logger.info("Press ESC to exit.\n")
-
-        # We use threading so the hotkey listener doesn't block the execution
-        keyboard.add_hotkey('ctrl+alt+1', lambda: threading.Thread(target=self.process_vibe, args=("confidential",), daemon=True).start())
-        keyboard.add_hotkey('ctrl+alt+2', lambda: threading.Thread(target=self.process_vibe, args=("formal",), daemon=True).start())
-        keyboard.add_hotkey('ctrl+alt+3', lambda: threading.Thread(target=self.process_vibe, args=("technical",), daemon=True).start())
+        timeline.mark("hotkeys registered")
 
         # Keep Tkinter main loop running if overlay is available
         if self.indicator.window:
@@ -157,6 +268,14 @@ class VibeFlowApp:
             logger.info("Using Windows notifications for status updates.")
             keyboard.wait('esc')
 
+        if self.config_reloader:
+            self.config_reloader.stop()
+        if self.metrics_exporter:
+            self.metrics_exporter.stop()
+        if self.history:
+            self.history.close()
+        self.clipboard_manager.close()
+
 
 if __name__ == "__main__":
     app = VibeFlowApp()
@@ -0,0 +1,220 @@
+"""Latency instrumentation: timing spans, rolling histograms and exporters.
+
+Every stage of a dictation (capture, STT, LLM, paste, ...) and every model
+load is timed with `span()`. Observations are kept in rolling windows so the
+p50/p95/p99 reflect recent behaviour, plus lifetime count and sum.
+
+`MetricsExporter` periodically writes a JSON snapshot (read by the dashboard)
+and a Prometheus text file next to it, and can optionally serve both over HTTP:
+
+    GET /metrics        Prometheus text format
+    GET /metrics.json   JSON snapshot
+"""
+import os
+import json
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+logger = logging.getLogger("vibeflow")
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Metric families: name -> help text
+DESCRIPTIONS = {
+    "stage_seconds": "Duration of dictation stages and model loads in seconds",
+    "stt_real_time_factor": "Whisper processing time divided by audio duration",
+    "llm_ttft_seconds": "Time to first LLM token in seconds",
+    "llm_tokens_per_second": "LLM generation speed in tokens per second",
+    "server_request_seconds": "Server request latency (queue + processing) in seconds",
+    "server_queue_seconds": "Time server requests waited for a free slot in seconds",
+    "server_queue_depth": "Requests already waiting when a new one arrived",
+    "server_in_flight": "Requests being processed when a new one started",
+}
+
+
+class Histogram:
+    """Rolling window of observations with lifetime count and sum."""
+
+    def __init__(self, window: int = 500):
+        self.values: deque[float] = deque(maxlen=window)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.values.append(value)
+        self.count += 1
+        self.sum += value
+
+    def summary(self) -> dict:
+        """Lifetime count/sum and nearest-rank quantiles of the current window."""
+        ordered = sorted(self.values)
+        result = {"count": self.count, "sum": round(self.sum, 6)}
+        for q in QUANTILES:
+            value = ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else None
+            result[f"p{int(q * 100)}"] = round(value, 6) if value is not None else None
+        return result
+
+
+class MetricsRegistry:
+    """Thread-safe set of labelled histograms."""
+
+    def __init__(self, window: int = 500):
+        self.window = window
+        self._histograms: dict[tuple, Histogram] = {}
+        self._lock = threading.Lock()
+        self.version = 0  # Bumped on every observation (lets exporters skip idle writes)
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.window)
+            histogram.observe(value)
+            self.version += 1
+
+    @contextmanager
+    def span(self, stage: str, **labels):
+        """Time the enclosed block as `stage_seconds{stage=..., **labels}`.
+
+        Failed blocks are recorded too: a timeout is exactly what we want to see.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.observe("stage_seconds", elapsed, stage=stage, **labels)
+            logger.debug(f"[span] {stage} took {elapsed:.3f}s")
+
+    def snapshot(self) -> dict:
+        """JSON-friendly view: {name: [{"labels": {...}, "count", "sum", "p50", ...}]}."""
+        with self._lock:
+            items = [(key, h.summary()) for key, h in self._histograms.items()]
+        result: dict[str, list] = {}
+        for (name, labels), summary in sorted(items):
+            result.setdefault(name, []).append({"labels": dict(labels), **summary})
+        return {"timestamp": time.time(), "metrics": result}
+
+    def to_prometheus(self, prefix: str = "vibeflow_") -> str:
+        """Render every histogram as a Prometheus summary."""
+        lines = []
+        for name, series in self.snapshot()["metrics"].items():
+            metric = prefix + name
+            lines.append(f"# HELP {metric} {DESCRIPTIONS.get(name, name)}")
+            lines.append(f"# TYPE {metric} summary")
+            for entry in series:
+                labels = [f'{k}="{v}"' for k, v in entry["labels"].items()]
+                for q in QUANTILES:
+                    value = entry[f"p{int(q * 100)}"]
+                    if value is not None:
+                        quantile_labels = ",".join(labels + [f'quantile="{q}"'])
+                        lines.append(f"{metric}{{{quantile_labels}}} {value}")
+                suffix = f"{{{','.join(labels)}}}" if labels else ""
+                lines.append(f"{metric}_sum{suffix} {entry['sum']}")
+                lines.append(f"{metric}_count{suffix} {entry['count']}")
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry used by all services
+metrics = MetricsRegistry(int(os.getenv("VIBEFLOW_METRICS_WINDOW", "500")))
+span = metrics.span
+observe = metrics.observe
+
+
+def load_snapshot(path: str) -> dict | None:
+    """Read a JSON snapshot written by MetricsExporter (None if missing or invalid)."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class MetricsExporter:
+    """Write the registry to `path` (JSON) and `path`.prom every `interval` seconds,
+    and optionally serve it on 127.0.0.1:`port`.
+    """
+
+    def __init__(self, registry: MetricsRegistry = metrics, path: str = "vibeflow_metrics.json",
+                 interval: float = 5.0, port: int | None = None):
+        self.registry = registry
+        self.path = path
+        self.prom_path = os.path.splitext(path)[0] + ".prom"
+        self.interval = interval
+        self.port = port
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._server: ThreadingHTTPServer | None = None
+        self._written_version = -1
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._loop, name="metrics-exporter", daemon=True)
+        self._thread.start()
+        if self.port:
+            try:
+                self._start_server()
+            except OSError as e:
+                logger.warning(f"Metrics endpoint not started on port {self.port}: {e}")
+                self.port = None
+        logger.info(f"Metrics exported to {self.path}"
+                    + (f" and http://127.0.0.1:{self.port}/metrics" if self.port else ""))
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._server:
+            self._server.shutdown()
+        self.write()
+
+    def write(self) -> None:
+        version = self.registry.version
+        if version == self._written_version:
+            return
+        self._atomic_write(self.path, json.dumps(self.registry.snapshot(), indent=2))
+        self._atomic_write(self.prom_path, self.registry.to_prometheus())
+        self._written_version = version
+
+    @staticmethod
+    def _atomic_write(path: str, content: str) -> None:
+        # Readers (the dashboard) never see a half-written file
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp, path)
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.write()
+            except Exception as e:
+                logger.warning(f"Could not write metrics: {e}")
+
+    def _start_server(self) -> None:
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body = registry.to_prometheus().encode("utf-8")
+                    content_type = "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body = json.dumps(registry.snapshot()).encode("utf-8")
+                    content_type = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", self.port), Handler)
+        threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
@@ -0,0 +1,320 @@
+"""Output backends: how text gets into the focused application.
+
+ClipboardManager puts the text on the clipboard, sends the paste keystroke and
+later restores what the user had there. The platform-specific part goes through
+an `OutputBackend`, selected with VIBEFLOW_OUTPUT_BACKEND in .env:
+
+- "windows": Win32 clipboard. The clipboard is taken with delayed rendering,
+  so the text is handed over when the target application asks for it; that
+  request confirms the paste, instead of waiting a fixed time,
+- "x11":     xclip + xdotool,
+- "wayland": wl-copy/wl-paste + wtype. wl-copy serves a single paste and exits,
+  which confirms it,
+- "memory":  in-process clipboard, for benchmarks and tests off Windows,
+- "auto":    (default) the one matching the platform/session.
+
+Platform modules (pywin32, keyboard) are imported when a backend is created,
+so importing this module works everywhere.
+"""
+import os
+import sys
+import time
+import shutil
+import logging
+import threading
+import subprocess
+
+logger = logging.getLogger("vibeflow")
+
+SUPPORTED_OUTPUT_BACKENDS = ("auto", "windows", "x11", "wayland", "memory")
+
+
+class OutputBackend:
+    """Clipboard and keystroke primitives of one platform.
+
+    `write(text, confirm=True)` takes clipboard ownership (returns whether that
+    is confirmed) and, on backends with `confirms_paste`, arranges for
+    `wait_pasted()` to return once the target application has read the text.
+    """
+
+    kind = "base"
+    confirms_paste = False
+
+    def read(self) -> str | None:
+        """Current clipboard text, or None if there is none (or it is not text)."""
+        raise NotImplementedError
+
+    def write(self, text: str, confirm: bool = False) -> bool:
+        raise NotImplementedError
+
+    def send_paste(self) -> None:
+        raise NotImplementedError
+
+    def wait_pasted(self, timeout: float) -> bool:
+        """True once the text of the last `write(confirm=True)` has been read."""
+        return False
+
+    def keys_released(self) -> bool:
+        """False while a modifier of the dictation hotkey is still held down
+        (it would turn Ctrl+V into another shortcut)."""
+        return True
+
+    def close(self) -> None:
+        pass
+
+
+class WindowsBackend(OutputBackend):
+    """Win32 clipboard owned by a hidden message-only window.
+
+    For a paste, the clipboard is emptied and CF_UNICODETEXT is announced with
+    no data (delayed rendering). When the target application reads it, Windows
+    sends WM_RENDERFORMAT to our window: we hand over the text and signal the
+    paste as done. Our clipboard content is flagged for clipboard monitors
+    (Windows clipboard history included) to skip, so that only the paste
+    asks for it.
+    """
+
+    kind = "windows"
+    confirms_paste = True
+
+    def __init__(self, open_timeout: float = 0.5):
+        import win32api
+        import win32clipboard
+        import win32con
+        import win32gui
+        import keyboard
+        self._api, self._clipboard, self._con, self._gui = win32api, win32clipboard, win32con, win32gui
+        self._keyboard = keyboard
+        self.open_timeout = open_timeout
+        self._text = ""
+        self._rendered = threading.Event()
+        self._exclude_format = win32clipboard.RegisterClipboardFormat(
+            "ExcludeClipboardContentFromMonitorProcessing")
+        self._hwnd = None
+        ready = threading.Event()
+        threading.Thread(target=self._window_loop, args=(ready,), name="clipboard-owner", daemon=True).start()
+        if not ready.wait(2.0) or not self._hwnd:
+            raise RuntimeError("could not create the clipboard owner window")
+
+    def _window_loop(self, ready: threading.Event) -> None:
+        con, gui = self._con, self._gui
+        wc = gui.WNDCLASS()
+        wc.lpszClassName = "VibeFlowClipboardOwner"
+        wc.hInstance = self._api.GetModuleHandle(None)
+        wc.lpfnWndProc = {con.WM_RENDERFORMAT: self._on_render_format,
+                          con.WM_RENDERALLFORMATS: self._on_render_all_formats,
+                          con.WM_DESTROY: lambda *args: gui.PostQuitMessage(0) or 0}
+        try:
+            gui.RegisterClass(wc)
+            # HWND_MESSAGE: never shown, only receives messages
+            self._hwnd = gui.CreateWindow(wc.lpszClassName, "VibeFlow clipboard", 0, 0, 0, 0, 0,
+                                          getattr(con, "HWND_MESSAGE", -3), 0, wc.hInstance, None)
+        finally:
+            ready.set()
+        gui.PumpMessages()
+
+    def _on_render_format(self, hwnd, msg, wparam, lparam) -> int:
+        # The clipboard is already open by the reader: only SetClipboardData here
+        self._clipboard.SetClipboardText(self._text, self._con.CF_UNICODETEXT)
+        self._rendered.set()
+        return 0
+
+    def _on_render_all_formats(self, hwnd, msg, wparam, lparam) -> int:
+        # Our window is going away while still owning the clipboard: leave the text there
+        self._clipboard.OpenClipboard(hwnd)
+        try:
+            if self._clipboard.GetClipboardOwner() == hwnd:
+                self._clipboard.SetClipboardText(self._text, self._con.CF_UNICODETEXT)
+        finally:
+            self._clipboard.CloseClipboard()
+        return 0
+
+    def _open(self) -> None:
+        """OpenClipboard, retrying while another application holds it open."""
+        deadline = time.monotonic() + self.open_timeout
+        while True:
+            try:
+                self._clipboard.OpenClipboard(self._hwnd)
+                return
+            except self._api.error:
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.005)
+
+    def read(self) -> str | None:
+        self._open()
+        try:
+            if not self._clipboard.IsClipboardFormatAvailable(self._con.CF_UNICODETEXT):
+                return None
+            return self._clipboard.GetClipboardData(self._con.CF_UNICODETEXT)
+        finally:
+            self._clipboard.CloseClipboard()
+
+    def write(self, text: str, confirm: bool = False) -> bool:
+        self._text = text
+        self._rendered.clear()
+        self._open()
+        try:
+            self._clipboard.EmptyClipboard()
+            self._clipboard.SetClipboardData(self._exclude_format, b"\0\0\0\0")
+            if confirm:
+                self._clipboard.SetClipboardData(self._con.CF_UNICODETEXT, 0)  # Rendered on request
+            else:
+                self._clipboard.SetClipboardText(text, self._con.CF_UNICODETEXT)
+        finally:
+            self._clipboard.CloseClipboard()
+        return self._clipboard.GetClipboardOwner() == self._hwnd
+
+    def send_paste(self) -> None:
+        # Only a read after the keystroke counts as the paste
+        self._rendered.clear()
+        self._keyboard.send("ctrl+v")
+
+    def wait_pasted(self, timeout: float) -> bool:
+        return self._rendered.wait(timeout)
+
+    def keys_released(self) -> bool:
+        con = self._con
+        return not any(self._api.GetAsyncKeyState(key) & 0x8000
+                       for key in (con.VK_CONTROL, con.VK_MENU, con.VK_SHIFT, con.VK_LWIN, con.VK_RWIN))
+
+    def close(self) -> None:
+        if self._hwnd:
+            self._gui.PostMessage(self._hwnd, self._con.WM_CLOSE, 0, 0)
+
+
+class LinuxBackend(OutputBackend):
+    """Command-line clipboard tools of an X11 or Wayland session."""
+
+    TOOLS = {"x11": ("xclip", "xdotool"), "wayland": ("wl-copy", "wl-paste", "wtype")}
+
+    def __init__(self, session: str, own_timeout: float = 0.5):
+        missing = [tool for tool in self.TOOLS[session] if shutil.which(tool) is None]
+        if missing:
+            raise RuntimeError(f"{session} output needs {', '.join(missing)} on PATH")
+        self.kind = session
+        self.wayland = session == "wayland"
+        self.confirms_paste = self.wayland
+        self.own_timeout = own_timeout
+        self._server: subprocess.Popen | None = None  # wl-copy serving one paste
+
+    def _run(self, command: list[str], text: str | None = None) -> subprocess.CompletedProcess:
+        return subprocess.run(command, input=text.encode("utf-8") if text is not None else None,
+                              capture_output=True, timeout=2)
+
+    def read(self) -> str | None:
+        command = ["wl-paste", "--no-newline"] if self.wayland else ["xclip", "-selection", "clipboard", "-o"]
+        result = self._run(command)
+        return result.stdout.decode("utf-8", "replace") if result.returncode == 0 else None
+
+    def _offered(self, text: str, consumes_paste: bool) -> bool:
+        """Whether our text is on the clipboard; a paste-once selection is only
+        checked by its types, since reading it would use up the paste."""
+        if consumes_paste:
+            result = self._run(["wl-paste", "--list-types"])
+            return result.returncode == 0 and b"text/plain" in result.stdout
+        return self.read() == text
+
+    def write(self, text: str, confirm: bool = False) -> bool:
+        if self._server is not None and self._server.poll() is None:
+            self._server.terminate()
+        self._server = None
+        if self.wayland and confirm:
+            self._server = subprocess.Popen(["wl-copy", "--foreground", "--paste-once",
+                                             "--type", "text/plain;charset=utf-8"],
+                                            stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                            stderr=subprocess.DEVNULL)
+            self._server.stdin.write(text.encode("utf-8"))
+            self._server.stdin.close()
+        elif self.wayland:
+            self._run(["wl-copy", "--type", "text/plain;charset=utf-8"], text)
+        else:
+            self._run(["xclip", "-selection", "clipboard", "-i"], text)
+        # The tools take the selection in a background process: check it is ours
+        deadline = time.monotonic() + self.own_timeout
+        while not self._offered(text, self._server is not None):
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.005)
+        return True
+
+    def send_paste(self) -> None:
+        if self.wayland:
+            self._run(["wtype", "-M", "ctrl", "v", "-m", "ctrl"])
+        else:
+            self._run(["xdotool", "key", "--clearmodifiers", "ctrl+v"])
+
+    def wait_pasted(self, timeout: float) -> bool:
+        if self._server is None:
+            return False
+        try:
+            return self._server.wait(timeout) == 0
+        except subprocess.TimeoutExpired:
+            return False
+
+    def close(self) -> None:
+        if self._server is not None and self._server.poll() is None:
+            self._server.terminate()
+
+
+class MemoryBackend(OutputBackend):
+    """In-process clipboard: `send_paste` makes the "application" read it at once.
+
+    `pasted_at` (perf_counter) and `last_pasted` tell what was pasted and when;
+    `paste_delay` simulates a slow target application.
+    """
+
+    kind = "memory"
+    confirms_paste = True
+
+    def __init__(self, paste_delay: float = 0.0):
+        self.clipboard: str | None = None
+        self.paste_delay = paste_delay
+        self.paste_count = 0
+        self.last_pasted: str | None = None
+        self.pasted_at: float | None = None
+        self._pasted = threading.Event()
+
+    def read(self) -> str | None:
+        return self.clipboard
+
+    def write(self, text: str, confirm: bool = False) -> bool:
+        self.clipboard = text
+        self._pasted.clear()
+        return True
+
+    def send_paste(self) -> None:
+        if self.paste_delay:
+            time.sleep(self.paste_delay)
+        self.last_pasted = self.clipboard
+        self.paste_count += 1
+        self.pasted_at = time.perf_counter()
+        self._pasted.set()
+
+    def wait_pasted(self, timeout: float) -> bool:
+        return self._pasted.wait(timeout)
+
+
+def create_output_backend(kind: str = "auto") -> OutputBackend:
+    """Build the backend `kind` (see SUPPORTED_OUTPUT_BACKENDS)."""
+    kind = (kind or "auto").strip().lower()
+    if kind == "auto":
+        if sys.platform == "win32":
+            kind = "windows"
+        elif os.getenv("WAYLAND_DISPLAY"):
+            kind = "wayland"
+        elif os.getenv("DISPLAY"):
+            kind = "x11"
+        else:
+            raise RuntimeError("no display found: set VIBEFLOW_OUTPUT_BACKEND (memory for headless runs)")
+    if kind == "windows":
+        backend = WindowsBackend()
+    elif kind in ("x11", "wayland"):
+        backend = LinuxBackend(kind)
+    elif kind == "memory":
+        backend = MemoryBackend()
+    else:
+        raise ValueError(f"Output backend '{kind}' not supported. "
+                         f"Use one of: {', '.join(SUPPORTED_OUTPUT_BACKENDS)}")
+    logger.debug(f"Output backend: {backend.kind}")
+    return backend
@@ -0,0 +1,317 @@
+import os
+import uuid
+import queue
+import logging
+import time
+import threading
+from contextlib import nullcontext
+from metrics import span, observe
+from cancellation import CancellationToken, PipelineCancelled
+from log_setup import trace_context
+
+logger = logging.getLogger("vibeflow")
+
+
+class DictationJob:
+    """One hotkey press travelling through capture → STT → LLM → paste."""
+
+    def __init__(self, seq: int, vibe: str, profile=None):
+        self.seq = seq
+        self.vibe = vibe
+        self.profile = profile  # profiles.Profile with the STT/LLM settings, if known
+        self.trace_id = uuid.uuid4().hex[:8]  # Tags every log record of this dictation
+        self.token = CancellationToken()
+        self.audio_file: str | None = None
+        self.transcript = ""
+        self.final_text = ""
+        self.error: str | None = None  # Set when a stage failed; later stages skip the job
+        self.enqueued_at = time.perf_counter()  # When the job entered its current queue
+        self.captured_at: float | None = None  # End of recording (start of time-to-paste)
+        self.time_to_paste: float | None = None  # Set once pasted
+        self.stage_seconds: dict[str, float] = {}  # Time spent in each stage's handler
+        self.replay_of: int | None = None  # History entry re-rewritten by this job (no capture/STT)
+        self.replay = False
+        self.kept_audio: str | None = None  # Copy of the recording for the history
+
+    @classmethod
+    def rewrite_of(cls, seq: int, vibe: str, transcript: str, entry_id: int | None = None,
+                   profile=None) -> "DictationJob":
+        """A job that re-rewrites an existing transcript: capture and STT are skipped."""
+        job = cls(seq, vibe, profile)
+        job.transcript = transcript
+        job.replay_of = entry_id
+        job.replay = True
+        job.captured_at = job.enqueued_at
+        return job
+
+    @property
+    def skipped(self) -> bool:
+        return self.error is not None or self.token.cancelled
+
+
+class DictationPipeline:
+    """Staged dictation pipeline with persistent workers and bounded queues.
+
+    Each stage (capture, transcription, rewriting, paste) has its own worker
+    thread, so a new recording can start while previous dictations are still
+    being transcribed or rewritten. Every job goes through every stage in FIFO
+    order (failed or cancelled jobs are just passed along), which keeps pastes
+    strictly in submission order. At most `max_pending` jobs can wait between
+    stages; further hotkey presses are rejected.
+
+    Re-rewrites of past transcripts (`resubmit`) enter the same queues, so they
+    are pasted in order with regular dictations. Finished dictations are
+    recorded in `history` when one is given. `profiles` (name -> Profile) gives
+    each job its STT settings and whether to skip the LLM; it can be replaced
+    through apply_when_idle. An SLO `controller` (slo_controller.py) may lower
+    those settings when dictations are slow, and is told how long each one took.
+    A `profiler` (profiler.py) profiles the stages of each job and keeps the
+    profiles of slow dictations.
+    """
+
+    def __init__(self, audio_manager, stt_service, llm_service, clipboard_manager, indicator,
+                 max_pending: int = 3, history=None, profiles: dict | None = None, controller=None,
+                 profiler=None):
+        self.audio_manager = audio_manager
+        self.stt_service = stt_service
+        self.llm_service = llm_service
+        self.clipboard_manager = clipboard_manager
+        self.indicator = indicator
+        self.max_pending = max_pending
+        self.history = history
+        self.profiles = profiles or {}
+        self.controller = controller
+        self.profiler = profiler
+
+        # The microphone is a single resource: one recording at a time
+        self._capture_queue: queue.Queue = queue.Queue(maxsize=1)
+        self._stt_queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._llm_queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._paste_queue: queue.Queue = queue.Queue()
+
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)  # Notified when a job leaves the pipeline
+        self._next_seq = 1
+        self._active: dict[int, DictationJob] = {}  # Submitted and not yet pasted, by seq
+        self._recording = False
+
+        self._workers = [
+            threading.Thread(target=self._run_stage, args=(self._capture_queue, self._capture, self._stt_queue),
+                             name="pipeline-capture", daemon=True),
+            threading.Thread(target=self._run_stage, args=(self._stt_queue, self._transcribe, self._llm_queue),
+                             name="pipeline-stt", daemon=True),
+            threading.Thread(target=self._run_stage, args=(self._llm_queue, self._rewrite, self._paste_queue),
+                             name="pipeline-llm", daemon=True),
+            threading.Thread(target=self._run_stage, args=(self._paste_queue, self._deliver, None),
+                             name="pipeline-paste", daemon=True),
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    @property
+    def busy(self) -> bool:
+        with self._lock:
+            return bool(self._active)
+
+    def submit(self, vibe: str) -> DictationJob | None:
+        """Queue a new dictation. Returns None if it was rejected."""
+        with self._lock:
+            if self._recording:
+                logger.warning("Already recording, press ignored.")
+                return None
+            if len(self._active) > self.max_pending:
+                logger.warning(f"{len(self._active)} dictations still in progress, please wait...")
+                return None
+            job = DictationJob(self._next_seq, vibe, self._profile_for(vibe))
+            self._next_seq += 1
+            self._active[job.seq] = job
+            self._recording = True
+        with trace_context(job.trace_id, "submit"):
+            logger.info(f"--- Dictation #{job.seq} queued ({vibe} mode, {len(self._active)} in flight) ---")
+        self._capture_queue.put(job)
+        return job
+
+    def resubmit(self, transcript: str, vibe: str, entry_id: int | None = None) -> DictationJob | None:
+        """Queue a rewrite of an earlier transcript with `vibe`, without recording or
+        transcribing. Returns None if it was rejected."""
+        with self._lock:
+            if len(self._active) > self.max_pending:
+                logger.warning(f"{len(self._active)} dictations still in progress, please wait...")
+                return None
+            job = DictationJob.rewrite_of(self._next_seq, vibe, transcript, entry_id, self._profile_for(vibe))
+            try:
+                # Never wait on the hotkey thread: the slot is taken while a recording is queued
+                self._capture_queue.put_nowait(job)
+            except queue.Full:
+                logger.warning("Still recording, re-rewrite ignored.")
+                return None
+            self._next_seq += 1
+            self._active[job.seq] = job
+        source = f"history #{entry_id}" if entry_id is not None else "previous transcript"
+        with trace_context(job.trace_id, "submit"):
+            logger.info(f"--- Re-rewrite #{job.seq} of {source} queued ({vibe} mode) ---")
+        return job
+
+    def _profile_for(self, vibe: str):
+        profile = self.profiles.get(vibe)
+        return self.controller.adjust(profile) if self.controller else profile
+
+    def apply_when_idle(self, apply, timeout: float | None = None):
+        """Call `apply()` between dictations: once no job is in flight, and with new
+        submissions held off until it returns. Keep `apply` short (a few attribute
+        swaps). Returns its result, or raises TimeoutError after `timeout` seconds."""
+        with self._idle:
+            if not self._idle.wait_for(lambda: not self._active, timeout):
+                raise TimeoutError("pipeline still busy")
+            return apply()
+
+    def cancel_latest(self) -> bool:
+        """Cancel the most recent dictation that has not been pasted yet."""
+        with self._lock:
+            if not self._active:
+                return False
+            job = self._active[max(self._active)]
+        with trace_context(job.trace_id, "cancel"):
+            logger.info(f"Cancelling dictation #{job.seq}")
+        job.token.cancel()
+        self.indicator.hide()
+        return True
+
+    def stop(self) -> None:
+        """Stop the workers after the jobs already queued."""
+        self._capture_queue.put(None)
+
+    def _run_stage(self, inbox: queue.Queue, handler, outbox: queue.Queue | None) -> None:
+        stage = handler.__name__.lstrip('_')
+        while True:
+            job = inbox.get()
+            if job is None:
+                if outbox is not None:
+                    outbox.put(None)
+                return
+            with trace_context(job.trace_id, stage):
+                self._handle(job, stage, handler, outbox)
+
+    def _handle(self, job: DictationJob, stage: str, handler, outbox: queue.Queue | None) -> None:
+        if not job.skipped:
+            observe("stage_seconds", time.perf_counter() - job.enqueued_at, stage=f"queue_{stage}")
+            start = time.perf_counter()
+            try:
+                with self.profiler.stage(job, stage) if self.profiler else nullcontext():
+                    handler(job)
+                job.stage_seconds[stage] = time.perf_counter() - start
+            except PipelineCancelled:
+                pass
+            except Exception as e:
+                logger.error(f"Dictation #{job.seq} failed: {e}", exc_info=True)
+                job.error = str(e)
+                self.indicator.update_status("error")
+        if handler == self._capture and not job.replay:
+            # Also when recording failed, or the job was cancelled before it started
+            self._release_microphone()
+        if outbox is not None:
+            job.enqueued_at = time.perf_counter()
+            outbox.put(job)  # Blocks when the next stage is full (backpressure)
+        else:
+            self._finish(job)
+
+    def _release_microphone(self) -> None:
+        with self._lock:
+            self._recording = False
+
+    def _capture(self, job: DictationJob) -> None:
+        if job.replay:
+            return
+        logger.info(f"--- Starting VibeFlow #{job.seq} ({job.vibe} mode) ---")
+        self.indicator.show()
+        with span("capture"):
+            job.audio_file = self.audio_manager.record_audio(
+                stop_callback=lambda: self.indicator.stop_recording,
+                spectrum_callback=self.indicator.set_spectrum,
+                cancel_token=job.token,
+                silence_duration=job.profile.silence_duration if job.profile else None,
+            )
+        job.captured_at = time.perf_counter()
+        self._release_microphone()
+        job.token.raise_if_cancelled()
+        if not job.audio_file:
+            logger.warning("No audio recorded. Aborting.")
+            job.error = "no audio"
+            self.indicator.update_status("error")
+            return
+        self.indicator.update_status("processing")
+
+    def _transcribe(self, job: DictationJob) -> None:
+        if job.replay:
+            return
+        if self.history is not None:
+            # STT deletes the WAV; the history compresses its copy later
+            job.kept_audio = self.history.stash_audio(job.audio_file)
+        options = job.profile.stt_options() if job.profile else {}
+        with span("stt"):
+            job.transcript = self.stt_service.transcribe(job.audio_file, cancel_token=job.token, **options)
+        if not job.transcript:
+            logger.warning("Transcription failed or empty. Aborting.")
+            job.error = "empty transcription"
+            self.indicator.update_status("error")
+
+    def _rewrite(self, job: DictationJob) -> None:
+        if job.profile and job.profile.skip_llm:
+            logger.info(f"Profile {job.vibe} skips the LLM: pasting the transcript")
+            job.final_text = job.transcript
+            return
+        with span("llm"):
+            job.final_text = self.llm_service.rewrite_text(job.transcript, job.vibe, cancel_token=job.token,
+                                                           profile=job.profile)
+        if not job.final_text:
+            logger.warning("Rewriting failed. Aborting.")
+            job.error = "empty rewrite"
+            self.indicator.update_status("error")
+
+    def _deliver(self, job: DictationJob) -> None:
+        logger.info(f"Final output #{job.seq}: {job.final_text}")
+
+        # Hide overlay unless a newer dictation is recording
+        with self._lock:
+            recording = self._recording
+        if not recording:
+            self.indicator.hide()
+
+        # Let go of the hotkey's modifiers before Ctrl+V (last chance to cancel)
+        with span("focus_wait"):
+            ready = self.clipboard_manager.wait_ready(timeout=0.3, cancel_token=job.token)
+        if not ready:
+            raise PipelineCancelled()
+
+        with span("paste"):
+            self.clipboard_manager.paste_text(job.final_text)
+        job.time_to_paste = time.perf_counter() - job.captured_at
+        observe("stage_seconds", job.time_to_paste, stage="time_to_paste")
+        if self.controller is not None and not job.replay:
+            self.controller.record(job.time_to_paste, job.stage_seconds)
+        self.audio_manager.play_sound("success")
+        logger.info(f"--- VibeFlow #{job.seq} complete ---")
+
+    def _finish(self, job: DictationJob) -> None:
+        with self._lock:
+            self._active.pop(job.seq, None)
+            self._idle.notify_all()
+        if job.token.cancelled:
+            logger.info(f"--- Dictation #{job.seq} cancelled, nothing pasted ---")
+        elif self.history is not None and job.transcript and job.error is None:
+            try:
+                self.history.record(job.transcript, job.final_text, job.vibe, provider=self.llm_service.provider,
+                                    trace_id=job.trace_id, parent_id=job.replay_of, audio_file=job.kept_audio)
+                job.kept_audio = None
+            except Exception as e:
+                logger.error(f"Could not record dictation #{job.seq} in the history: {e}")
+        if self.profiler is not None:
+            self.profiler.finish(job)
+        if job.kept_audio and os.path.exists(job.kept_audio):
+            os.remove(job.kept_audio)
+        # Remove the temp WAV if the job was dropped before STT consumed it
+        if job.audio_file and os.path.exists(job.audio_file):
+            try:
+                os.remove(job.audio_file)
+            except OSError:
+                pass
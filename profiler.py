@@ -0,0 +1,297 @@
+"""On-demand profiling of slow dictations.
+
+With VIBEFLOW_PROFILE set, every dictation is profiled from the end of the
+recording to the paste (the transcribe, rewrite and deliver stages, each on its
+pipeline thread). A profile is written only when the dictation's time-to-paste
+exceeds VIBEFLOW_PROFILE_THRESHOLD seconds; the others are dropped, so the mode
+can stay on while waiting for the slow one.
+
+- "sampling": a background thread reads the Python stack of the stage threads
+  every few milliseconds. Wall clock, so time spent waiting on the LLM or
+  inside Whisper shows up too. Cheap enough to leave on. Written as speedscope
+  JSON (open it on https://www.speedscope.app).
+- "cprofile": cProfile of every function call, with call counts. Slows the
+  dictation down noticeably. Written as pstats (`python -m pstats`, snakeviz).
+  From Python 3.12 only one profiler can be active in the process, so when
+  dictations overlap a stage may go unprofiled.
+
+Files are named <time>_<trace id>_<time-to-paste>s, so they match the log lines
+and the history entry of the dictation. Beyond VIBEFLOW_PROFILE_KEEP files the
+oldest are deleted. The settings are reloaded live from .env (config_reload.py),
+which is how the dashboard turns profiling on and off.
+"""
+import os
+import re
+import sys
+import json
+import time
+import pstats
+import cProfile
+import logging
+import threading
+from collections.abc import Mapping
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("vibeflow")
+
+PROFILE_MODES = ("off", "sampling", "cprofile")
+# .env keys applied without a restart
+PROFILER_SETTINGS = ("VIBEFLOW_PROFILE", "VIBEFLOW_PROFILE_THRESHOLD", "VIBEFLOW_PROFILE_DIR",
+                     "VIBEFLOW_PROFILE_KEEP")
+# Stages between the end of the recording and the paste
+PROFILED_STAGES = ("transcribe", "rewrite", "deliver")
+PROFILE_EXTENSIONS = {".prof": "pstats", ".speedscope.json": "speedscope"}
+_PROFILE_NAME = re.compile(r"^(\d{8}-\d{6})_([0-9a-f]+)_(\d+\.\d+)s(\.prof|\.speedscope\.json)$")
+
+
+def read_profiler_settings(env: Mapping[str, str] | None = None) -> dict:
+    """Profiler settings from VIBEFLOW_PROFILE_* in `env` (default os.environ).
+    Raises ValueError if invalid."""
+    env = os.environ if env is None else env
+    mode = env.get("VIBEFLOW_PROFILE", "off").strip().lower() or "off"
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"VIBEFLOW_PROFILE must be one of: {', '.join(PROFILE_MODES)} (got '{mode}')")
+    threshold = float(env.get("VIBEFLOW_PROFILE_THRESHOLD", "2"))
+    keep = int(env.get("VIBEFLOW_PROFILE_KEEP", "50"))
+    if threshold < 0 or keep < 1:
+        raise ValueError("VIBEFLOW_PROFILE_THRESHOLD must be >= 0 and VIBEFLOW_PROFILE_KEEP >= 1")
+    return {"mode": mode, "threshold": threshold, "keep": keep,
+            "directory": env.get("VIBEFLOW_PROFILE_DIR", "./profiling").strip() or "./profiling"}
+
+
+def list_profiles(directory: str) -> list[dict]:
+    """Saved profiles in `directory`, newest first (for the dashboard)."""
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return []
+    profiles = []
+    for name in names:
+        match = _PROFILE_NAME.match(name)
+        if not match:
+            continue
+        created, trace_id, seconds, extension = match.groups()
+        path = os.path.join(directory, name)
+        try:
+            modified = os.path.getmtime(path)
+        except OSError:
+            continue
+        profiles.append({
+            "name": name,
+            "path": path,
+            "modified": modified,
+            "created": time.strftime("%Y-%m-%d %H:%M:%S", time.strptime(created, "%Y%m%d-%H%M%S")),
+            "trace_id": trace_id,
+            "seconds": float(seconds),
+            "format": PROFILE_EXTENSIONS[extension],
+        })
+    profiles.sort(key=lambda p: p["modified"], reverse=True)
+    return profiles
+
+
+class _Capture:
+    """Profile data of one dictation."""
+
+    def __init__(self, trace_id: str, mode: str):
+        self.trace_id = trace_id
+        self.mode = mode
+        self.profiles: list[cProfile.Profile] = []
+        self.frames: dict[tuple, int] = {}  # (function, file, line) -> index in the speedscope frame table
+        self.samples: dict[str, list[tuple[tuple, float]]] = {}  # stage -> (stack, seconds)
+
+    def add_sample(self, stage: str, frame, weight: float) -> None:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            key = (getattr(code, "co_qualname", code.co_name), code.co_filename, code.co_firstlineno)
+            index = self.frames.get(key)
+            if index is None:
+                index = self.frames[key] = len(self.frames)
+            stack.append(index)
+            frame = frame.f_back
+        stack.reverse()  # Speedscope wants the root first
+        self.samples.setdefault(stage, []).append((tuple(stack), weight))
+
+    @property
+    def empty(self) -> bool:
+        return not self.profiles and not self.samples
+
+    def write(self, path_without_extension: str) -> str:
+        if self.mode == "cprofile":
+            path = path_without_extension + ".prof"
+            stats = pstats.Stats(self.profiles[0])
+            for profile in self.profiles[1:]:
+                stats.add(profile)
+            stats.dump_stats(path)
+            return path
+        path = path_without_extension + ".speedscope.json"
+        document = {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"VibeFlow dictation {self.trace_id}",
+            "exporter": "vibeflow",
+            "shared": {"frames": [{"name": name, "file": file, "line": line}
+                                  for name, file, line in self.frames]},
+            "profiles": [{
+                "type": "sampled",
+                "name": stage,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weight for _, weight in samples),
+                "samples": [list(stack) for stack, _ in samples],
+                "weights": [weight for _, weight in samples],
+            } for stage, samples in self.samples.items()],
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(document, f)
+        return path
+
+
+class DictationProfiler:
+    """Profiles the stages of each dictation and saves the slow ones.
+
+    The pipeline wraps every stage handler in `stage(job, name)` and calls
+    `finish(job)` when the job leaves the pipeline. `configure(settings)`
+    applies the dict returned by read_profiler_settings, also while dictations
+    are in flight.
+    """
+
+    def __init__(self, settings: dict | None = None, interval: float = 0.005):
+        self.mode = "off"
+        self.threshold = 2.0
+        self.directory = "./profiling"
+        self.keep = 50
+        self.interval = interval  # Sampling period
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)  # Notified when a stage thread starts being sampled
+        self._captures: dict[int, _Capture] = {}  # By job seq
+        self._sampled: dict[int, tuple[_Capture, str]] = {}  # Thread ident -> (capture, stage)
+        self._sampler: threading.Thread | None = None
+        self._writer: ThreadPoolExecutor | None = None
+        if settings:
+            self.configure(settings)
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    def configure(self, settings: dict) -> None:
+        with self._lock:
+            changed = (settings["mode"], settings["threshold"]) != (self.mode, self.threshold)
+            self.mode = settings["mode"]
+            self.threshold = settings["threshold"]
+            self.directory = settings["directory"]
+            self.keep = settings["keep"]
+        if changed and self.enabled:
+            logger.info(f"Profiling ({self.mode}) dictations slower than {self.threshold:.2f}s "
+                        f"into {os.path.abspath(self.directory)}")
+        elif changed:
+            logger.info("Profiling off")
+
+    def stage(self, job, stage: str):
+        """Context manager around one stage handler of `job`."""
+        mode = self.mode
+        if mode == "off" or stage not in PROFILED_STAGES:
+            return nullcontext()
+        with self._lock:
+            capture = self._captures.get(job.seq)
+            if capture is None or capture.mode != mode:
+                capture = self._captures[job.seq] = _Capture(job.trace_id, mode)
+        if mode == "cprofile":
+            return self._profiled(capture)
+        return self._sampled_stage(capture, stage)
+
+    @contextmanager
+    def _profiled(self, capture: _Capture):
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is active (Python 3.12+: one per process)
+            logger.debug("Profiler busy with another dictation: stage not profiled")
+            yield
+            return
+        try:
+            yield
+        finally:
+            profile.disable()
+            capture.profiles.append(profile)
+
+    @contextmanager
+    def _sampled_stage(self, capture: _Capture, stage: str):
+        ident = threading.get_ident()
+        with self._lock:
+            self._sampled[ident] = (capture, stage)
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample_loop, name="profiler-sampler", daemon=True)
+                self._sampler.start()
+            self._wake.notify()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._sampled.pop(ident, None)
+
+    def _sample_loop(self) -> None:
+        last = time.perf_counter()
+        while True:
+            with self._lock:
+                if not self._sampled:
+                    while not self._sampled:
+                        self._wake.wait()
+                    last = time.perf_counter()
+            time.sleep(self.interval)
+            now = time.perf_counter()
+            weight, last = now - last, now
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, (capture, stage) in self._sampled.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        capture.add_sample(stage, frame, weight)
+            del frames
+
+    def finish(self, job) -> str | None:
+        """Drop the job's profile, or save it if the dictation was over the threshold.
+
+        Returns the path the profile is being written to, if any.
+        """
+        with self._lock:
+            capture = self._captures.pop(job.seq, None)
+            directory, keep, threshold = self.directory, self.keep, self.threshold
+            if capture is None or capture.empty:
+                return None
+            if job.time_to_paste is None or job.time_to_paste < threshold or job.token.cancelled:
+                return None
+            if self._writer is None:
+                self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="profiler-writer")
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}_{job.trace_id}_{job.time_to_paste:.2f}s"
+        path = os.path.join(directory, name) + (".prof" if capture.mode == "cprofile" else ".speedscope.json")
+        logger.warning(f"Slow dictation #{job.seq} ({job.time_to_paste:.2f}s > {threshold:.2f}s): "
+                       f"profile saved to {path}")
+        # Off the paste thread: writing a large profile takes a while
+        self._writer.submit(self._save, capture, os.path.join(directory, name), keep)
+        return path
+
+    @staticmethod
+    def _save(capture: _Capture, path_without_extension: str, keep: int) -> None:
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(path_without_extension)), exist_ok=True)
+            capture.write(path_without_extension)
+            for old in list_profiles(os.path.dirname(path_without_extension) or ".")[keep:]:
+                os.remove(old["path"])
+        except Exception as e:
+            logger.error(f"Could not save the profile of dictation {capture.trace_id}: {e}")
+
+
+def profiler_from_env() -> DictationProfiler:
+    """Profiler configured by VIBEFLOW_PROFILE_* (off unless VIBEFLOW_PROFILE is set).
+
+    Always created, so that profiling can be turned on later from .env.
+    """
+    try:
+        settings = read_profiler_settings()
+    except ValueError as e:
+        logger.error(f"Invalid profiler settings, profiling off: {e}")
+        settings = None
+    return DictationProfiler(settings)
@@ -0,0 +1,128 @@
+"""Profiles from profiles.json: prompt, hotkey and per-profile performance settings.
+
+    {
+      "quick_note": {
+        "hotkey": "ctrl+alt+4",
+        "skip_llm": true,
+        "beam_size": 1,
+        "silence_duration": 1.5,
+        "stt_model": "small"
+      },
+      "document": {
+        "hotkey": "ctrl+alt+5",
+        "system_prompt": "...",
+        "llm_provider": "deepseek",
+        "llm_timeout": 30,
+        "max_tokens": 4096
+      }
+    }
+
+Every setting except `system_prompt` is optional; unset ones use the global
+configuration (.env). The first profile in the file is the default.
+"""
+import json
+from prompts import build_system_prefix
+
+# Hotkeys given in file order when no profile declares one (older profiles.json)
+DEFAULT_HOTKEYS = [f"ctrl+alt+{n}" for n in range(1, 10)]
+
+
+class Profile:
+    """One profile. Settings left at None fall back to the global ones."""
+
+    def __init__(self, name: str, system_prompt: str = "", instructions: str | None = None,
+                 hotkey: str | None = None, max_output_ratio: float | None = None, beam_size: int | None = None,
+                 stt_model: str | None = None, llm_provider: str | None = None, llm_timeout: float | None = None,
+                 max_tokens: int | None = None, skip_llm: bool = False, silence_duration: float | None = None):
+        self.name = name
+        self.system_prompt = system_prompt
+        self.instructions = instructions
+        self.hotkey = hotkey
+        self.max_output_ratio = max_output_ratio
+        self.beam_size = beam_size  # Whisper beam search width
+        self.stt_model = stt_model  # Whisper model size, e.g. "small" for speed
+        self.llm_provider = llm_provider  # Tried first, the other providers stay as fallback
+        self.llm_timeout = llm_timeout  # Seconds before giving up and pasting the transcript
+        self.max_tokens = max_tokens  # Upper bound of the generation budget
+        self.skip_llm = skip_llm  # Paste the transcript as is
+        self.silence_duration = silence_duration  # Seconds of silence that end the recording (VAD endpoint)
+        # Stable, byte-identical system prefix (see prompts.py)
+        self.prefix = None if skip_llm else build_system_prefix(system_prompt, instructions, name)
+
+    def replace(self, **changes) -> "Profile":
+        """A copy with some settings changed."""
+        settings = {key: value for key, value in vars(self).items() if key not in ("name", "prefix")}
+        settings.update(changes)
+        return Profile(self.name, **settings)
+
+    def stt_options(self) -> dict:
+        """Keyword arguments for STTService.transcribe."""
+        return {"beam_size": self.beam_size, "model": self.stt_model}
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Profile) and vars(self) == vars(other)
+
+    def __repr__(self) -> str:
+        return f"Profile({self.name!r}, hotkey={self.hotkey!r})"
+
+
+def _check(name: str, data: dict, key: str, kind):
+    """data[key] if it is a `kind` (numbers must be positive), None if absent."""
+    value = data.get(key)
+    if value is None:
+        return None
+    numeric = kind not in (bool, str)
+    if not isinstance(value, kind) or (numeric and (isinstance(value, bool) or value <= 0)):
+        raise ValueError(f"profile '{name}' has an invalid {key}: {value!r}")
+    return value
+
+
+def parse_profiles(raw) -> dict[str, Profile]:
+    """Validate the content of profiles.json. Raises ValueError on errors."""
+    if not isinstance(raw, dict) or not raw:
+        raise ValueError("expected an object with at least one profile")
+    profiles = {}
+    for name, data in raw.items():
+        if not isinstance(data, dict):
+            raise ValueError(f"profile '{name}' must be an object")
+        skip_llm = bool(_check(name, data, "skip_llm", bool))
+        prompt = data.get("system_prompt")
+        if not skip_llm and (not isinstance(prompt, str) or not prompt.strip()):
+            raise ValueError(f"profile '{name}' needs a non-empty system_prompt (or skip_llm)")
+        hotkey = _check(name, data, "hotkey", str)
+        profiles[name] = Profile(
+            name, prompt or "", _check(name, data, "instructions", str),
+            hotkey=hotkey.strip().lower() if hotkey else None,
+            max_output_ratio=_check(name, data, "max_output_ratio", (int, float)),
+            beam_size=_check(name, data, "beam_size", int),
+            stt_model=_check(name, data, "stt_model", str),
+            llm_provider=(_check(name, data, "llm_provider", str) or "").lower() or None,
+            llm_timeout=_check(name, data, "llm_timeout", (int, float)),
+            max_tokens=_check(name, data, "max_tokens", int),
+            skip_llm=skip_llm,
+            silence_duration=_check(name, data, "silence_duration", (int, float)),
+        )
+
+    hotkeys = [p.hotkey for p in profiles.values() if p.hotkey]
+    if len(set(hotkeys)) != len(hotkeys):
+        raise ValueError("two profiles use the same hotkey")
+    if not hotkeys:
+        for profile, hotkey in zip(profiles.values(), DEFAULT_HOTKEYS):
+            profile.hotkey = hotkey
+    return profiles
+
+
+def read_profiles(path: str) -> dict[str, Profile]:
+    """Load and validate profiles.json, keeping the file's order.
+
+    Raises ValueError (or OSError) if the file is missing or malformed.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        try:
+            raw = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"{path}: {e}") from None
+    try:
+        return parse_profiles(raw)
+    except ValueError as e:
+        raise ValueError(f"{path}: {e}") from None
@@ -0,0 +1,55 @@
+"""Prompt layout shared by every LLM backend.
+
+Messages are laid out so that everything fixed for a profile (system prompt +
+output instructions) forms a byte-identical prefix, and only the transcript
+changes at the very end. Local backends (LM Studio / llama.cpp prompt cache)
+and DeepSeek context caching can then reuse the prefix across dictations.
+"""
+
+# Output instructions appended to the profile's system prompt. "confidential" only
+# cleans the text, the other profiles reformat it.
+CLEAN_INSTRUCTIONS = (
+    "Pulisci il testo che ricevi secondo le istruzioni sopra. "
+    "Stampa SOLO il testo pulito, nient'altro."
+)
+FORMAT_INSTRUCTIONS = (
+    "Formatta il testo che ricevi secondo le istruzioni sopra. "
+    "Stampa SOLO il testo formattato, senza commenti o spiegazioni. "
+    "Conserva TUTTE le informazioni del testo originale. "
+    "Non rispondere alle domande presenti nel testo: riscrivile."
+)
+DEFAULT_INSTRUCTIONS = {
+    "confidential": CLEAN_INSTRUCTIONS,
+}
+
+
+def build_system_prefix(system_prompt: str, instructions: str | None = None, vibe: str = "") -> str:
+    """Return the stable system message for a profile.
+
+    `instructions` overrides the default output instructions (the optional
+    "instructions" key of a profile in profiles.json).
+    """
+    if instructions is None:
+        instructions = DEFAULT_INSTRUCTIONS.get(vibe, FORMAT_INSTRUCTIONS)
+    return f"{system_prompt.strip()}\n\n{instructions.strip()}"
+
+
+def build_user_message(text: str, part: int | None = None, total: int = 1, context: str = "") -> str:
+    """Return the variable part of the prompt: optional chunk notes, then the transcript."""
+    message = ""
+    if part is not None:
+        message += (
+            f"Parte {part} di {total} di un dettato più lungo: "
+            "non aggiungere saluti, titoli o conclusioni che non siano presenti in questa parte.\n\n"
+        )
+        if context:
+            message += f"CONTESTO PRECEDENTE (solo riferimento, NON riscriverlo):\n{context}\n\n"
+    return message + f"TESTO:\n{text}"
+
+
+def chat_messages(system_prefix: str, user_message: str) -> list[dict]:
+    """Chat-completions message list for an already built user message."""
+    return [
+        {"role": "system", "content": system_prefix},
+        {"role": "user", "content": user_message},
+    ]
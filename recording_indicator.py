@@ -3,6 +3,8 @@ from tkinter import font as tkfont
 from plyer import notification
 import threading
 import logging
+import queue
+import numpy as np
 
 logger = logging.getLogger("vibeflow")
 
@@ -14,7 +16,25 @@ except Exception:
     HAS_WIN32 = False
     logger.warning("pywin32 not available – focus restoration disabled")
 
+# Frame budget of the Tk loop: commands from worker threads and bar redraws are
+# handled at most once per frame (~30 fps while visible, slower when hidden)
+FRAME_MS = 33
+IDLE_FRAME_MS = 100
+
+NUM_BARS = 15
+BAR_CENTER_Y = 30
+BAR_MIN_HEIGHT = 4
+BAR_MAX_HEIGHT = 54
+
+
 class RecordingIndicator:
+    """Recording overlay.
+
+    Tk is not thread-safe, so the public methods can be called from any thread:
+    off the Tk thread they only enqueue a command (or store the latest levels)
+    and return immediately; the Tk thread applies them once per frame.
+    """
+
     def __init__(self, provider="lmstudio"):
         """Initialize with pre-created window for better threading support."""
         self.window = None
@@ -25,13 +45,17 @@ class RecordingIndicator:
         self.saved_window_handle = None  # Save active window
         self.current_rms = 0.0  # Latest audio level from AudioManager
         self.provider = provider  # LLM provider (lmstudio or deepseek)
+        self._commands: queue.SimpleQueue = queue.SimpleQueue()  # (fn, args) for the Tk thread
+        self._levels: np.ndarray | None = None  # Latest band levels, replaced by the audio thread
+        self._drawn_levels: np.ndarray | None = None
+        self._drawn_heights = np.zeros(NUM_BARS, dtype=int)
+        self._ui_thread: int | None = None
         
         # Try to initialize Tkinter window
         try:
             self._init_window()
         except Exception as e:
-            print(f"Tkinter overlay not available: {e}")
-            print("Using Windows notifications instead.")
+            logger.warning(f"Tkinter overlay not available: {e}. Using Windows notifications instead.")
             self.use_notifications = True
     
     def _init_window(self):
@@ -101,24 +125,24 @@ class RecordingIndicator:
         self.canvas = tk.Canvas(self.window, bg='#1a1a1a', highlightthickness=0, height=60)
         self.canvas.pack(fill=tk.BOTH, padx=20, pady=10)
         
-        # Create waveform bars
+        # Create waveform bars (x positions kept, so redraws never query the canvas)
         self.waveform_bars = []
-        num_bars = 15
+        self._bar_x = []
         bar_width = 6
         spacing = 4
         canvas_width = 240  # approx canvas width
-        total_bars_width = num_bars * bar_width + (num_bars - 1) * spacing
+        total_bars_width = NUM_BARS * bar_width + (NUM_BARS - 1) * spacing
         start_x = (canvas_width - total_bars_width) // 2
         
-        for i in range(num_bars):
+        for i in range(NUM_BARS):
             x = start_x + i * (bar_width + spacing)
-            # Create bars with varying initial heights
             bar = self.canvas.create_rectangle(
-                x, 30, x + bar_width, 30,
+                x, BAR_CENTER_Y, x + bar_width, BAR_CENTER_Y,
                 fill='white',
                 outline=''
             )
             self.waveform_bars.append(bar)
+            self._bar_x.append((x, x + bar_width))
         
         # Bottom bar with provider icon
         bottom_frame = tk.Frame(self.window, bg='#1a1a1a', height=30)
@@ -137,10 +161,50 @@ class RecordingIndicator:
         
         # Start hidden
         self.window.withdraw()
+
+        # The thread that created the window runs its mainloop (main.py)
+        self._ui_thread = threading.get_ident()
+        self.window.after(IDLE_FRAME_MS, self._frame)
+
+    def _run_on_ui(self, fn, *args) -> None:
+        """Call fn now if we are on the Tk thread, otherwise at the next frame."""
+        if threading.get_ident() == self._ui_thread:
+            fn(*args)
+        else:
+            self._commands.put((fn, args))
+
+    def _frame(self):
+        """One frame of the Tk thread: apply queued commands, then redraw the bars
+        if their levels changed."""
+        while True:
+            try:
+                fn, args = self._commands.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                fn(*args)
+            except Exception as e:
+                logger.error(f"Overlay update failed: {e}")
+        if self.is_showing and self.animation_running:
+            self._draw_levels()
+        self.window.after(FRAME_MS if self.is_showing else IDLE_FRAME_MS, self._frame)
+
+    def _draw_levels(self):
+        levels = self._levels
+        if levels is None or levels is self._drawn_levels:
+            return
+        self._drawn_levels = levels
+        # Even heights keep the bars centred on whole pixels
+        heights = (BAR_MIN_HEIGHT + levels * (BAR_MAX_HEIGHT - BAR_MIN_HEIGHT)).astype(int) & ~1
+        for i in np.flatnonzero(heights != self._drawn_heights):
+            x1, x2 = self._bar_x[i]
+            half = heights[i] // 2
+            self.canvas.coords(self.waveform_bars[i], x1, BAR_CENTER_Y - half, x2, BAR_CENTER_Y + half)
+        self._drawn_heights = heights
     
     def _on_stop_clicked(self):
         """Handle stop button click."""
-        print("Stop button clicked - ending recording")
+        logger.info("Stop button clicked - ending recording")
         self.stop_recording = True
         self.stop_button.config(bg='#666666', state='disabled')
         
@@ -148,102 +212,104 @@ class RecordingIndicator:
         if HAS_WIN32 and self.saved_window_handle:
             try:
                 win32gui.SetForegroundWindow(self.saved_window_handle)
-                print(f"Focus restored to window: {self.saved_window_handle}")
+                logger.debug(f"Focus restored to window: {self.saved_window_handle}")
             except Exception as e:
-                print(f"Could not restore focus: {e}")
+                logger.warning(f"Could not restore focus: {e}")
     
     def _on_confirm_clicked(self):
         """Handle confirm button click (same as stop for now)."""
         self._on_stop_clicked()
     
     def show(self):
-        """Show the recording indicator."""
+        """Show the recording indicator (returns immediately)."""
         if self.use_notifications:
             self._show_notification("Recording", "🎤 Listening... (press hotkey again to stop)")
             return
             
-        if self.is_showing or not self.window:
+        if not self.window:
             return
-        
+
+        # Reset here, not on the Tk thread: the recording that starts right after
+        # this call polls the flag before the next frame
+        self.stop_recording = False
+        self._levels = None
+        self._run_on_ui(self._show)
+
+    def _show(self):
+        if self.is_showing:
+            # A previous dictation is still processing: switch back to recording mode
+            self._arm_recording()
+            return
+
         # Save the currently active window BEFORE showing overlay
         if HAS_WIN32:
             try:
                 self.saved_window_handle = win32gui.GetForegroundWindow()
                 window_title = win32gui.GetWindowText(self.saved_window_handle)
-                print(f"Saved focus from window: {window_title} (handle: {self.saved_window_handle})")
+                logger.debug(f"Saved focus from window: {window_title} (handle: {self.saved_window_handle})")
             except Exception as e:
-                print(f"Could not save window handle: {e}")
+                logger.warning(f"Could not save window handle: {e}")
                 self.saved_window_handle = None
             
         self.is_showing = True
-        self.stop_recording = False  # Reset stop flag
         try:
-            provider_icon = '💻' if self.provider == 'lmstudio' else '☁️'
-            self.label.config(text=f'🎤 {provider_icon}')
-            self.stop_button.config(bg='#2a2a2a', state='normal')
-            self.confirm_button.config(bg='#2a2a2a', state='normal')
+            self._arm_recording()
             self.window.deiconify()
             self.window.lift()
             # Don't steal focus - let user's app keep focus
-            
-            # Start waveform animation
-            self.animation_running = True
-            self._animate_waveform()
         except Exception as e:
-            print(f"Error showing overlay: {e}")
+            logger.error(f"Error showing overlay: {e}")
             self.use_notifications = True
             self._show_notification("Recording", "🎤 Listening...")
     
+    def _arm_recording(self):
+        """Reset buttons, label and bars for a new recording."""
+        provider_icon = '💻' if self.provider == 'lmstudio' else '☁️'
+        self.label.config(text=f'🎤 {provider_icon}')
+        self.stop_button.config(bg='#2a2a2a', state='normal')
+        self.confirm_button.config(bg='#2a2a2a', state='normal')
+        self._set_bar_color('white')
+        # Bars follow the audio levels from the next frame on
+        self._drawn_levels = None
+        self.animation_running = True
+
     def hide(self):
-        """Hide the recording indicator."""
-        if self.use_notifications:
+        """Hide the recording indicator (returns immediately)."""
+        if self.use_notifications or not self.window:
             return
-            
+        self._run_on_ui(self._hide)
+
+    def _hide(self):
         if not self.is_showing:
             return
             
         self.is_showing = False
         self.animation_running = False
         try:
-            if self.window:
-                self.window.withdraw()
-        except:
+            self.window.withdraw()
+        except Exception:
             pass
-    
-    def set_audio_level(self, rms: float) -> None:
-        """Called by AudioManager with the current RMS level of each audio chunk.
 
-        Thread-safe: AudioManager runs in a background thread.
-        """
-        self.current_rms = rms
+    def set_spectrum(self, levels: np.ndarray) -> None:
+        """Called by AudioManager with the band levels (0.0–1.0) of each audio chunk.
 
-    def _animate_waveform(self):
-        """Animate waveform bars driven by the real audio RMS level."""
-        if not self.animation_running or not self.window or not self.is_showing:
-            return
-
-        try:
-            import random
+        Thread-safe and non-blocking: only the latest levels are kept and the Tk
+        thread draws them at its next frame.
+        """
+        self._levels = levels
 
-            # Scale RMS (typical range 0.0–0.05) to bar height (4–50 px).
-            # Clamp so very loud audio doesn't overflow the canvas.
-            base_height = max(4, min(50, int(self.current_rms * 1200)))
+    def set_audio_level(self, rms: float) -> None:
+        """Drive all bars from a single RMS level (no spectrum available)."""
+        self.current_rms = rms
+        # Same scale as the former RMS animation (full height at ~0.04)
+        self._levels = np.full(NUM_BARS, min(1.0, rms * 24), dtype=np.float32)
 
-            for bar in self.waveform_bars:
-                # Add small per-bar jitter so the waveform looks natural
-                height = max(3, min(55, base_height + random.randint(-6, 6)))
-                coords = self.canvas.coords(bar)
-                x1, _, x2, _ = coords
-                center_y = 30
-                self.canvas.coords(bar, x1, center_y - height // 2, x2, center_y + height // 2)
+    def _set_bar_color(self, color):
+        for bar in self.waveform_bars:
+            self.canvas.itemconfig(bar, fill=color)
 
-            # Continue animation
-            self.window.after(80, self._animate_waveform)
-        except Exception:
-            pass
-    
     def update_status(self, status_text):
-        """Update status indicator."""
+        """Update status indicator (returns immediately)."""
         if self.use_notifications:
             messages = {
                 "processing": ("Processing", "⚙️ Transcribing..."),
@@ -256,30 +322,29 @@ class RecordingIndicator:
         
         if not self.window:
             return
-            
+        self._run_on_ui(self._update_status, status_text)
+
+    def _update_status(self, status_text):
         try:
             if status_text == "processing":
                 self.label.config(text='⚙️')
                 # Change bars to orange
-                for bar in self.waveform_bars:
-                    self.canvas.itemconfig(bar, fill='#ffa500')
+                self._set_bar_color('#ffa500')
                 self.animation_running = False
             elif status_text == "success":
                 self.label.config(text='✓')
                 # Change bars to green
-                for bar in self.waveform_bars:
-                    self.canvas.itemconfig(bar, fill='#00ff00')
+                self._set_bar_color('#00ff00')
                 self.animation_running = False
-                self.window.after(1200, self.hide)
+                self.window.after(1200, self._hide)
             elif status_text == "error":
                 self.label.config(text='✗')
                 # Change bars to red
-                for bar in self.waveform_bars:
-                    self.canvas.itemconfig(bar, fill='#ff3333')
+                self._set_bar_color('#ff3333')
                 self.animation_running = False
-                self.window.after(2000, self.hide)
+                self.window.after(2000, self._hide)
         except Exception as e:
-            print(f"Error updating status: {e}")
+            logger.error(f"Error updating status: {e}")
     
     def _show_notification(self, title, message):
         """Fallback to Windows notifications."""
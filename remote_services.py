@@ -0,0 +1,124 @@
+"""Clients for a shared VibeFlow server (vibeflow_server.py).
+
+Drop-in replacements for STTService and LLMService used by main.py and
+dashboard.py when VIBEFLOW_SERVER_URL is set: no model is loaded locally.
+"""
+import os
+import time
+import logging
+from cancellation import PipelineCancelled
+
+logger = logging.getLogger("vibeflow")
+
+
+def server_url() -> str:
+    """Base URL of the shared server, or "" to load the models in-process."""
+    return os.getenv("VIBEFLOW_SERVER_URL", "").strip().rstrip("/")
+
+
+class _RemoteClient:
+    def __init__(self, base_url: str, timeout: float | None = None):
+        import httpx
+        self.base_url = base_url
+        timeout = timeout if timeout is not None else float(os.getenv("VIBEFLOW_SERVER_TIMEOUT", "120"))
+        self.client = httpx.Client(base_url=base_url, timeout=httpx.Timeout(timeout, connect=5.0))
+
+    def _post(self, path: str, cancel_token=None, **kwargs):
+        # A request in flight cannot be interrupted: cancellation is honoured before
+        # sending and when the response arrives
+        if cancel_token:
+            cancel_token.raise_if_cancelled()
+        response = self.client.post(path, **kwargs)
+        if cancel_token:
+            cancel_token.raise_if_cancelled()
+        response.raise_for_status()
+        return response.json()
+
+
+class RemoteSTTService(_RemoteClient):
+    """STTService interface backed by POST /v1/audio/transcriptions."""
+
+    def __init__(self, base_url: str):
+        super().__init__(base_url)
+        logger.info(f"Using remote transcription at {base_url}")
+
+    def transcribe(self, audio_file: str, cancel_token=None, beam_size: int | None = None,
+                   model: str | None = None) -> str:
+        """Transcribe `audio_file` on the server and delete it (like STTService).
+
+        `beam_size` and `model` are ignored: decoding settings are the server's.
+        """
+        if not audio_file or not os.path.exists(audio_file):
+            return ""
+        try:
+            with open(audio_file, "rb") as f:
+                result = self._post("/v1/audio/transcriptions", cancel_token,
+                                    files={"file": (os.path.basename(audio_file), f, "audio/wav")},
+                                    data={"model": "whisper-1", "language": "it"})
+        finally:
+            try:
+                os.remove(audio_file)
+            except OSError as e:
+                logger.warning(f"Could not remove temp file {audio_file}: {e}")
+        text = result.get("text", "").strip()
+        logger.info(f"Raw transcription: {text}")
+        return text
+
+    def reload_dictionary(self) -> list[str]:
+        return []  # The personal dictionary is read by the server
+
+
+class RemoteLLMService(_RemoteClient):
+    """LLMService interface backed by POST /v1/rewrite."""
+
+    def __init__(self, base_url: str):
+        super().__init__(base_url)
+        info = self.client.get("/v1/info").raise_for_status().json()
+        self.provider = info.get("provider", "remote")
+        self.PROFILES = {name: None for name in info.get("profiles", [])}
+        logger.info(f"Using remote rewrite at {base_url} ({self.provider}, "
+                    f"profiles: {', '.join(self.PROFILES)})")
+
+    def reload_profiles(self) -> list[str]:
+        """Refresh the profile names (the server reloads profiles.json itself)."""
+        info = self.client.get("/v1/info").raise_for_status().json()
+        self.PROFILES = {name: None for name in info.get("profiles", [])}
+        return list(self.PROFILES)
+
+    def warm_up(self) -> None:
+        try:
+            self.client.get("/health").raise_for_status()
+        except Exception as e:
+            logger.warning(f"VibeFlow server not reachable: {e}")
+
+    def start_keep_alive(self) -> None:
+        pass  # The server keeps its own LLM connections warm
+
+    def rewrite_text(self, text: str, vibe: str, cancel_token=None, profile=None) -> str:
+        """Rewrite on the server, with its own profile settings (`profile` is ignored)."""
+        if not text:
+            return ""
+        try:
+            return self._post("/v1/rewrite", cancel_token, json={"text": text, "vibe": vibe})["text"]
+        except PipelineCancelled:
+            logger.info("Rewrite cancelled.")
+            raise
+        except Exception as e:
+            logger.error(f"Remote rewrite failed: {e}")
+            return text  # Same fallback as LLMService
+
+    def rewrite_with(self, text: str, vibe: str, provider_name: str | None = None) -> dict:
+        """LLMService.rewrite_with over the server: only its primary provider, latency
+        measured client-side and no token counts."""
+        result = {"provider": provider_name or self.provider, "vibe": vibe, "text": "", "seconds": None,
+                  "ttft": None, "prompt_tokens": None, "completion_tokens": None, "cached_tokens": None,
+                  "error": None}
+        start = time.perf_counter()
+        try:
+            if result["provider"] != self.provider:
+                raise ValueError(f"the VibeFlow server only uses {self.provider}")
+            result["text"] = self._post("/v1/rewrite", json={"text": text, "vibe": vibe})["text"]
+        except Exception as e:
+            result["error"] = str(e)
+        result["seconds"] = time.perf_counter() - start
+        return result
@@ -0,0 +1,86 @@
+"""Streaming polyphase resampler (numpy only).
+
+Microphones often run natively at 44.1 or 48 kHz while VAD and Whisper want
+16 kHz. `Resampler` converts chunk by chunk as audio arrives, keeping the
+filter history between chunks, so the output is the same as resampling the
+whole recording at once.
+
+The rate ratio is reduced to up/down (48000 -> 16000 is 1/3, 44100 -> 16000 is
+160/441). The anti-aliasing filter is a Kaiser-windowed sinc, split into `up`
+phases of `taps` coefficients each; every output sample is one dot product
+between its phase and the `taps` input samples before it. A chunk is converted
+with a single gather and one row-wise multiply-sum, with no Python loop per
+sample.
+"""
+from math import gcd
+import numpy as np
+
+
+def design_filter(up: int, down: int, zero_crossings: int = 16, rolloff: float = 0.92,
+                  beta: float = 8.0) -> np.ndarray:
+    """Low-pass FIR at the upsampled rate, cutting at `rolloff` x the lower Nyquist.
+
+    `zero_crossings` sinc lobes on each side set the steepness; the gain is `up`
+    to make up for the zeros inserted when upsampling.
+    """
+    factor = max(up, down)
+    cutoff = rolloff / (2 * factor)  # Cycles per upsampled sample
+    half = zero_crossings * factor
+    n = np.arange(-half, half + 1)
+    h = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(len(n), beta)
+    return (up * h / h.sum()).astype(np.float32)
+
+
+class Resampler:
+    """Converts int16 mono chunks from `source_rate` to `target_rate`.
+
+    Call `process(chunk)` for every chunk in order, then `flush()` once at the
+    end for the last few samples still inside the filter. Output is int16.
+    """
+
+    def __init__(self, source_rate: int, target_rate: int = 16000, zero_crossings: int = 16):
+        self.source_rate = int(source_rate)
+        self.target_rate = int(target_rate)
+        common = gcd(self.source_rate, self.target_rate)
+        self.up = self.target_rate // common
+        self.down = self.source_rate // common
+        self.passthrough = self.up == self.down
+
+        h = design_filter(self.up, self.down, zero_crossings)
+        self.taps = -(-len(h) // self.up)  # Input samples per output sample
+        h = np.concatenate([h, np.zeros(self.taps * self.up - len(h), dtype=np.float32)])
+        # phases[p, j] multiplies the input sample j steps before the output's position
+        self.phases = np.ascontiguousarray(h.reshape(self.taps, self.up).T)
+        self.delay = (len(h) // 2) / self.up  # Filter latency, in input samples
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget the previous stream (call before a new recording)."""
+        self._history = np.zeros(self.taps - 1, dtype=np.float32)
+        # Position of the next output sample in 1/up input samples, from the
+        # first sample of the history
+        self._position = (self.taps - 1) * self.up
+
+    def process(self, chunk: np.ndarray) -> np.ndarray:
+        """Resample the next chunk (any length, int16 or float). Returns int16."""
+        chunk = np.asarray(chunk).reshape(-1)
+        if self.passthrough:
+            return chunk.astype(np.int16, copy=False)
+        buffer = np.concatenate([self._history, chunk.astype(np.float32)])
+        count = max(0, (len(buffer) * self.up - 1 - self._position) // self.down + 1)
+        positions = self._position + self.down * np.arange(count)
+        base, phase = np.divmod(positions, self.up)
+        # Row i: the `taps` input samples ending at base[i], newest first
+        window = buffer[base[:, None] - np.arange(self.taps)[None, :]]
+        out = np.einsum("ij,ij->i", self.phases[phase], window)
+
+        keep = len(buffer) - (self.taps - 1)
+        self._history = buffer[keep:]
+        self._position += self.down * count - keep * self.up
+        return np.clip(np.rint(out), -32768, 32767).astype(np.int16)
+
+    def flush(self) -> np.ndarray:
+        """The output still delayed by the filter at the end of the stream."""
+        if self.passthrough:
+            return np.zeros(0, dtype=np.int16)
+        return self.process(np.zeros(int(np.ceil(self.delay)), dtype=np.float32))
@@ -0,0 +1,136 @@
+"""Adaptive quality controller driven by a time-to-paste target (SLO).
+
+After every dictation the controller looks at the median time-to-paste of the
+last `window` dictations. Over the target, it moves one step down the ladder
+below; under `headroom` x target, one step back up. After a change it waits
+for a full window of dictations at the new level before deciding again, so
+one slow request does not make it oscillate.
+
+    0  profile settings as configured
+    1  beam search 2
+    2  greedy decoding (beam 1)
+    3  smaller Whisper model            (if smaller than the loaded one)
+    4  fastest LLM provider first       (with several providers)
+    5  no LLM: paste the transcript
+
+Each step keeps the ones before it. The controller only narrows settings, so
+a profile that is already faster than a step is left alone.
+"""
+import os
+import logging
+import threading
+from collections import deque
+from statistics import median
+from stt_service import DEFAULT_BEAM_SIZE
+
+logger = logging.getLogger("vibeflow")
+
+# Whisper sizes from fastest to slowest
+WHISPER_SIZES = ("tiny", "base", "small", "medium", "large-v1", "large-v2", "large-v3", "large")
+
+
+def _smaller_model(candidate: str, current: str) -> bool:
+    try:
+        return WHISPER_SIZES.index(candidate) < WHISPER_SIZES.index(current)
+    except ValueError:
+        return False
+
+
+class SLOController:
+    """Degrades STT/LLM settings while time-to-paste is over `target` seconds.
+
+    `adjust(profile)` returns the profile to use for a new dictation;
+    `record(seconds, stages)` feeds back how long a dictation took.
+    """
+
+    def __init__(self, target: float, stt_service, llm_service, window: int = 5, headroom: float = 0.6,
+                 stt_model: str = "small"):
+        self.target = target
+        self.stt_service = stt_service
+        self.llm_service = llm_service
+        self.window = window
+        self.headroom = headroom
+        self.stt_model = stt_model
+        self.level = 0
+        self._samples: deque[tuple[float, dict]] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def _steps(self) -> list[str]:
+        """Available ladder steps, as names (index = level)."""
+        steps = ["configured settings", "beam 2", "beam 1"]
+        main_model = getattr(self.stt_service, "model_size", None)
+        if self.stt_model and main_model and _smaller_model(self.stt_model, main_model):
+            steps.append(f"Whisper {self.stt_model}")
+        if len(getattr(self.llm_service, "providers", ())) > 1:
+            steps.append("fastest provider")
+        steps.append("no LLM")
+        return steps
+
+    @property
+    def degraded_stt_model(self) -> str | None:
+        """Whisper size the ladder may switch to, to be loaded ahead of time (None if no such step)."""
+        return self.stt_model if f"Whisper {self.stt_model}" in self._steps() else None
+
+    def adjust(self, profile):
+        """`profile` with the current level's limits applied (the same object at level 0)."""
+        if profile is None or self.level == 0:
+            return profile
+        steps = self._steps()[1:self.level + 1]
+        changes = {}
+        beam = profile.beam_size or DEFAULT_BEAM_SIZE
+        if "beam 2" in steps:
+            changes["beam_size"] = min(beam, 2)
+        if "beam 1" in steps:
+            changes["beam_size"] = 1
+        if f"Whisper {self.stt_model}" in steps and not (
+                profile.stt_model and _smaller_model(profile.stt_model, self.stt_model)):
+            changes["stt_model"] = self.stt_model
+        if "fastest provider" in steps:
+            fastest = self.llm_service.fastest_provider()
+            if fastest:
+                changes["llm_provider"] = fastest
+        if "no LLM" in steps:
+            changes["skip_llm"] = True
+        return profile.replace(**changes)
+
+    def record(self, seconds: float, stages: dict[str, float] | None = None) -> None:
+        """Feed back one dictation's time-to-paste (and stage durations, for the log)."""
+        with self._lock:
+            self._samples.append((seconds, stages or {}))
+            if len(self._samples) < self.window:
+                return
+            observed = median(s for s, _ in self._samples)
+            steps = self._steps()
+            self.level = min(self.level, len(steps) - 1)  # Steps can disappear on reload
+            if observed > self.target and self.level < len(steps) - 1:
+                new_level, why = self.level + 1, f"over the {self.target:.2f}s target"
+            elif observed < self.target * self.headroom and self.level > 0:
+                new_level, why = self.level - 1, f"under {self.headroom:.0%} of the {self.target:.2f}s target"
+            else:
+                logger.debug(f"SLO: time-to-paste p50 {observed:.2f}s (target {self.target:.2f}s), "
+                             f"staying at level {self.level} ({steps[self.level]})")
+                return
+            stages = [f"{stage} {median(s.get(stage, 0.0) for _, s in self._samples):.2f}s"
+                      for stage in ("transcribe", "rewrite") if any(stage in s for _, s in self._samples)]
+            breakdown = f" ({', '.join(stages)})" if stages else ""
+            logger.info(f"SLO: time-to-paste p50 {observed:.2f}s{breakdown} {why}: "
+                        f"level {self.level} -> {new_level} ({steps[new_level]})")
+            self.level = new_level
+            # Judge the new level on its own dictations only
+            self._samples.clear()
+
+
+def slo_controller_from_env(stt_service, llm_service) -> SLOController | None:
+    """Controller configured by VIBEFLOW_SLO_* (None when VIBEFLOW_SLO_TARGET is 0)."""
+    target = float(os.getenv("VIBEFLOW_SLO_TARGET", "0"))
+    if target <= 0:
+        return None
+    controller = SLOController(
+        target, stt_service, llm_service,
+        window=max(1, int(os.getenv("VIBEFLOW_SLO_WINDOW", "5"))),
+        headroom=float(os.getenv("VIBEFLOW_SLO_HEADROOM", "0.6")),
+        stt_model=os.getenv("VIBEFLOW_SLO_STT_MODEL", "small").strip(),
+    )
+    logger.info(f"SLO controller: time-to-paste target {target:.2f}s "
+                f"(window {controller.window}, headroom {controller.headroom:.0%})")
+    return controller
@@ -0,0 +1,68 @@
+"""Startup helpers: a timeline of imports/initializations and background-loaded components."""
+import time
+import logging
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+logger = logging.getLogger("vibeflow")
+
+
+class StartupTimeline:
+    """Records when each import and component init started and ended, relative to
+    the creation of the timeline (i.e. process start)."""
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.events: list[tuple[str, float, float, str]] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def step(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            with self._lock:
+                self.events.append((name, start - self.origin, end - self.origin,
+                                    threading.current_thread().name))
+
+    def run(self, name: str, fn, *args, **kwargs):
+        """Call fn(*args, **kwargs) as a timeline step (handy with executor.submit)."""
+        with self.step(name):
+            return fn(*args, **kwargs)
+
+    def mark(self, name: str) -> None:
+        """Record a milestone (zero-length step)."""
+        now = time.perf_counter() - self.origin
+        with self._lock:
+            self.events.append((name, now, now, threading.current_thread().name))
+
+    def log(self) -> None:
+        with self._lock:
+            events = sorted(self.events, key=lambda e: e[1])
+        logger.info("Startup timeline:")
+        for name, start, end, thread in events:
+            logger.info(f"  {start:6.2f}s -> {end:6.2f}s  ({end - start:5.2f}s)  {name}  [{thread}]")
+
+
+class Deferred:
+    """Stand-in for a component that is still being initialized in the background.
+
+    Attribute access blocks until the component is ready, so callers can use it
+    as if it were the real object (and re-raises the init error if it failed).
+    """
+
+    def __init__(self, future: Future, name: str):
+        self._future = future
+        self._name = name
+
+    def _resolve(self):
+        if not self._future.done():
+            logger.info(f"Waiting for {self._name} to finish loading...")
+        return self._future.result()
+
+    def __getattr__(self, attr):
+        # Only called for attributes Deferred itself does not have
+        return getattr(self._resolve(), attr)
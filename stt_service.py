@@ -1,48 +1,79 @@
-from faster_whisper import WhisperModel
 import os
+import time
 import logging
+import threading
 from cuda_utils import add_nvidia_dll_paths
-
-add_nvidia_dll_paths()
+from cancellation import PipelineCancelled
+from metrics import span, observe
 
 logger = logging.getLogger("vibeflow")
 
+# Beam search width when the profile does not set one
+DEFAULT_BEAM_SIZE = 5
+
+
+def read_dictionary(path: str) -> list[str]:
+    """Words of a personal dictionary file: one per line, '#' starts a comment."""
+    words = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            # Skip empty lines and comments
+            if line and not line.startswith('#'):
+                words.append(line)
+    return words
+
 
 class STTService:
-    def __init__(self, model_size="medium", device="cuda", compute_type="float16"):
+    def __init__(self, model_size="medium", device="cuda", compute_type="float16", num_workers=1):
         logger.info(f"Loading Whisper model '{model_size}' on {device}...")
-        try:
-            # medium: best balance between speed and accuracy for Italian
-            self.model = WhisperModel(model_size, device=device, compute_type=compute_type)
-        except Exception as e:
-            logger.warning(f"Failed to load {model_size} on {device}: {e}. Trying 'small'...")
+        self.model_size = model_size
+        self.device = device
+        self.compute_type = compute_type
+        self.num_workers = num_workers
+        start = time.perf_counter()
+        with span("import_faster_whisper"):
+            # Deferred import: faster_whisper pulls in ctranslate2, av and tokenizers
+            add_nvidia_dll_paths()
+            from faster_whisper import WhisperModel
+        with span("stt_model_load"):
             try:
-                self.model = WhisperModel("small", device=device, compute_type=compute_type)
-            except Exception:
-                logger.warning("Falling back to 'base' on CPU...")
-                self.model = WhisperModel("base", device="cpu", compute_type="int8")
-        logger.info("Whisper model loaded.")
+                # medium: best balance between speed and accuracy for Italian
+                # num_workers > 1 lets several transcribe() calls run in parallel (server mode)
+                self.model = WhisperModel(model_size, device=device, compute_type=compute_type,
+                                          num_workers=num_workers)
+            except Exception as e:
+                logger.warning(f"Failed to load {model_size} on {device}: {e}. Trying 'small'...")
+                try:
+                    self.model = WhisperModel("small", device=device, compute_type=compute_type,
+                                              num_workers=num_workers)
+                    self.model_size = "small"
+                except Exception:
+                    logger.warning("Falling back to 'base' on CPU...")
+                    self.model = WhisperModel("base", device="cpu", compute_type="int8",
+                                              num_workers=num_workers)
+                    self.model_size = "base"
+                    # Models loaded later (load_model) use what actually worked
+                    self.device, self.compute_type = "cpu", "int8"
+        logger.info(f"Whisper model loaded in {time.perf_counter() - start:.1f}s.")
+        # Keyed by the size that actually loaded (the default of transcribe()); other
+        # sizes requested by profiles are loaded on first use (see load_model)
+        self._models = {self.model_size: self.model}
+        self._models_lock = threading.Lock()
 
         # Load personal dictionary from file
-        self.personal_dictionary = self._load_personal_dictionary()
+        self.dictionary_path = os.getenv("PERSONAL_DICT_PATH", "personal_dictionary.txt")
+        self.apply_dictionary(self._load_personal_dictionary())
         logger.info(f"Loaded {len(self.personal_dictionary)} custom words from personal dictionary")
 
     def _load_personal_dictionary(self):
         """Load custom words from personal_dictionary.txt"""
-        dictionary_file = "personal_dictionary.txt"
-        words = []
-
         try:
-            with open(dictionary_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
-                    # Skip empty lines and comments
-                    if line and not line.startswith('#'):
-                        words.append(line)
+            return read_dictionary(self.dictionary_path)
         except FileNotFoundError:
-            logger.warning(f"{dictionary_file} not found. Using built-in fallback dictionary.")
+            logger.warning(f"{self.dictionary_path} not found. Using built-in fallback dictionary.")
             # Default words
-            words = [
+            return [
                 "WebService",
                 "Netesa",
                 "installare",
@@ -50,53 +81,113 @@ class STTService:
                 "VibeFlow"
             ]
 
-        return words
-
-    def transcribe(self, audio_file: str) -> str:
-        if not audio_file or not os.path.exists(audio_file):
-            return ""
-
-        logger.info("Transcribing with optimized parameters (Wispr Flow-inspired)...")
+    def prepare_dictionary(self) -> list[str]:
+        """Read the dictionary file for apply_dictionary (raises if unreadable)."""
+        return read_dictionary(self.dictionary_path)
 
-        # Build initial prompt with personal dictionary and context
-        initial_prompt = (
+    def apply_dictionary(self, words: list[str]) -> None:
+        """Swap in a new word list; the model stays loaded."""
+        # Build initial prompt with personal dictionary and context (one reference
+        # swap, so a transcription never sees half of an update)
+        self.initial_prompt = (
             "Trascrizione accurata in italiano. "
             "Pronuncia chiara e naturale. "
-            f"Dizionario personalizzato: {', '.join(self.personal_dictionary)}. "
+            f"Dizionario personalizzato: {', '.join(words)}. "
             "Termini comuni: email, meeting, progetto, team, deadline, task."
         )
+        self.personal_dictionary = words
 
-        # Optimized parameters inspired by Wispr Flow and Whisper best practices
-        segments, info = self.model.transcribe(
-            audio_file,
-            language="it",
-            beam_size=5,              # Beam search for better accuracy
-            best_of=5,                # Sample multiple candidates
-            temperature=0.0,          # Deterministic (0.0) for consistency
-            compression_ratio_threshold=2.4,
-            log_prob_threshold=-0.7,  # Less aggressive filtering
-            no_speech_threshold=0.4,  # Lower to catch more speech
-            condition_on_previous_text=True,  # Use context
-            vad_filter=True,          # VAD to remove silent parts
-            vad_parameters=dict(
-                threshold=0.4,
-                min_speech_duration_ms=100,
-                min_silence_duration_ms=500
-            ),
-            word_timestamps=False,    # Faster without word-level timestamps
-            initial_prompt=initial_prompt,
-            hallucination_silence_threshold=1.0  # Prevent hallucinations
-        )
+    def reload_dictionary(self) -> list[str]:
+        self.apply_dictionary(self.prepare_dictionary())
+        return self.personal_dictionary
 
-        # Combine segments
-        text = " ".join([segment.text.strip() for segment in segments])
-        logger.info(f"Raw transcription: {text}")
+    def load_model(self, model_size: str):
+        """The Whisper model of `model_size`, loaded on the first call and kept
+        (same device and compute type as the main model)."""
+        model = self._models.get(model_size)
+        if model is not None:
+            return model
+        with self._models_lock:
+            if model_size not in self._models:
+                from faster_whisper import WhisperModel
+                start = time.perf_counter()
+                with span("stt_model_load"):
+                    self._models[model_size] = WhisperModel(model_size, device=self.device,
+                                                            compute_type=self.compute_type,
+                                                            num_workers=self.num_workers)
+                logger.info(f"Whisper model '{model_size}' loaded in {time.perf_counter() - start:.1f}s.")
+            return self._models[model_size]
+
+    def transcribe(self, audio_file: str, cancel_token=None, beam_size: int | None = None,
+                   model: str | None = None) -> str:
+        """Transcribe `audio_file` and delete it.
+
+        `beam_size` and `model` (a Whisper size such as "small") override the
+        defaults for this call, e.g. from the dictation's profile. If
+        `cancel_token` is cancelled, decoding stops at the next segment boundary
+        and PipelineCancelled is raised.
+        """
+        if not audio_file or not os.path.exists(audio_file):
+            return ""
 
-        # Clean up temp file
+        beam_size = beam_size or DEFAULT_BEAM_SIZE
+        model_size = model or self.model_size
         try:
-            os.remove(audio_file)
-            logger.debug(f"Temp file removed: {audio_file}")
+            whisper = self.load_model(model_size)
         except Exception as e:
-            logger.warning(f"Could not remove temp file {audio_file}: {e}")
+            logger.warning(f"Could not load Whisper model '{model_size}': {e}. Using '{self.model_size}'")
+            whisper, model_size = self.model, self.model_size
+        logger.info(f"Transcribing with optimized parameters (Wispr Flow-inspired, "
+                    f"{model_size}, beam {beam_size})...")
+
+        start = time.perf_counter()
 
+        parts = []
+        try:
+            # Optimized parameters inspired by Wispr Flow and Whisper best practices
+            segments, info = whisper.transcribe(
+                audio_file,
+                language="it",
+                beam_size=beam_size,      # Beam search for better accuracy
+                best_of=beam_size,        # Sample multiple candidates
+                temperature=0.0,          # Deterministic (0.0) for consistency
+                compression_ratio_threshold=2.4,
+                log_prob_threshold=-0.7,  # Less aggressive filtering
+                no_speech_threshold=0.4,  # Lower to catch more speech
+                condition_on_previous_text=True,  # Use context
+                vad_filter=True,          # VAD to remove silent parts
+                vad_parameters=dict(
+                    threshold=0.4,
+                    min_speech_duration_ms=100,
+                    min_silence_duration_ms=500
+                ),
+                word_timestamps=False,    # Faster without word-level timestamps
+                initial_prompt=self.initial_prompt,
+                hallucination_silence_threshold=1.0  # Prevent hallucinations
+            )
+
+            # Combine segments. `segments` is a lazy generator: each iteration decodes
+            # the next segment, so checking the token here stops the decode itself.
+            for segment in segments:
+                if cancel_token and cancel_token.cancelled:
+                    segments.close()
+                    logger.info("Transcription cancelled.")
+                    raise PipelineCancelled()
+                parts.append(segment.text.strip())
+        finally:
+            # Clean up temp file, also when decoding fails
+            try:
+                os.remove(audio_file)
+                logger.debug(f"Temp file removed: {audio_file}")
+            except Exception as e:
+                logger.warning(f"Could not remove temp file {audio_file}: {e}")
+
+        elapsed = time.perf_counter() - start
+        if info.duration > 0:
+            rtf = elapsed / info.duration
+            observe("stt_real_time_factor", rtf, model=model_size)
+            logger.info(f"Transcribed {info.duration:.1f}s of audio in {elapsed:.2f}s (RTF {rtf:.2f})")
+
+        text = " ".join(parts)
+        logger.info(f"Raw transcription: {text}")
         return text.strip()
@@ -0,0 +1,101 @@
+import re
+
+# Sentence end: ., !, ? or … followed by whitespace
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+_NUMBERED_ITEM = re.compile(r"^(\d+)\.(\s+)")
+# Lines that must stay on their own: list items, headings, quotes
+_BLOCK_LINE = re.compile(r"^\s*(?:\d+\.|[-*+]|#+|>)\s")
+
+
+class TextChunk:
+    """A slice of a long transcript plus the trailing context of the previous slice."""
+
+    def __init__(self, index: int, text: str, context: str = "", starts_paragraph: bool = True):
+        self.index = index
+        self.text = text
+        self.context = context  # Overlap shown to the LLM, never rewritten
+        self.starts_paragraph = starts_paragraph  # False if it continues the previous paragraph
+
+
+def _split_sentences(paragraph: str) -> list[str]:
+    return [s for s in _SENTENCE_END.split(paragraph.strip()) if s]
+
+
+def split_text(text: str, max_chars: int = 800, overlap_sentences: int = 1) -> list[TextChunk]:
+    """Split `text` into chunks of at most ~`max_chars` characters.
+
+    Paragraph boundaries are preferred; paragraphs that are too long are split
+    at sentence boundaries (a single over-long sentence is kept whole). Each
+    chunk carries the last `overlap_sentences` sentences of the previous one as
+    read-only context, so the model keeps pronouns and topic continuity.
+    """
+    units: list[tuple[str, bool]] = []  # (sentence, starts_new_paragraph)
+    for paragraph in re.split(r"\n\s*\n", text.strip()):
+        for i, sentence in enumerate(_split_sentences(paragraph)):
+            units.append((sentence, i == 0))
+
+    chunks: list[TextChunk] = []
+    current: list[tuple[str, bool]] = []
+    size = 0
+    for sentence, new_paragraph in units:
+        # Break when the chunk is full, or at a paragraph boundary once it is
+        # at least half full
+        if current and (size + len(sentence) > max_chars
+                        or (new_paragraph and size >= max_chars // 2)):
+            chunks.append(current)
+            current, size = [], 0
+        current.append((sentence, new_paragraph))
+        size += len(sentence) + 1
+    if current:
+        chunks.append(current)
+
+    result = []
+    previous: list[str] = []
+    for index, chunk in enumerate(chunks):
+        body = ""
+        for sentence, new_paragraph in chunk:
+            if body:
+                body += "\n\n" if new_paragraph else " "
+            body += sentence
+        context = " ".join(previous[-overlap_sentences:]) if overlap_sentences > 0 else ""
+        result.append(TextChunk(index, body, context, starts_paragraph=chunk[0][1]))
+        previous = [sentence for sentence, _ in chunk]
+    return result
+
+
+def reassemble(outputs: list[str], chunks: list[TextChunk] | None = None) -> str:
+    """Join rewritten chunks in order, keeping paragraphs and list numbering consistent.
+
+    A chunk that started mid-paragraph in the transcript is glued to the previous
+    one with a space (unless either side of the boundary is a list item or
+    heading); otherwise chunks are separated by a blank line. A numbered
+    Markdown list that continues across a chunk boundary (only blank lines in
+    between) is renumbered so it does not restart from 1.
+    """
+    joined = ""
+    for i, output in enumerate(outputs):
+        output = (output or "").strip()
+        if not output:
+            continue
+        if joined:
+            continues = chunks is not None and not chunks[i].starts_paragraph
+            last_line = joined.rsplit("\n", 1)[-1]
+            first_line = output.split("\n", 1)[0]
+            if continues and not _BLOCK_LINE.match(last_line) and not _BLOCK_LINE.match(first_line):
+                joined += " "
+            else:
+                joined += "\n\n"
+        joined += output
+    lines = joined.split("\n")
+    expected = None  # Next number of the list currently open, if any
+    for i, line in enumerate(lines):
+        if not line.strip():
+            continue
+        match = _NUMBERED_ITEM.match(line)
+        if not match:
+            expected = None
+            continue
+        if expected is not None and int(match.group(1)) != expected:
+            lines[i] = f"{expected}.{match.group(2)}{line[match.end():]}"
+        expected = (expected if expected is not None else int(match.group(1))) + 1
+    return "\n".join(lines)
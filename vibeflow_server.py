@@ -0,0 +1,213 @@
+"""Shared VibeFlow server: one Whisper model and one LLMService for the whole office.
+
+Endpoints (OpenAI-compatible where one exists):
+
+    POST /v1/audio/transcriptions   multipart/form-data with `file` (like OpenAI's API)
+                                    -> {"text": "..."}  (response_format=text: plain text)
+    POST /v1/rewrite                {"text": "...", "vibe": "formal"} -> {"text": "...", "vibe": "..."}
+    GET  /v1/info                   primary LLM provider and available profiles
+    GET  /health
+    GET  /metrics, /metrics.json    request latency, queue wait and depth, requests in flight
+
+Up to `--concurrency` requests per endpoint run at once (Whisper with one
+CTranslate2 worker per slot, the LLM with one request per slot, which LM Studio
+/ llama.cpp batch on their side); further ones wait for the first free slot.
+Neither faster-whisper's transcribe() nor the chat API take a batch of inputs,
+so there is no batching window: a request starts as soon as a slot is free and
+never waits for a slower neighbour.
+
+    python vibeflow_server.py --host 0.0.0.0 --port 8765 --concurrency 4
+
+Clients set VIBEFLOW_SERVER_URL=http://<host>:8765 (see remote_services.py).
+"""
+import os
+import json
+import time
+import logging
+import argparse
+import tempfile
+import threading
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from dotenv import load_dotenv
+from log_setup import setup_logging
+from metrics import metrics, observe
+
+load_dotenv()
+logger = setup_logging("vibeflow_server.log")
+
+
+class ConcurrencyLimiter:
+    """Runs `handler(item)` on the caller's thread, at most `max_concurrent` at a time.
+
+    `submit()` blocks while all slots are taken, then until its result is ready.
+    """
+
+    def __init__(self, name: str, handler, max_concurrent: int = 4):
+        self.name = name
+        self.handler = handler
+        self.max_concurrent = max_concurrent
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._running = 0
+
+    def submit(self, item):
+        start = time.perf_counter()
+        with self._lock:
+            waiting = self._waiting
+            self._waiting += 1
+        observe("server_queue_depth", waiting, endpoint=self.name)
+        self._slots.acquire()
+        with self._lock:
+            self._waiting -= 1
+            self._running += 1
+            running = self._running
+        observe("server_queue_seconds", time.perf_counter() - start, endpoint=self.name)
+        observe("server_in_flight", running, endpoint=self.name)
+        try:
+            return self.handler(item)
+        finally:
+            with self._lock:
+                self._running -= 1
+            self._slots.release()
+            observe("server_request_seconds", time.perf_counter() - start, endpoint=self.name)
+
+
+def parse_multipart(content_type: str, body: bytes) -> dict:
+    """{field: (filename | None, bytes)} from a multipart/form-data body."""
+    message = BytesParser(policy=HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode("latin-1") + body)
+    fields = {}
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        if name:
+            fields[name] = (part.get_filename(), part.get_payload(decode=True) or b"")
+    return fields
+
+
+class VibeFlowServer:
+    def __init__(self, host: str, port: int, concurrency: int,
+                 model_size: str, device: str, compute_type: str):
+        # Let LLMService run one rewrite per slot
+        os.environ.setdefault("LLM_PARALLEL_REQUESTS", str(concurrency))
+        from stt_service import STTService
+        from llm_service import LLMService
+
+        self.stt_service = STTService(model_size=model_size, device=device, compute_type=compute_type,
+                                      num_workers=concurrency)
+        self.llm_service = LLMService()
+        threading.Thread(target=self.llm_service.warm_up, name="llm-warmup", daemon=True).start()
+        self.llm_service.start_keep_alive()
+
+        self.stt_limiter = ConcurrencyLimiter("transcriptions", self.stt_service.transcribe, concurrency)
+        self.llm_limiter = ConcurrencyLimiter("rewrite", lambda req: self.llm_service.rewrite_text(*req),
+                                              concurrency)
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+
+    def transcribe(self, filename: str | None, audio: bytes) -> str:
+        suffix = os.path.splitext(filename or "")[1] or ".wav"
+        tmp_fd, temp_file = tempfile.mkstemp(suffix=suffix, prefix="vibeflow_srv_")
+        with os.fdopen(tmp_fd, "wb") as f:
+            f.write(audio)
+        return self.stt_limiter.submit(temp_file)  # STTService deletes the file
+
+    def rewrite(self, text: str, vibe: str) -> str:
+        return self.llm_limiter.submit((text, vibe))
+
+    def info(self) -> dict:
+        return {"provider": self.llm_service.provider, "profiles": list(self.llm_service.PROFILES)}
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body: bytes, content_type: str) -> None:
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_json(self, payload: dict, status: int = 200) -> None:
+                self._send(status, json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json")
+
+            def do_GET(self):
+                if self.path == "/health":
+                    self._send_json({"status": "ok"})
+                elif self.path == "/v1/info":
+                    self._send_json(server.info())
+                elif self.path == "/metrics":
+                    self._send(200, metrics.to_prometheus().encode("utf-8"), "text/plain; version=0.0.4")
+                elif self.path == "/metrics.json":
+                    self._send_json(metrics.snapshot())
+                else:
+                    self._send_json({"error": {"message": "not found"}}, 404)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                try:
+                    if self.path == "/v1/audio/transcriptions":
+                        fields = parse_multipart(self.headers.get("Content-Type", ""), body)
+                        if "file" not in fields:
+                            self._send_json({"error": {"message": "missing 'file'"}}, 400)
+                            return
+                        text = server.transcribe(*fields["file"])
+                        response_format = (fields.get("response_format") or (None, b"json"))[1].decode()
+                        if response_format == "text":
+                            self._send(200, text.encode("utf-8"), "text/plain; charset=utf-8")
+                        else:
+                            self._send_json({"text": text})
+                    elif self.path == "/v1/rewrite":
+                        try:
+                            request = json.loads(body or b"{}")
+                        except ValueError as e:
+                            self._send_json({"error": {"message": f"invalid JSON: {e}"}}, 400)
+                            return
+                        if not isinstance(request, dict) or not isinstance(request.get("text", ""), str):
+                            self._send_json({"error": {"message": "expected an object with a string 'text'"}}, 400)
+                            return
+                        vibe = request.get("vibe") or server.llm_service.default_profile
+                        self._send_json({"text": server.rewrite(request.get("text", ""), vibe), "vibe": vibe})
+                    else:
+                        self._send_json({"error": {"message": "not found"}}, 404)
+                except Exception as e:
+                    logger.error(f"{self.path} failed: {e}", exc_info=True)
+                    self._send_json({"error": {"message": str(e)}}, 500)
+
+        return Handler
+
+    def serve_forever(self) -> None:
+        host, port = self._httpd.server_address[:2]
+        logger.info(f"VibeFlow server listening on http://{host}:{port}")
+        try:
+            self._httpd.serve_forever()
+        finally:
+            self._httpd.server_close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Shared VibeFlow transcription/rewrite server")
+    parser.add_argument("--host", default=os.getenv("VIBEFLOW_SERVER_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("VIBEFLOW_SERVER_PORT", "8765")))
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("VIBEFLOW_SERVER_CONCURRENCY", "4")),
+                        help="Requests per endpoint processed at the same time")
+    parser.add_argument("--model", default="medium", help="Whisper model size")
+    parser.add_argument("--device", default="cuda")
+    parser.add_argument("--compute-type", default=None, help="Default: float16 on cuda, int8 on cpu")
+    args = parser.parse_args()
+
+    compute_type = args.compute_type or ("float16" if args.device == "cuda" else "int8")
+    VibeFlowServer(args.host, args.port, max(1, args.concurrency),
+                   args.model, args.device, compute_type).serve_forever()
+
+
+if __name__ == "__main__":
+    main()